@@ -0,0 +1,56 @@
+from camera.batch_runner import BatchRunner
+from camera.camera_options import add_camera_arguments, camera_options_from_args
+import argparse
+import sys
+
+## Processes several datasets with the models loaded once, e.g.
+##   python batch_main.py --data "PVD*" SYN01 --workers 4 --output-dir batch_output
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process a batch of datasets')
+    parser.add_argument(
+        '--data',
+        metavar='data',
+        nargs='+',
+        required=True,
+        help='Dataset codenames or glob patterns')
+    parser.add_argument(
+        '--data-dir',
+        metavar='data_dir',
+        default='data_',
+        help='Directory containing the datasets')
+    parser.add_argument(
+        '--output-dir',
+        metavar='output_dir',
+        default='batch_output',
+        help='Per-dataset outputs are written to <output_dir>/<codename>/')
+    parser.add_argument(
+        '--workers',
+        metavar='workers',
+        type=int,
+        default=None,
+        help='Number of forked worker processes (default: number of CPUs)')
+    parser.add_argument(
+        '--engine',
+        metavar='engine',
+        default='numpy',
+        choices=['tensorflow', 'numpy'],
+        help='Inference engine of the vehicle classifier (tensorflow needs --workers 1)')
+    parser.add_argument(
+        '--beam-width',
+        metavar='beam_width',
+        type=int,
+        default=None,
+        help='Hard-routing beam width of the numpy engine')
+    ## The outputs of each dataset are set by the batch runner
+    add_camera_arguments(parser, exclude=('output_options',))
+    args = parser.parse_args()
+
+    batch_runner = BatchRunner(data_dir=args.data_dir,
+                               output_dir=args.output_dir,
+                               num_workers=args.workers,
+                               classifier_engine=args.engine,
+                               classifier_beam_width=args.beam_width,
+                               camera_options=camera_options_from_args(args, exclude=('output_options',)))
+    results = batch_runner.run(args.data)
+    if any(error is not None for _, _, _, error in results):
+        sys.exit(1)
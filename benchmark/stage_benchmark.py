@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+import cv2 as cv
+import numpy as np
+from data_io.io_util import IOUtil
+from data_io.frame_sequence_reader import FrameSequenceReader
+from data_io.synthetic_traffic import SyntheticTraffic
+from vehicle.vehicle_detector import VehicleDetector
+from vehicle.vehicle_classifier import VehicleClassifier
+from vehicle.vehicle_tracker import VehicleTracker
+from vehicle.SSD_Mobilenet.vehicle_SSD_handler import VehicleOcclusionHandler
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+
+class StageBenchmark(object):
+    '''
+    Times every processing stage on its own, then the whole frame loop, over the same inputs.
+    Every stage call is timed separately; peak memory is measured in an extra tracemalloc pass
+    so that tracing does not distort the timings.
+    '''
+    def __init__(self, repeats=3, classifier_engine="numpy"):
+        self.repeats = repeats
+        self.classifier_engine = classifier_engine
+        self.results = list()
+        self.skipped = list()
+
+        self.vehicle_detector = VehicleDetector()
+        self.vehicle_classifier = VehicleClassifier(max_tree_depth = 7,
+                                                    n_features = 10,
+                                                    n_classes = 4,
+                                                    inference_engine = self.classifier_engine)
+        self.vehicle_classifier.warm_up()
+        try:
+            self.vehicle_occlusion_handler = VehicleOcclusionHandler()
+            self.vehicle_occlusion_handler.warm_up()
+        except cv.error as e:
+            self.vehicle_occlusion_handler = None
+            self.skip("occlusion handler", "SSD-MobileNet graph could not be loaded: {}".format(e))
+
+    def skip(self, stage, reason):
+        self.skipped.append({'stage' : stage, 'reason' : reason})
+        IOUtil.print_warning_messages("Skipping {}: {}".format(stage, reason))
+
+    #################################################
+    ## Measurement
+    #################################################
+    def measure(self, stage, density, run_pass):
+        '''
+        :param run_pass: callable running one pass over the inputs, returns the list of call latencies (s)
+        '''
+        latencies = list()
+        for repeat in range(self.repeats):
+            latencies += run_pass()
+
+        tracemalloc.start()
+        run_pass()
+        peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        if len(latencies) == 0:
+            self.skip(stage, "no input for density {}".format(density))
+            return
+
+        latencies_ms = 1000.0 * np.array(latencies)
+        result = {
+            'stage' : stage,
+            'density' : density,
+            'n_calls' : len(latencies),
+            'mean_ms' : float(latencies_ms.mean()),
+            'p50_ms' : float(np.percentile(latencies_ms, 50)),
+            'p90_ms' : float(np.percentile(latencies_ms, 90)),
+            'p99_ms' : float(np.percentile(latencies_ms, 99)),
+            'max_ms' : float(latencies_ms.max()),
+            'throughput_per_s' : float(len(latencies) / max(latencies_ms.sum() / 1000.0, 1e-9)),
+            'peak_traced_bytes' : int(peak_traced_bytes)
+        }
+        self.results.append(result)
+        IOUtil.print_warning_messages("     |--- {stage:<20} {density:<10} p50 {p50_ms:8.3f} ms   p99 {p99_ms:8.3f} ms   "
+                                      "{throughput_per_s:10.1f} /s".format(**result))
+
+    @staticmethod
+    def timed_call(latencies, function, *args):
+        call_start = time.perf_counter()
+        output = function(*args)
+        latencies.append(time.perf_counter() - call_start)
+        return output
+
+    #################################################
+    ## Stages
+    #################################################
+    def detect(self, frames):
+        return [self.vehicle_detector.detect_vehicle_candidate(foreground, background, input_image)
+                for input_image, background, foreground in frames]
+
+    def run_stages(self, density, frames):
+        def detection_pass():
+            latencies = list()
+            for input_image, background, foreground in frames:
+                self.timed_call(latencies, self.vehicle_detector.detect_vehicle_candidate,
+                                foreground, background, input_image)
+            return latencies
+        self.measure("detection", density, detection_pass)
+
+        def occlusion_detection_pass():
+            latencies = list()
+            for candidates in self.detect(frames):
+                self.timed_call(latencies, self.vehicle_classifier.detect_occlusion, candidates)
+            return latencies
+        self.measure("detect_occlusion", density, occlusion_detection_pass)
+
+        def classification_pass():
+            latencies = list()
+            for candidates in self.detect(frames):
+                vehicles, blobs = self.vehicle_classifier.detect_occlusion(candidates)
+                if len(vehicles) != 0:
+                    self.timed_call(latencies, self.vehicle_classifier.classifiy_vehicles, vehicles)
+            return latencies
+        self.measure("classification", density, classification_pass)
+
+        if self.vehicle_occlusion_handler is not None:
+            def occlusion_handling_pass():
+                latencies = list()
+                for (input_image, background, foreground), candidates in zip(frames, self.detect(frames)):
+                    vehicles, blobs = self.vehicle_classifier.detect_occlusion(candidates)
+                    if len(blobs) != 0:
+                        self.timed_call(latencies, self.vehicle_occlusion_handler.handle_occlusion_blob,
+                                        blobs, input_image, foreground)
+                return latencies
+            self.measure("occlusion_handling", density, occlusion_handling_pass)
+
+        def tracking_pass():
+            frame_candidates = list()
+            for candidates in self.detect(frames):
+                vehicles, blobs = self.vehicle_classifier.detect_occlusion(candidates)
+                if len(vehicles) != 0:
+                    self.vehicle_classifier.classifiy_vehicles(vehicles)
+                for vehicle in vehicles:
+                    vehicle.zone_index = 0
+                frame_candidates.append(vehicles)
+
+            vehicle_tracker = VehicleTracker()
+            tracked_vehicles = list()
+            latencies = list()
+            for candidates in frame_candidates:
+                candidates, tracked_vehicles = self.timed_call(latencies, vehicle_tracker.track_vehicles,
+                                                               candidates, tracked_vehicles)
+            return latencies
+        self.measure("tracking", density, tracking_pass)
+
+    def run_frame_loop(self, density, data_dir, dataset_name, max_frames=None):
+        ## The whole Camera frame loop: read, detect, classify, handle occlusions, track and draw,
+        ## over the first @max_frames frames so that it covers the same input as run_stages
+        if self.vehicle_occlusion_handler is None:
+            self.skip("frame_loop", "needs the occlusion handler")
+            return
+        from camera.camera import Camera
+        from camera.camera_options import TrackingOptions, OutputOptions
+
+        def frame_loop_pass():
+            camera = Camera(dataset_name,
+                            data_dir=data_dir,
+                            classifier_engine=self.classifier_engine,
+                            concurrent_startup=False,
+                            tracking_options=TrackingOptions(enabled=True),
+                            output_options=OutputOptions(headless=True, video=None),
+                            vehicle_classifier=self.vehicle_classifier,
+                            vehicle_occlusion_handler=self.vehicle_occlusion_handler,
+                            auto_run=False)
+            latencies = list()
+            frame_start = time.perf_counter()
+            for frame in camera.read_frames():
+                if max_frames is not None and frame.frame_index >= max_frames:
+                    break
+                camera.process_detection(frame)
+                camera.finish_frames(camera.classify_frames(frame))
+                latencies.append(time.perf_counter() - frame_start)
+                frame_start = time.perf_counter()
+            return latencies
+        self.measure("frame_loop", density, frame_loop_pass)
+
+    #################################################
+    ## Report
+    #################################################
+    def report(self):
+        max_rss_kb = None
+        if resource is not None:
+            max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            'created' : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'environment' : {
+                'python' : platform.python_version(),
+                'platform' : platform.platform(),
+                'opencv' : cv.__version__,
+                'numpy' : np.__version__,
+                'classifier_engine' : self.classifier_engine
+            },
+            'repeats' : self.repeats,
+            'results' : self.results,
+            'skipped' : self.skipped,
+            'max_rss_kb' : max_rss_kb
+        }
+
+
+## Times every stage on fixed inputs and writes the results to a JSON file:
+##   python -m benchmark.stage_benchmark --densities 5 20 50 --frames 100 --output benchmark.json
+##   python -m benchmark.stage_benchmark --dataset PVD01 --frames 300
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the processing stages')
+    parser.add_argument(
+        '--densities',
+        metavar='densities',
+        type=int,
+        nargs='+',
+        default=[5, 20, 50],
+        help='Vehicles per synthetic frame')
+    parser.add_argument(
+        '--frames',
+        metavar='frames',
+        type=int,
+        default=100,
+        help='Frames per input')
+    parser.add_argument(
+        '--repeats',
+        metavar='repeats',
+        type=int,
+        default=3,
+        help='Timed passes over each input')
+    parser.add_argument(
+        '--seed',
+        metavar='seed',
+        type=int,
+        default=0,
+        help='Seed of the synthetic traffic')
+    parser.add_argument(
+        '--dataset',
+        metavar='dataset',
+        nargs='*',
+        default=[],
+        help='Recorded dataset codenames to benchmark as well')
+    parser.add_argument(
+        '--data-dir',
+        metavar='data_dir',
+        default='data_',
+        help='Directory containing the recorded datasets')
+    parser.add_argument(
+        '--engine',
+        metavar='engine',
+        default='numpy',
+        choices=['tensorflow', 'numpy'],
+        help='Inference engine of the vehicle classifier')
+    parser.add_argument(
+        '--output',
+        metavar='output',
+        default='benchmark.json',
+        help='JSON report')
+    args = parser.parse_args()
+
+    benchmark = StageBenchmark(repeats=args.repeats, classifier_engine=args.engine)
+    work_dir = tempfile.mkdtemp(prefix="vehicle_benchmark_")
+    try:
+        for n_vehicles in args.densities:
+            density = "{}_vehicles".format(n_vehicles)
+            IOUtil.print_warning_messages("Synthetic traffic, {} vehicles per frame:".format(n_vehicles))
+            traffic = SyntheticTraffic(n_vehicles=n_vehicles, n_frames=args.frames, seed=args.seed)
+            benchmark.run_stages(density, [frame[:3] for frame in traffic.frames()])
+            ## same seed, same frames on disk for the frame loop
+            traffic = SyntheticTraffic(n_vehicles=n_vehicles, n_frames=args.frames, seed=args.seed)
+            traffic.write_dataset(os.path.join(work_dir, density))
+            benchmark.run_frame_loop(density, work_dir, density, max_frames=args.frames)
+
+        for dataset_name in args.dataset:
+            IOUtil.print_warning_messages("Recorded dataset {}:".format(dataset_name))
+            frame_reader = FrameSequenceReader(os.path.join(args.data_dir, dataset_name))
+            frames = list()
+            for frame_index, frame_name, input_image, background, foreground in frame_reader.read_frames():
+                if frame_index >= args.frames:
+                    break
+                frames.append((input_image, background, foreground))
+            benchmark.run_stages(dataset_name, frames)
+            benchmark.run_frame_loop(dataset_name, args.data_dir, dataset_name, max_frames=args.frames)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(benchmark.report(), f, indent=2)
+    IOUtil.print_warning_messages("Benchmark results written to " + args.output)
@@ -0,0 +1,155 @@
+import copy
+import fnmatch
+import multiprocessing
+import os
+import time
+import traceback
+from camera.camera import Camera
+from camera.camera_options import OutputOptions
+from data_io.io_util import IOUtil
+from vehicle.vehicle_classifier import VehicleClassifier
+from vehicle.SSD_Mobilenet.vehicle_SSD_handler import VehicleOcclusionHandler
+
+
+class BatchRunner(object):
+    '''
+    Processes many datasets with models loaded once:
+    the classifier and the SSD graph are loaded in the parent process, which then forks the
+    worker pool so that every worker shares their weights copy-on-write.
+    Each dataset writes its annotated video and counts into <output_dir>/<dataset codename>/,
+    as well as the metrics, statistics and checkpoint files named by @camera_options.
+    TensorFlow sessions do not survive a fork, so forked workers need the numpy classifier engine.
+    A dataset which fails is reported as such, the other datasets of the batch still run.
+    '''
+    ## Runner of the parent process, inherited by the forked workers
+    shared_runner_ = None
+    ## (camera keyword, attribute) of the option files written by each dataset
+    kDatasetFiles = [('metrics_options', 'jsonl'),
+                     ('metrics_options', 'prometheus'),
+                     ('statistics_options', 'csv'),
+                     ('statistics_options', 'sqlite'),
+                     ('checkpoint_options', 'path')]
+
+    def __init__(self, data_dir="data_", output_dir="batch_output", num_workers=None,
+                 classifier_engine="numpy", classifier_beam_width=None, camera_options=None):
+        self.data_dir = data_dir
+        self.output_dir = output_dir
+        self.num_workers = num_workers if num_workers is not None else multiprocessing.cpu_count()
+        self.classifier_engine = classifier_engine
+        self.classifier_beam_width = classifier_beam_width
+        self.camera_options = camera_options if camera_options is not None else dict()
+        self.vehicle_classifier = None
+        self.vehicle_occlusion_handler = None
+
+        if self.num_workers > 1 and self.classifier_engine == "tensorflow":
+            raise ValueError("The tensorflow classifier engine cannot be shared by forked workers, "
+                             "use the numpy engine or a single worker")
+
+    def resolve_datasets(self, patterns):
+        ## @patterns are codenames or glob patterns matched against the datasets of data_dir
+        available = sorted(name for name in os.listdir(self.data_dir)
+                           if os.path.isfile(os.path.join(self.data_dir, name, "config.txt")))
+        datasets = list()
+        for pattern in patterns:
+            matches = fnmatch.filter(available, pattern)
+            if len(matches) == 0:
+                raise IOError("No dataset matching {} in {}".format(pattern, self.data_dir))
+            datasets += [name for name in matches if name not in datasets]
+        return datasets
+
+    def load_models(self):
+        load_start = time.time()
+        self.vehicle_classifier = VehicleClassifier(max_tree_depth = 7,
+                                                    n_features = 10,
+                                                    n_classes = 4,
+                                                    inference_engine = self.classifier_engine,
+                                                    routing_beam_width = self.classifier_beam_width)
+        self.vehicle_classifier.warm_up()
+        self.vehicle_occlusion_handler = VehicleOcclusionHandler()
+        self.vehicle_occlusion_handler.warm_up()
+        IOUtil.print_warning_messages("Models loaded once in {:.1f} ms".format(1000.0 * (time.time() - load_start)))
+
+    def run(self, patterns):
+        '''
+        :return: list of (dataset codename, number of frames, processing time in seconds, error or None)
+        '''
+        datasets = self.resolve_datasets(patterns)
+        self.load_models()
+
+        batch_start = time.time()
+        if self.num_workers <= 1 or len(datasets) == 1:
+            results = [self.try_process_dataset(dataset_name) for dataset_name in datasets]
+        else:
+            BatchRunner.shared_runner_ = self
+            pool = multiprocessing.get_context("fork").Pool(processes=min(self.num_workers, len(datasets)))
+            try:
+                results = pool.map(BatchRunner.process_dataset_in_worker, datasets, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+                BatchRunner.shared_runner_ = None
+
+        self.print_report(results, time.time() - batch_start)
+        return results
+
+    @staticmethod
+    def process_dataset_in_worker(dataset_name):
+        return BatchRunner.shared_runner_.try_process_dataset(dataset_name)
+
+    def try_process_dataset(self, dataset_name):
+        ## Errors are returned instead of raised, so that a bad dataset does not abort the batch
+        process_start = time.time()
+        try:
+            return self.process_dataset(dataset_name) + (None,)
+        except Exception as e:
+            IOUtil.print_warning_messages("Dataset {} failed:\n{}".format(dataset_name, traceback.format_exc()))
+            return dataset_name, 0, time.time() - process_start, "{}: {}".format(type(e).__name__, e)
+
+    def process_dataset(self, dataset_name):
+        dataset_output_dir = os.path.join(self.output_dir, dataset_name)
+        if not os.path.isdir(dataset_output_dir):
+            os.makedirs(dataset_output_dir)
+
+        camera = Camera(dataset_name,
+                        classifier_engine=self.classifier_engine,
+                        classifier_beam_width=self.classifier_beam_width,
+                        concurrent_startup=False,
+                        vehicle_classifier=self.vehicle_classifier,
+                        vehicle_occlusion_handler=self.vehicle_occlusion_handler,
+                        auto_run=False,
+                        data_dir=self.data_dir,
+                        **self.dataset_camera_options(dataset_output_dir))
+        process_start = time.time()
+        nFrame = camera.run()
+        process_time = time.time() - process_start
+        camera.vehicle_counter_.save(os.path.join(dataset_output_dir, "counts.txt"))
+        return dataset_name, nFrame, process_time
+
+    def dataset_camera_options(self, dataset_output_dir):
+        ## Datasets must not share their files: each one is moved into the output directory of the dataset
+        camera_options = dict((keyword, copy.copy(options)) for keyword, options in self.camera_options.items())
+        for keyword, attribute in self.kDatasetFiles:
+            options = camera_options.get(keyword)
+            if options is not None and getattr(options, attribute) is not None:
+                file_name = os.path.basename(getattr(options, attribute))
+                setattr(options, attribute, os.path.join(dataset_output_dir, file_name))
+        camera_options['output_options'] = OutputOptions(headless=True,
+                                                         video=os.path.join(dataset_output_dir, "output.avi"))
+        return camera_options
+
+    def print_report(self, results, batch_time):
+        IOUtil.print_warning_messages("Batch throughput report:")
+        for dataset_name, nFrame, process_time, error in results:
+            if error is not None:
+                IOUtil.print_warning_messages("     |--- {:<12}: failed after {:.1f} s ({})".format(
+                    dataset_name, process_time, error))
+                continue
+            IOUtil.print_warning_messages("     |--- {:<12}: {:6d} frames in {:8.1f} s ({:6.1f} fps)".format(
+                dataset_name, nFrame, process_time, nFrame / max(process_time, 1e-9)))
+        total_frames = sum(nFrame for _, nFrame, _, _ in results)
+        IOUtil.print_warning_messages("     |--- total       : {:6d} frames in {:8.1f} s ({:6.1f} fps, {} workers)".format(
+            total_frames, batch_time, total_frames / max(batch_time, 1e-9), self.num_workers))
+        failed = [dataset_name for dataset_name, _, _, error in results if error is not None]
+        if len(failed) != 0:
+            IOUtil.print_warning_messages("     |--- failed      : {} of {} datasets ({})".format(
+                len(failed), len(results), ", ".join(failed)))
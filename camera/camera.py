@@ -1,26 +1,93 @@
 import cv2 as cv
-import os
+import numpy as np
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from data_io.data_loader import DataLoader
 from data_io.io_util import IOUtil
 from vehicle.vehicle_properties import Status,TravelingStatus
 from vehicle.vehicle_detector import VehicleDetector
 from vehicle.vehicle_classifier import VehicleClassifier
 from vehicle.SSD_Mobilenet.vehicle_SSD_handler import VehicleOcclusionHandler
+from vehicle.SSD_Mobilenet.occlusion_batch_scheduler import OcclusionBatchScheduler
 from vehicle.vehicle_tracker import VehicleTracker
 from vehicle.vehicle_counter import VehicleCounter
+from vehicle.contour_geometry import ContourGeometry
+from vehicle.vehicle import Vehicle
+from camera.frame_packet import FramePacket
+from camera.camera_pipeline import CameraPipeline
+from camera.zone_label_map import ZoneLabelMap
+from camera.degradation_scheduler import DegradationScheduler
+from camera.output_writer import OutputWriter
+from camera.session_checkpoint import SessionCheckpoint
+from camera.frame_metrics import FrameInstrumentation, JsonlMetricsSink, PrometheusMetricsSink
+from camera.camera_options import DetectionOptions, TrackingOptions, OcclusionOptions, DegradationOptions, \
+                                  ReaderOptions, OutputOptions, MetricsOptions, StatisticsOptions, CheckpointOptions
+from vehicle.crop_retention import CropRetention
+from vehicle.traffic_statistics import TrafficStatistics, CsvStatisticsSink, SqliteStatisticsSink
 
 class Camera(object):
-    def __init__(self, dataset_name):
-        self.data_dir = "data_"
+    def __init__(self, dataset_name, classifier_engine="tensorflow", classifier_beam_width=None,
+                 concurrent_startup=True, pipeline_queue_depths=None,
+                 detection_options=None, tracking_options=None, occlusion_options=None,
+                 degradation_options=None, reader_options=None, output_options=None,
+                 metrics_options=None, statistics_options=None, checkpoint_options=None,
+                 vehicle_classifier=None, vehicle_occlusion_handler=None, auto_run=True, data_dir="data_"):
+        self.data_dir = data_dir
         #self.dataset_name = "PVD01"
         self.dataset_name = dataset_name   
+        self.classifier_engine = classifier_engine
+        self.classifier_beam_width = classifier_beam_width
+        self.concurrent_startup = concurrent_startup
+        self.pipeline_queue_depths = pipeline_queue_depths   # None: process frames on the calling thread
+        ## Option groups (camera_options.py), the defaults are used for the groups not given
+        self.detection_options = detection_options or DetectionOptions()
+        self.tracking_options = tracking_options or TrackingOptions()
+        self.occlusion_options = occlusion_options or OcclusionOptions()
+        self.degradation_options = degradation_options or DegradationOptions()
+        self.reader_options = reader_options or ReaderOptions()
+        self.output_options = output_options or OutputOptions()
+        self.metrics_options = metrics_options or MetricsOptions()
+        self.statistics_options = statistics_options or StatisticsOptions()
+        self.checkpoint_options = checkpoint_options or CheckpointOptions()
+
+        self.occlusion_scheduler_ = None
+        self.pending_frames_ = deque()
+        self.nFrame_ = 0
+        self.output_writer_ = None
+        metrics_sinks = list()
+        if self.metrics_options.jsonl is not None:
+            metrics_sinks.append(JsonlMetricsSink(self.metrics_options.jsonl,
+                                                  append=self.checkpoint_options.resume))
+        if self.metrics_options.prometheus is not None:
+            metrics_sinks.append(PrometheusMetricsSink(self.metrics_options.prometheus,
+                                                       interval=self.metrics_options.interval))
+        self.instrumentation_ = FrameInstrumentation(metrics_sinks)
+        self.degradation_ = None
+        if self.degradation_options.frame_budget is not None:
+            self.degradation_ = DegradationScheduler(self.degradation_options.frame_budget,
+                                                     occlusion_interval=self.degradation_options.occlusion_defer_interval)
+        self.last_tracked_frame_index_ = None
+        self.checkpoint_ = None
+        if self.checkpoint_options.path is not None:
+            self.checkpoint_ = SessionCheckpoint(self.checkpoint_options.path, interval=self.checkpoint_options.interval)
+        self.start_frame_index_ = 0
+        self.crop_retention_ = CropRetention(self.tracking_options.crop_retention, scale=self.tracking_options.crop_scale)
+        self.startup_time_ = time.time()
+        self.startup_timings_ = dict()
+        self.model_loader_ = None
+        self.model_futures_ = None
+        self.startup_reported_ = False
         self.observation_zones = list()
+        self.zone_label_map_ = None
         self.cap_bg = None
         self.cap_fg = None
         self.cap_im = None
         self.vehicle_candidates_ = list()
         self.vehicles_ = list()
+        ## Models may be loaded once by the caller and shared between cameras
+        self.vehicle_classifier = vehicle_classifier
+        self.vehicle_occlusion_handler = vehicle_occlusion_handler
 
         ## Initialize input and output streams of camera
         # IOUtil.print_warning_messages("Initializing Camera Input-Output stream ... ")
@@ -28,28 +95,29 @@ class Camera(object):
 
         ## Initialize oz config from config files
         IOUtil.print_warning_messages("Initializing observation zones from config file ... ")
-        self.initialize_observation_zone()
+        self.timed_startup_step("observation zones", self.initialize_observation_zone)
 
         ## Initialize vehicle detector
         IOUtil.print_warning_messages("Initializing vehicle detector ... ")
-        self.initialize_vehicle_detector()
+        self.timed_startup_step("vehicle detector", self.initialize_vehicle_detector)
 
-        ## Initialize vehicle classifier
+        ## Initialize vehicle classifier and vehicle occlusion handler
+        ## (loaded in background threads while the first frames are decoded)
         IOUtil.print_warning_messages("Initializing vehicle classifier ... \n")
-        self.initialize_vehicle_classifier()
-
-        # Initialize vehicle occlusion handler
-        self.initialize_vehile_occlusion_handler()
+        self.initialize_models()
 
         ## Initialize vehicle tracker
         self.initialize_vehicle_tracker()
         self.initialize_vehicle_counter()
+        if self.checkpoint_options.resume:
+            self.resume_from_checkpoint()
 
         ###################################################
         ## Main process is here (^.^)
         ###################################################
         IOUtil.print_warning_messages("Camera is ready to process ... ")
-        self.run()
+        if auto_run:
+            self.run()
 
     #################################################
     ## Initializing functions
@@ -59,55 +127,186 @@ class Camera(object):
                                  dataset_name=self.dataset_name)
         self.cap_bg, self.cap_fg, self.cap_im = data_loader.init_input_stream()
 
+    def setup_frame_reader(self):
+        data_loader = DataLoader(data_dir=self.data_dir,
+                                 dataset_name=self.dataset_name)
+        if self.reader_options.source == "packed":
+            return data_loader.init_packed_reader()
+        if self.reader_options.source == "video":
+            return data_loader.init_video_reader(prefetch_depth=self.reader_options.prefetch_depth,
+                                                 loop=self.reader_options.loop)
+        return data_loader.init_frame_reader(num_workers=self.reader_options.num_workers,
+                                             prefetch_depth=self.reader_options.prefetch_depth,
+                                             rebuild_manifest=self.reader_options.rebuild_manifest)
+
     def initialize_observation_zone(self):
         ## read from config file and construct into ObservationZone objects
         self.observation_zones = IOUtil.load_observation_zone_config(self.data_dir + "/" + self.dataset_name + "/" + "config.txt")
 
     def initialize_vehicle_detector(self):
         ## initialize VehicleDetector from list of ObservationZone objects
-        self.vehicle_detector = VehicleDetector()
+        self.vehicle_detector = VehicleDetector(detection_engine=self.detection_options.engine)
+
+    def timed_startup_step(self, step_name, initialize_function):
+        step_start = time.time()
+        initialize_function()
+        self.startup_timings_[step_name] = time.time() - step_start
+
+    def initialize_models(self):
+        if not self.concurrent_startup:
+            self.timed_startup_step("vehicle classifier", self.initialize_vehicle_classifier)
+            self.timed_startup_step("occlusion handler", self.initialize_vehile_occlusion_handler)
+            return
+
+        ## TF graph/checkpoint restore and cv.dnn graph parsing release the GIL,
+        ## so both models are loaded in parallel with each other and with frame decoding
+        self.model_loader_ = ThreadPoolExecutor(max_workers=2)
+        self.model_futures_ = [
+            self.model_loader_.submit(self.timed_startup_step, "vehicle classifier",
+                                      self.initialize_vehicle_classifier),
+            self.model_loader_.submit(self.timed_startup_step, "occlusion handler",
+                                      self.initialize_vehile_occlusion_handler)]
+
+    def wait_for_models(self):
+        ## Block until the models are ready, called before the first frame is processed
+        if self.model_futures_ is not None:
+            wait_start = time.time()
+            for future in self.model_futures_:
+                future.result()     # re-raise any loading error in the main thread
+            self.model_loader_.shutdown()
+            self.model_loader_ = None
+            self.model_futures_ = None
+            self.startup_timings_["waiting for models"] = time.time() - wait_start
+
+    def finish_startup(self):
+        ## Called once the first frame has been decoded and detected
+        self.startup_timings_["first frame ready"] = time.time() - self.startup_time_
+        self.wait_for_models()
+        self.print_startup_timings()
+        self.startup_reported_ = True
+
+    def print_startup_timings(self):
+        self.startup_timings_["total to first frame"] = time.time() - self.startup_time_
+        IOUtil.print_warning_messages("Startup timing breakdown:")
+        for step_name, step_time in self.startup_timings_.items():
+            IOUtil.print_warning_messages("     |--- {:<22}: {:8.1f} ms".format(step_name, 1000.0 * step_time))
 
     def initialize_vehicle_classifier(self):
         ## initialize VehicleClassifier from Neural Decision Tree
+        if self.vehicle_classifier is not None:
+            return
         self.vehicle_classifier = VehicleClassifier(max_tree_depth = 7,
                                                     n_features = 10,
-                                                    n_classes = 4)
+                                                    n_classes = 4,
+                                                    inference_engine = self.classifier_engine,
+                                                    routing_beam_width = self.classifier_beam_width)
+        self.vehicle_classifier.warm_up()
 
     def initialize_vehile_occlusion_handler(self):
-        self.vehicle_occlusion_handler = VehicleOcclusionHandler()
+        if self.vehicle_occlusion_handler is None:
+            self.vehicle_occlusion_handler = VehicleOcclusionHandler()
+            self.vehicle_occlusion_handler.warm_up()
+        ## The scheduler belongs to the camera, the handler may be shared with other cameras
+        if self.occlusion_options.frames_in_flight > 0:
+            ## Asynchronous inference: submit() returns at once, result() waits for the frame
+            self.occlusion_scheduler_ = OcclusionBatchScheduler(self.vehicle_occlusion_handler,
+                                                                max_batch_size=max(self.occlusion_options.batch_size, 1))
+            self.occlusion_scheduler_.start()
+        elif self.occlusion_options.batch_size > 1:
+            self.occlusion_scheduler_ = OcclusionBatchScheduler(self.vehicle_occlusion_handler,
+                                                                max_batch_size=self.occlusion_options.batch_size,
+                                                                max_latency=self.occlusion_options.batch_latency)
 
     def initialize_vehicle_tracker(self):
-        self.vehicle_tracker = VehicleTracker()
+        self.vehicle_tracker = VehicleTracker(association_engine=self.tracking_options.association_engine)
+        ## Tracks must retain at least the points looked back at by the tracker
+        Vehicle.configure_track_history(max(self.tracking_options.history_capacity, self.vehicle_tracker.kLookbackLimit),
+                                        self.tracking_options.object_history_capacity)
 
     def initialize_vehicle_counter(self):
-        self.vehicle_counter_ = VehicleCounter()
+        statistics_sinks = list()
+        if self.statistics_options.csv is not None:
+            statistics_sinks.append(CsvStatisticsSink(self.statistics_options.csv))
+        if self.statistics_options.sqlite is not None:
+            statistics_sinks.append(SqliteStatisticsSink(self.statistics_options.sqlite))
+        statistics = None
+        if len(statistics_sinks) != 0:
+            statistics = TrafficStatistics(n_zones=len(self.observation_zones),
+                                           bucket_seconds=self.statistics_options.bucket_seconds,
+                                           sinks=statistics_sinks)
+        self.vehicle_counter_ = VehicleCounter(statistics)
+
+    def resume_from_checkpoint(self):
+        if self.checkpoint_ is None:
+            raise ValueError("Resuming needs a checkpoint path")
+        state = self.checkpoint_.load()
+        if state is None:
+            IOUtil.print_warning_messages("No checkpoint at " + self.checkpoint_.path + ", starting from frame 0")
+            return
+        if state["dataset_name"] != self.dataset_name:
+            raise ValueError("Checkpoint {} belongs to dataset {}, not {}".format(self.checkpoint_.path,
+                                                                                 state["dataset_name"],
+                                                                                 self.dataset_name))
+        self.vehicles_ = state["vehicles"]
+        self.vehicle_counter_.restore_state(state["counter"])
+        self.last_tracked_frame_index_ = state["last_tracked_frame_index"]
+        self.start_frame_index_ = state["frame_index"] + 1
+        IOUtil.print_warning_messages("Resuming at frame {} with {} tracks".format(self.start_frame_index_,
+                                                                                   len(self.vehicles_)))
+
+    def take_checkpoint(self, frame_index):
+        ## Serialized on the tracking thread right after @frame_index is tracked,
+        ## the rows buffered by the statistics sinks belong to it
+        self.vehicle_counter_.flush()
+        return self.checkpoint_.serialize({
+            "dataset_name" : self.dataset_name,
+            "frame_index" : frame_index,
+            "last_tracked_frame_index" : self.last_tracked_frame_index_,
+            "vehicles" : [v.compact_copy() for v in self.vehicles_],
+            "counter" : self.vehicle_counter_.state()
+        })
+
+    def save_checkpoint(self, snapshot):
+        ## The session resumes after the frame of @snapshot: its outputs and those of the frames
+        ## before it must be written first
+        if self.output_writer_ is not None:
+            self.output_writer_.drain()
+        self.checkpoint_.write(snapshot)
 
     #################################################
     ## Detect and Classify vehicles
     #################################################
-    def detect_vehicle(self, foreground_img, background_img, rbg_image):
-        detected_candidate = self.vehicle_detector.detect_vehicle_candidate(foreground_img,
-                                                                            background_img,
-                                                                            rbg_image)
-        ## Filter noises and remove unncessary candidates
-        del_idx = list()
-        for idx, vehicle in enumerate(detected_candidate):
-            found = False
-
-            for oz_idx, observation_zone in enumerate(self.observation_zones):
-                check_status = observation_zone.check_inside_oz_and_set_oz_index(vehicle)
-                if check_status:
-                    vehicle.zone_index = observation_zone.oz_index
-                    found = True
-                    break
-            if not found:       # If not found any OZ containing the vehicle
-                del_idx.append(idx)
-
-        filter_detected_candidate = [vehicle
-                                     for idx, vehicle in enumerate(detected_candidate)
-                                        if idx not in del_idx]
+    def filter_by_observation_zone(self, detected_candidate, frame_shape):
+        if len(detected_candidate) == 0:
+            return detected_candidate
+
+        ## Filter noises and remove unncessary candidates:
+        ## the OZ of every centroid is looked up at once in the rasterized zones
+        zone_label_map = self.get_zone_label_map(frame_shape)
+        centroids = np.array([vehicle.trajectory_[-1] for vehicle in detected_candidate])
+        zone_indexes = zone_label_map.lookup(centroids)
+
+        filter_detected_candidate = list()
+        for vehicle, zone_index in zip(detected_candidate, zone_indexes):
+            if zone_index >= 0:     # Drop the vehicle if not found any OZ containing it
+                vehicle.zone_index = int(zone_index)
+                filter_detected_candidate.append(vehicle)
         return filter_detected_candidate
 
+    def get_zone_label_map(self, frame_shape):
+        ## Zones are rasterized once, at the size of the first decoded frame (see read_frames)
+        if self.zone_label_map_ is None or self.zone_label_map_.frame_shape != tuple(frame_shape[:2]):
+            self.zone_label_map_ = ZoneLabelMap(self.observation_zones, frame_shape)
+            self.initialize_region_of_interest()
+        return self.zone_label_map_
+
+    def initialize_region_of_interest(self):
+        if self.detection_options.roi_mode == "off":
+            return
+        roi_rect = self.zone_label_map_.bounding_region(self.detection_options.roi_margin)
+        roi_mask = self.zone_label_map_.zone_mask(self.detection_options.roi_margin) if self.detection_options.roi_mode == "mask" else None
+        self.vehicle_detector.set_region_of_interest(roi_rect, roi_mask)
+
     def classify_vehicle(self, detected_vehicles):
         vehicles, blobs = self.vehicle_classifier.detect_occlusion(detected_vehicles)
 
@@ -119,15 +318,17 @@ class Camera(object):
     #################################################
     ## Tracking and Counting vehicles
     #################################################
-    def track_and_count_vehicle(self, vehicle_candidates, vehicles):
-        vehicle_candidates, vehicles = self.track_vehicle(vehicle_candidates, vehicles)
-        self.count_vehicle(vehicles)
+    def track_and_count_vehicle(self, vehicle_candidates, vehicles, frame_gap=1, timestamp=None):
+        vehicle_candidates, vehicles = self.track_vehicle(vehicle_candidates, vehicles, frame_gap)
+        self.count_vehicle(vehicles, timestamp)
         return vehicle_candidates, vehicles
 
-    def track_vehicle(self, vehicle_candidates, vehicles):
-        return self.vehicle_tracker.track_vehicles(vehicle_candidates, vehicles)
+    def track_vehicle(self, vehicle_candidates, vehicles, frame_gap=1):
+        return self.vehicle_tracker.track_vehicles(vehicle_candidates, vehicles, frame_gap)
 
-    def count_vehicle(self, vehicles_):
+    def count_vehicle(self, vehicles_, timestamp=None):
+        if timestamp is not None:
+            self.vehicle_counter_.advance_time(timestamp)
         for v in vehicles_:
             zone_index=v.zone_index
 
@@ -139,8 +340,7 @@ class Camera(object):
 
                 # Count vehicle
                 if(self.observation_zones[zone_index].isVehicleCountable(v)):
-                    self.vehicle_counter_.update_vehicle_count(v.vehicle_type)
-                    self.vehicle_counter_.update_vehicle_speed(v.speed)
+                    self.vehicle_counter_.count_vehicle(v.vehicle_type, v.speed, zone_index, timestamp)
                     v.status = Status.Counted
 
 
@@ -162,7 +362,8 @@ class Camera(object):
 
     def draw_trajectory(self, rbg_image, vehicles):
         for vidx, vehicle in enumerate(vehicles):
-            trajectory = vehicle.trajectory_
+            # Only the last Vehicle.kHistoryCapacity points of a track are retained
+            trajectory = list(vehicle.trajectory_)
 
             # print("--> vehicle",vidx,":",len(trajectory))
 
@@ -176,6 +377,220 @@ class Camera(object):
         IOUtil.show_foreground(foreground_img)
         IOUtil.show_result(rbg_image)
 
+    #################################################
+    ## Processing stages of a frame
+    #################################################
+    def read_frames(self):
+        ## [Option 1] - Read from frames, in manifest order and decoded ahead by a thread pool
+        ##              or as zero-copy views of the packed container
+        ## [Option 1 - RUN ONCE]: the reader stops at the end of the sequence
+        ## [Option 2] - Read from videos (reader source "video"), the three streams are decoded
+        ##              in parallel and kept aligned, and rewound at the end in loop mode
+        frame_reader = self.setup_frame_reader()
+        decode_start = self.instrumentation_.start()
+        for frame_index, image_idx, input_image, background, foreground in \
+                frame_reader.read_frames(start_index=self.start_frame_index_,
+                                         read_background=not self.output_options.headless):
+            if self.degradation_ is not None and self.degradation_.drop_frame(frame_index):
+                decode_start = self.instrumentation_.start()
+                continue
+            frame = FramePacket(frame_index=frame_index,
+                                frame_name=image_idx,
+                                input_image=input_image,
+                                background=background,
+                                foreground=foreground)
+            self.instrumentation_.stop(frame, "decode", decode_start)
+            if self.zone_label_map_ is None:
+                ## The frame size is known: the zones are rasterized and the ROI is set up before
+                ## the first detection, as a startup step rather than in the timings of the frame
+                self.timed_startup_step("zone label map", lambda: self.get_zone_label_map(foreground.shape))
+            yield frame
+            decode_start = self.instrumentation_.start()
+
+    def process_detection(self, frame):
+        ## Vehicle detection & Extract features
+        stage_start = self.instrumentation_.start()
+        detected_candidate = self.vehicle_detector.detect_vehicle_candidate(frame.foreground,
+                                                                            frame.background,
+                                                                            frame.input_image)
+        stage_start = self.instrumentation_.stop(frame, "detection", stage_start)
+        frame.detected_vehicle_candidate = self.filter_by_observation_zone(detected_candidate,
+                                                                           frame.foreground.shape)
+        self.instrumentation_.stop(frame, "zone_filtering", stage_start)
+        return frame
+
+    def process_classification(self, frame):
+        ## Models are warming up while the first frame is decoded and detected
+        if not self.startup_reported_:
+            self.finish_startup()
+
+        ## Vehicle classification using Neural Decision Tree
+        stage_start = self.instrumentation_.start()
+        vehicles, blobs = self.classify_vehicle(frame.detected_vehicle_candidate)
+        stage_start = self.instrumentation_.stop(frame, "classification", stage_start)
+        frame.occlusion_blob_count = len(blobs)
+        if self.degradation_ is not None and len(blobs) != 0 and \
+                not self.degradation_.handle_occlusion(frame.frame_index):
+            ## SSD deferred to a later frame: the unsplit blobs are tracked as single candidates,
+            ## so the tracks of their vehicles survive until a frame splits them again
+            vehicles = vehicles + blobs
+            blobs = list()
+
+        ## Vehicle occlusion handling using SSD-MobileNet
+        if self.occlusion_scheduler_ is not None:
+            ## Extracted vehicles are appended once the batch of the frame has run
+            self.occlusion_scheduler_.submit(self.occlusion_key(frame), blobs, frame.input_image, frame.foreground)
+            frame.detected_vehicles = vehicles
+        elif not len(blobs) == 0:
+            extracted_vehicles = self.vehicle_occlusion_handler.handle_occlusion_blob(blobs,
+                                                                                      frame.input_image,
+                                                                                      frame.foreground)
+            frame.detected_vehicles = vehicles + extracted_vehicles
+        else:
+            frame.detected_vehicles = vehicles
+        self.instrumentation_.stop(frame, "occlusion", stage_start)
+        return frame
+
+    def classify_frames(self, frame):
+        '''
+        classification stage of the frame loop
+        :return: the frames ready to be tracked, in order (none while their occlusion batch is pending)
+        '''
+        self.process_classification(frame)
+        if self.occlusion_scheduler_ is None:
+            return [frame]
+
+        self.pending_frames_.append(frame)
+        self.occlusion_scheduler_.poll()
+        if self.occlusion_options.frames_in_flight > 0:
+            return self.collect_occlusion_results(self.occlusion_options.frames_in_flight)
+        return self.collect_occlusion_results()
+
+    def flush_classification(self):
+        ## End of stream: wait for the last occlusion batch
+        if self.occlusion_scheduler_ is None:
+            return []
+        return self.collect_occlusion_results(frames_in_flight=0)
+
+    def collect_occlusion_results(self, frames_in_flight=None):
+        '''
+        releases the pending frames whose occlusion handling is done, in frame order
+        :param frames_in_flight: if set, waits for all but the newest @frames_in_flight frames
+        '''
+        ready_frames = list()
+        while len(self.pending_frames_) != 0:
+            frame_key = self.occlusion_key(self.pending_frames_[0])
+            must_wait = frames_in_flight is not None and len(self.pending_frames_) > frames_in_flight
+            if not must_wait and not self.occlusion_scheduler_.is_completed(frame_key):
+                break
+            frame = self.pending_frames_.popleft()
+            stage_start = self.instrumentation_.start()
+            extracted_vehicles = self.occlusion_scheduler_.result(frame_key)
+            self.instrumentation_.stop(frame, "occlusion", stage_start)
+            frame.detected_vehicles = frame.detected_vehicles + extracted_vehicles
+            ready_frames.append(frame)
+        return ready_frames
+
+    def occlusion_key(self, frame):
+        return (self.dataset_name, frame.frame_index)
+
+    def process_tracking(self, frame):
+        ## Track and count vehicles:
+        stage_start = self.instrumentation_.start()
+        ## Classification and occlusion handling are done with the crops of the frame
+        self.crop_retention_.settle(frame.detected_vehicles)
+        self.vehicle_candidates_ = frame.detected_vehicles
+        ## Frames dropped since the previous tracked frame widen the tracker gates
+        frame_gap = 1
+        if self.last_tracked_frame_index_ is not None:
+            frame_gap = max(1, frame.frame_index - self.last_tracked_frame_index_)
+        self.last_tracked_frame_index_ = frame.frame_index
+        if self.tracking_options.enabled:
+            self.vehicle_candidates_, self.vehicles_ = self.track_and_count_vehicle(self.vehicle_candidates_,
+                                                                                    self.vehicles_,
+                                                                                    frame_gap,
+                                                                                    frame.frame_index / self.statistics_options.fps)
+            frame.result_vehicles = list(self.vehicles_)
+        else:
+            frame.result_vehicles = self.vehicle_candidates_
+        frame.pinned_crop_bytes = self.crop_retention_.observe(frame.result_vehicles)
+        stage_start = self.instrumentation_.stop(frame, "tracking", stage_start)
+
+        ## Draw results
+        ## (done here so that tracks are drawn before the next frame updates them)
+        if self.degradation_ is None or self.degradation_.draw_overlay():
+            self.draw_result(frame.input_image, frame.result_vehicles)
+        # self.draw_result(input_image, detected_vehicle_candidate)
+        self.instrumentation_.stop(frame, "render", stage_start)
+
+        ## Snapshot taken on the tracking thread, between two frames, and saved once the frame is rendered
+        if self.checkpoint_ is not None and self.checkpoint_.is_due(frame.frame_index):
+            frame.checkpoint_snapshot = self.take_checkpoint(frame.frame_index)
+        return frame
+
+    def render_frame(self, frame):
+        stage_start = self.instrumentation_.start()
+        keep_running = self.show_frame(frame)
+        self.instrumentation_.stop(frame, "render", stage_start)
+        self.instrumentation_.emit(frame)
+        if self.degradation_ is not None:
+            self.degradation_.frame_done(time.time() - frame.arrival_time)
+        if frame.checkpoint_snapshot is not None:
+            self.save_checkpoint(frame.checkpoint_snapshot)
+            frame.checkpoint_snapshot = None
+        return keep_running
+
+    def show_frame(self, frame):
+        self.write_output_frame(frame.frame_name, frame.input_image)
+        if self.output_options.headless:
+            return True
+
+        ## Show result
+        self.show_result_windows(frame.foreground, frame.background, frame.input_image)
+        ## [Option 1]: Output frame-by-frame
+        # cv.waitKey(0);
+
+        ## [Option 2]: Output continously a sequence of frame
+        c = cv.waitKey(1)
+        if (c == 27):
+            return False
+        elif (c == 32):
+            while (cv.waitKey(0) != 32):
+                continue
+
+        return True
+
+    def write_output_frame(self, frame_name, output_frame):
+        if self.output_options.video is None and self.output_options.export_dir is None:
+            return
+
+        if self.output_writer_ is None:
+            ## The size of the outputs follows the first frame unless output_size is given,
+            ## a resumed session writes its own video segment as the video cannot be appended to
+            video_path = self.output_options.video
+            if video_path is not None and self.start_frame_index_ != 0:
+                video_path = OutputWriter.segment_path(video_path, self.start_frame_index_)
+            self.output_writer_ = OutputWriter(video_path=video_path,
+                                               image_dir=self.output_options.export_dir,
+                                               image_format=self.output_options.export_format,
+                                               fps=self.output_options.fps,
+                                               output_size=self.output_options.size,
+                                               queue_depth=self.output_options.queue_depth,
+                                               num_workers=self.output_options.num_workers,
+                                               policy=self.output_options.policy)
+        self.output_writer_.write(frame_name, output_frame)
+
+    def finish_frames(self, frames):
+        ## Tracks and renders classified frames, returns False to stop
+        for frame in frames:
+            self.nFrame_ = self.nFrame_ + 1
+            # IOUtil.print_fps_message("     |--- frame #" + str(self.nFrame_))
+
+            self.process_tracking(frame)
+            if not self.render_frame(frame):
+                return False
+        return True
+
     #################################################
     ## Main processing of camera
     #################################################
@@ -183,94 +598,50 @@ class Camera(object):
         start_time = time.time()
         nFrame = 0
 
-        out = cv.VideoWriter('output.avi',cv.VideoWriter_fourcc('M','J','P','G'), 30, (640,360))
-        ########################################################################################
-        # Read dataset:
-        ########################################################################################
-
-        ## [Option 1] - Read from frames
-        for image_idx in os.listdir(self.data_dir + '/' + self.dataset_name + '/im'):
-            nFrame = nFrame + 1
-
-            input_image = cv.imread(self.data_dir + '/' + self.dataset_name + '/im/' + image_idx)
-            background = cv.imread(self.data_dir + '/' + self.dataset_name + '/bg/' + image_idx)
-            foreground = cv.imread(self.data_dir + '/' + self.dataset_name + '/fg/' + image_idx,
-            					   cv.IMREAD_GRAYSCALE)
-            
-            if input_image is not None and background is not None and foreground is not None:
-
-        ## [Option 2] - Read from videos
-        # while(True):
-        #     nFrame = nFrame + 1
-        #     ret_im, input_image = self.cap_im.read()
-        #     ret_bg, background = self.cap_bg.read()
-        #     ret_fg, foreground = self.cap_fg.read()
-
-        #     if ret_im == True and ret_bg == True and ret_fg == True:
-                # Convert foreground to GRAY mode
-                # foreground = cv.cvtColor(foreground,cv.COLOR_BGR2GRAY)
-
-        ########################################################################################
-        # Main process:
-        ########################################################################################
-
-                # IOUtil.print_fps_message("     |--- frame #" + str(counter))
-
-                ## Vehicle detection & Extract features
-                detected_vehicle_candidate = self.detect_vehicle(foreground,background,input_image)
-
-                ## Vehicle classification using Neural Decision Tree
-                vehicles, blobs = self.classify_vehicle(detected_vehicle_candidate)
-
-                ## Vehicle occlusion handling using SSD-MobileNet
-                if not len(blobs) == 0:
-                    extracted_vehicles = self.vehicle_occlusion_handler.handle_occlusion_blob(blobs,
-                                                                                              input_image,
-                                                                                              foreground)
-                    detected_vehicles = vehicles + extracted_vehicles
-                else:
-                    detected_vehicles = vehicles
-
-                ## Track and count vehicles:
-                self.vehicle_candidates_ = detected_vehicles
-                # self.vehicle_candidates_, self.vehicles_ = self.track_and_count_vehicle(self.vehicle_candidates_,
-                #                                                                         self.vehicles_)
-
-                ## Draw results
-                self.draw_result(input_image, self.vehicle_candidates_)
-                # self.draw_result(input_image, detected_vehicle_candidate)
-
-                ## Show result
-                self.show_result_windows(foreground, background, input_image)
-                out.write(input_image)
-                ## [Option 1]: Output frame-by-frame
-                # cv.waitKey(0);
-
-                ## [Option 2]: Output continously a sequence of frame
-                c = cv.waitKey(1)
-                if (c == 27):
+        if self.pipeline_queue_depths is not None:
+            ## Stages run on their own threads, connected by bounded queues
+            pipeline = CameraPipeline(camera=self,
+                                      queue_depths=self.pipeline_queue_depths)
+            nFrame = pipeline.run(render_function=self.render_frame)
+        else:
+            for frame in self.read_frames():
+                self.process_detection(frame)
+                if not self.finish_frames(self.classify_frames(frame)):
                     break
-                elif (c == 32):
-                    while (cv.waitKey(0) != 32):
-                        continue
-
-                # cv.imwrite("F:/export/"+ self.dataset_name + "/" + image_idx,input_image)
-
-                end_time = time.time()
-                # print("--- %s seconds ---" % (end_time - start_time))
-                # print("nFrame =",nFrame)
-                #IOUtil.print_fps_message("     |--- fps =" + str(1.0*nFrame/(end_time - start_time)))
             else:
-                # [Option 1 - RUN ONCE]: if out of frame then stop the process
-                break
-
-                # [Option 2 - LOOP REWIND]: if out of frame then reset to the beginning
-                # self.cap_bg.set(cv.CAP_PROP_POS_MSEC, 0)
-                # self.cap_fg.set(cv.CAP_PROP_POS_MSEC, 0)
-                # self.cap_im.set(cv.CAP_PROP_POS_MSEC, 0)
-
-        cv.destroyAllWindows()
-        out.release()
+                self.finish_frames(self.flush_classification())
+            nFrame = self.nFrame_
+
+        end_time = time.time()
+        # print("--- %s seconds ---" % (end_time - start_time))
+        # print("nFrame =",nFrame)
+        #IOUtil.print_fps_message("     |--- fps =" + str(1.0*nFrame/(end_time - start_time)))
+
+        self.wait_for_models()
+        if self.occlusion_scheduler_ is not None:
+            self.occlusion_scheduler_.stop()
+            IOUtil.print_warning_messages("Occlusion batches: " + self.occlusion_scheduler_.statistics_message())
+        if self.degradation_ is not None:
+            IOUtil.print_warning_messages("Degradation levels used:")
+            for line in self.degradation_.report():
+                IOUtil.print_warning_messages("     |--- " + line)
+        IOUtil.print_warning_messages("Crop memory:")
+        for line in self.crop_retention_.report():
+            IOUtil.print_warning_messages("     |--- " + line)
+        IOUtil.print_warning_messages("Contour geometry cache (reused/requested): "
+                                      + ContourGeometry.statistics_message())
+        if not self.output_options.headless:
+            cv.destroyAllWindows()
+        if self.output_writer_ is not None:
+            self.output_writer_.close()
+            IOUtil.print_warning_messages("Output: " + self.output_writer_.statistics_message())
+            self.output_writer_ = None
+        self.instrumentation_.close()
+        if self.checkpoint_ is not None and self.last_tracked_frame_index_ is not None:
+            self.save_checkpoint(self.take_checkpoint(self.last_tracked_frame_index_))
+            IOUtil.print_warning_messages("Checkpoint: " + self.checkpoint_.statistics_message())
+        self.vehicle_counter_.close()
+        return nFrame
 
 
     
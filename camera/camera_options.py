@@ -0,0 +1,453 @@
+class DetectionOptions(object):
+    '''
+    Blob extraction of the VehicleDetector
+        engine      "contours" (findContours) or "components" (connectedComponentsWithStats)
+        roi_mode    "off", "bbox" (bounding rectangle of the OZs) or "mask" (zones only), both
+                    grown by roi_margin pixels so that the blobs entering a zone are not cut at the border
+    '''
+    def __init__(self, engine="contours", roi_mode="off", roi_margin=16):
+        self.engine = engine
+        self.roi_mode = roi_mode
+        self.roi_margin = roi_margin
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('detection')
+        group.add_argument(
+            '--detector',
+            metavar='detector',
+            default='contours',
+            choices=['contours', 'components'],
+            help='Blob extraction: findContours, or connectedComponentsWithStats with vectorized filtering')
+        group.add_argument(
+            '--roi',
+            metavar='roi',
+            default='off',
+            choices=['off', 'bbox', 'mask'],
+            help='Extract blobs only inside the bounding box or the mask of the observation zones')
+        group.add_argument(
+            '--roi-margin',
+            metavar='roi_margin',
+            type=int,
+            default=16,
+            help='Pixels added around the observation zones in ROI mode')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(engine=args.detector, roi_mode=args.roi, roi_margin=args.roi_margin)
+
+
+class TrackingOptions(object):
+    '''
+    Tracking and counting of the vehicles
+        association_engine          "greedy" (first candidate passing the gates) or "global"
+        history_capacity            trajectory points, boxes, ellipses and features kept per track
+        object_history_capacity     contours and image crops kept per track
+        crop_retention              image crops are views of the frames: "release" drops them before
+                                    tracking, "copy" keeps compact copies (scaled by crop_scale) and
+                                    "view" keeps the frames alive
+    '''
+    def __init__(self, enabled=False, association_engine="greedy", history_capacity=32,
+                 object_history_capacity=2, crop_retention="release", crop_scale=1.0):
+        self.enabled = enabled
+        self.association_engine = association_engine
+        self.history_capacity = history_capacity
+        self.object_history_capacity = object_history_capacity
+        self.crop_retention = crop_retention
+        self.crop_scale = crop_scale
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('tracking')
+        group.add_argument(
+            '--track',
+            action='store_true',
+            help='Track and count vehicles')
+        group.add_argument(
+            '--association',
+            metavar='association',
+            default='greedy',
+            choices=['greedy', 'global'],
+            help='Track association: first candidate passing the gates, or global minimum-cost assignment')
+        group.add_argument(
+            '--track-history',
+            metavar='track_history',
+            type=int,
+            default=32,
+            help='Number of trajectory points, boxes, ellipses and features kept per track')
+        group.add_argument(
+            '--track-crops',
+            metavar='track_crops',
+            type=int,
+            default=2,
+            help='Number of contours and image crops kept per track')
+        group.add_argument(
+            '--crop-retention',
+            metavar='crop_retention',
+            default='release',
+            choices=['release', 'copy', 'view'],
+            help='Vehicle crops: dropped before tracking (release), kept as compact copies (copy) '
+                 'or kept as views that hold the whole frames (view)')
+        group.add_argument(
+            '--crop-scale',
+            metavar='crop_scale',
+            type=float,
+            default=1.0,
+            help='Downscaling of the crops kept by --crop-retention copy')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(enabled=args.track,
+                   association_engine=args.association,
+                   history_capacity=args.track_history,
+                   object_history_capacity=args.track_crops,
+                   crop_retention=args.crop_retention,
+                   crop_scale=args.crop_scale)
+
+
+class OcclusionOptions(object):
+    '''
+    SSD occlusion handling
+        batch_size          > 1: the blobs of consecutive frames are batched into one SSD forward(),
+                            frames are then held back until their batch has run (at most batch_latency s)
+        frames_in_flight    > 0: SSD runs on its own inference worker, the frame loop submits the
+                            blobs of frame N and goes on tracking/rendering frame N-1
+    '''
+    def __init__(self, batch_size=1, batch_latency=0.05, frames_in_flight=0):
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.frames_in_flight = frames_in_flight
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('occlusion handling')
+        group.add_argument(
+            '--occlusion-batch',
+            metavar='occlusion_batch',
+            type=int,
+            default=1,
+            help='Batch the occlusion blobs of consecutive frames into one SSD forward pass of up to this many blobs')
+        group.add_argument(
+            '--occlusion-latency',
+            metavar='occlusion_latency',
+            type=float,
+            default=0.05,
+            help='Seconds a frame may wait for its occlusion batch')
+        group.add_argument(
+            '--async-occlusion',
+            metavar='frames_in_flight',
+            type=int,
+            default=0,
+            help='Run SSD on an inference worker, overlapping up to this many frames with tracking and rendering')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(batch_size=args.occlusion_batch,
+                   batch_latency=args.occlusion_latency,
+                   frames_in_flight=args.async_occlusion)
+
+
+class DegradationOptions(object):
+    ## Live streams: load is shed in steps when frames take longer than frame_budget seconds
+    def __init__(self, frame_budget=None, occlusion_defer_interval=4):
+        self.frame_budget = frame_budget
+        self.occlusion_defer_interval = occlusion_defer_interval
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('load shedding')
+        group.add_argument(
+            '--frame-budget',
+            metavar='frame_budget',
+            type=float,
+            default=None,
+            help='Latency budget of a frame in ms, load is shed in steps when it is exceeded')
+        group.add_argument(
+            '--defer-occlusion',
+            metavar='defer_occlusion',
+            type=int,
+            default=4,
+            help='Under load, handle occlusions only on every Nth frame')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(frame_budget=None if args.frame_budget is None else args.frame_budget / 1000.0,
+                   occlusion_defer_interval=args.defer_occlusion)
+
+
+class ReaderOptions(object):
+    '''
+    Input frames
+        source      "png" sequences, "packed" memory-mapped container or "video" (im/bg/fg.mp4)
+        loop        rewind the videos at the end instead of stopping
+    '''
+    def __init__(self, source="png", loop=False, num_workers=4, prefetch_depth=8, rebuild_manifest=False):
+        self.source = source
+        self.loop = loop
+        self.num_workers = num_workers
+        self.prefetch_depth = prefetch_depth
+        self.rebuild_manifest = rebuild_manifest
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('input')
+        group.add_argument(
+            '--source',
+            metavar='source',
+            default='png',
+            choices=['png', 'packed', 'video'],
+            help='Read PNG sequences, the packed container (python -m data_io.packed_dataset) or im/bg/fg.mp4')
+        group.add_argument(
+            '--loop',
+            action='store_true',
+            help='Rewind the videos at the end instead of stopping')
+        group.add_argument(
+            '--reader-workers',
+            metavar='reader_workers',
+            type=int,
+            default=4,
+            help='Number of threads decoding the im/bg/fg frames')
+        group.add_argument(
+            '--prefetch',
+            metavar='prefetch',
+            type=int,
+            default=8,
+            help='Number of frames decoded ahead of the processing')
+        group.add_argument(
+            '--rebuild-manifest',
+            action='store_true',
+            help='Re-list the im/ directory instead of using the saved frame manifest')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(source=args.source,
+                   loop=args.loop,
+                   num_workers=args.reader_workers,
+                   prefetch_depth=args.prefetch,
+                   rebuild_manifest=args.rebuild_manifest)
+
+
+class OutputOptions(object):
+    '''
+    Display and annotated outputs
+        headless        no GUI window and no waitKey, the background stream is then never decoded
+        video           annotated video, None to disable it; size=None keeps the input size
+        export_dir      annotated frames are also exported one image per frame into it
+    Both outputs are encoded off the processing thread, policy "block" or "drop" when they fall behind.
+    '''
+    def __init__(self, headless=False, video="output.avi", fps=30, size=None, export_dir=None,
+                 export_format="jpg", queue_depth=16, num_workers=2, policy="block"):
+        self.headless = headless
+        self.video = video
+        self.fps = fps
+        self.size = size
+        self.export_dir = export_dir
+        self.export_format = export_format
+        self.queue_depth = queue_depth
+        self.num_workers = num_workers
+        self.policy = policy
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('output')
+        group.add_argument(
+            '--headless',
+            action='store_true',
+            help='Batch mode: no display window, no key handling and no background decoding')
+        group.add_argument(
+            '--output',
+            metavar='output',
+            default='output.avi',
+            help='Annotated output video')
+        group.add_argument(
+            '--no-output',
+            action='store_true',
+            help='Do not write the annotated output video')
+        group.add_argument(
+            '--output-fps',
+            metavar='output_fps',
+            type=float,
+            default=30,
+            help='Frame rate of the annotated output video')
+        group.add_argument(
+            '--output-size',
+            metavar=('width', 'height'),
+            type=int,
+            nargs=2,
+            default=None,
+            help='Frame size of the annotated output video (default: input frame size)')
+        group.add_argument(
+            '--export-dir',
+            metavar='export_dir',
+            default=None,
+            help='Also export every annotated frame as an image into this directory')
+        group.add_argument(
+            '--export-format',
+            metavar='export_format',
+            default='jpg',
+            choices=['jpg', 'png'],
+            help='Image format of the exported frames')
+        group.add_argument(
+            '--output-queue',
+            metavar='output_queue',
+            type=int,
+            default=16,
+            help='Annotated frames waiting to be encoded')
+        group.add_argument(
+            '--output-workers',
+            metavar='output_workers',
+            type=int,
+            default=2,
+            help='Threads encoding the exported images')
+        group.add_argument(
+            '--output-policy',
+            metavar='output_policy',
+            default='block',
+            choices=['block', 'drop'],
+            help='When encoding falls behind: wait for it (block) or skip frames (drop)')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(headless=args.headless,
+                   video=None if args.no_output else args.output,
+                   fps=args.output_fps,
+                   size=args.output_size,
+                   export_dir=args.export_dir,
+                   export_format=args.export_format,
+                   queue_depth=args.output_queue,
+                   num_workers=args.output_workers,
+                   policy=args.output_policy)
+
+
+class MetricsOptions(object):
+    ## Per-frame stage timings and object counts, not measured at all without a sink
+    def __init__(self, jsonl=None, prometheus=None, interval=10.0):
+        self.jsonl = jsonl
+        self.prometheus = prometheus
+        self.interval = interval
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('metrics')
+        group.add_argument(
+            '--metrics-jsonl',
+            metavar='metrics_jsonl',
+            default=None,
+            help='Write the stage timings and object counts of every frame to this JSONL file')
+        group.add_argument(
+            '--metrics-prometheus',
+            metavar='metrics_prometheus',
+            default=None,
+            help='Periodically rewrite this file with Prometheus latency histograms')
+        group.add_argument(
+            '--metrics-interval',
+            metavar='metrics_interval',
+            type=float,
+            default=10.0,
+            help='Seconds between two rewrites of the Prometheus file')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(jsonl=args.metrics_jsonl, prometheus=args.metrics_prometheus, interval=args.metrics_interval)
+
+
+class StatisticsOptions(object):
+    ## Counts per zone and vehicle type in bucket_seconds buckets, written every 1, 15 and 60 buckets;
+    ## the timestamps are frame_index / fps
+    def __init__(self, csv=None, sqlite=None, bucket_seconds=60.0, fps=30.0):
+        self.csv = csv
+        self.sqlite = sqlite
+        self.bucket_seconds = bucket_seconds
+        self.fps = fps
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('traffic statistics')
+        group.add_argument(
+            '--statistics-csv',
+            metavar='statistics_csv',
+            default=None,
+            help='Append the per-zone traffic counts of every time interval to this CSV file')
+        group.add_argument(
+            '--statistics-sqlite',
+            metavar='statistics_sqlite',
+            default=None,
+            help='Insert the per-zone traffic counts of every time interval into this SQLite database')
+        group.add_argument(
+            '--statistics-bucket',
+            metavar='statistics_bucket',
+            type=float,
+            default=60.0,
+            help='Time bucket of the traffic statistics in seconds (intervals of 1, 15 and 60 buckets)')
+        group.add_argument(
+            '--statistics-fps',
+            metavar='statistics_fps',
+            type=float,
+            default=30.0,
+            help='Frame rate of the recording, used to timestamp the traffic statistics')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(csv=args.statistics_csv,
+                   sqlite=args.statistics_sqlite,
+                   bucket_seconds=args.statistics_bucket,
+                   fps=args.statistics_fps)
+
+
+class CheckpointOptions(object):
+    ## Every interval frames the tracks (without crops), the counts and the frame index are saved
+    ## to path; resume restarts the session from that snapshot, appending to the metrics JSONL and
+    ## writing the video of the resumed frames to a segment of its own (output_<first frame>.avi)
+    def __init__(self, path=None, interval=1000, resume=False):
+        self.path = path
+        self.interval = interval
+        self.resume = resume
+
+    @staticmethod
+    def add_arguments(parser):
+        group = parser.add_argument_group('checkpoints')
+        group.add_argument(
+            '--checkpoint',
+            metavar='checkpoint',
+            default=None,
+            help='Periodically save the tracks, counts and frame index of the session to this file')
+        group.add_argument(
+            '--checkpoint-interval',
+            metavar='checkpoint_interval',
+            type=int,
+            default=1000,
+            help='Frames between two checkpoints')
+        group.add_argument(
+            '--resume',
+            action='store_true',
+            help='Resume the session from the --checkpoint file, the video of the resumed frames '
+                 'goes to <output>_<first frame>.avi')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(path=args.checkpoint, interval=args.checkpoint_interval, resume=args.resume)
+
+
+## Camera keyword -> options class
+kCameraOptions = [('detection_options', DetectionOptions),
+                  ('tracking_options', TrackingOptions),
+                  ('occlusion_options', OcclusionOptions),
+                  ('degradation_options', DegradationOptions),
+                  ('reader_options', ReaderOptions),
+                  ('output_options', OutputOptions),
+                  ('metrics_options', MetricsOptions),
+                  ('statistics_options', StatisticsOptions),
+                  ('checkpoint_options', CheckpointOptions)]
+
+
+def add_camera_arguments(parser, exclude=()):
+    ## @exclude: keywords of the groups set by the caller, e.g. ('output_options',)
+    for keyword, options_class in kCameraOptions:
+        if keyword not in exclude:
+            options_class.add_arguments(parser)
+
+
+def camera_options_from_args(args, exclude=()):
+    ## Keyword arguments of Camera built from the parsed command line
+    return dict((keyword, options_class.from_args(args)) for keyword, options_class in kCameraOptions
+                if keyword not in exclude)
@@ -0,0 +1,128 @@
+import queue
+import threading
+
+
+class CameraPipeline(object):
+    '''
+    Runs the stages of Camera on their own threads, connected by bounded queues:
+        decode --> detection --> classification & occlusion handling --> tracking & counting --> render
+    Each stage has a single worker so FIFO queues keep the frame order.
+    A stage may hold frames back (e.g. classification while an occlusion batch is pending):
+    it returns the list of frames it releases, and its flush function releases the rest at the end.
+    Rendering stays on the calling thread because HighGUI windows must be used from one thread.
+    '''
+    kEndOfStream = None
+    kPollInterval = 0.1
+
+    def __init__(self, camera, queue_depths=4):
+        self.camera = camera
+        if isinstance(queue_depths, int):
+            queue_depths = [queue_depths] * 4
+        if len(queue_depths) != 4:
+            raise ValueError("queue_depths needs one depth per stage queue (4), got {}".format(queue_depths))
+
+        ## decoded, detected, classified and tracked frames
+        self.queues = [queue.Queue(maxsize=depth) for depth in queue_depths]
+        self.stop_event = threading.Event()
+        self.errors = list()
+        self.threads = list()
+
+    def run(self, render_function):
+        '''
+        :param render_function: called with each frame in order, returns False to stop
+        :return: number of rendered frames
+        '''
+        stages = [(lambda frame: [self.camera.process_detection(frame)], None, "process_detection"),
+                  (self.camera.classify_frames, self.camera.flush_classification, "classify_frames"),
+                  (lambda frame: [self.camera.process_tracking(frame)], None, "process_tracking")]
+
+        self.threads.append(threading.Thread(target=self.run_decode_stage,
+                                             args=(self.queues[0],),
+                                             name="decode"))
+        for stage_idx, (stage_function, flush_function, stage_name) in enumerate(stages):
+            self.threads.append(threading.Thread(target=self.run_stage,
+                                                 args=(stage_function,
+                                                       flush_function,
+                                                       self.queues[stage_idx],
+                                                       self.queues[stage_idx + 1]),
+                                                 name=stage_name))
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+        nFrame = 0
+        try:
+            while True:
+                frame = self.get(self.queues[-1])
+                if frame is self.kEndOfStream:
+                    break
+                nFrame = nFrame + 1
+                if not render_function(frame):
+                    break
+        finally:
+            self.stop()
+
+        if len(self.errors) != 0:
+            raise self.errors[0]
+        return nFrame
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+    #################################################
+    ## Stage workers
+    #################################################
+    def run_decode_stage(self, output_queue):
+        try:
+            for frame in self.camera.read_frames():
+                if not self.put(output_queue, frame):
+                    return
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            self.put(output_queue, self.kEndOfStream)
+
+    def run_stage(self, stage_function, flush_function, input_queue, output_queue):
+        try:
+            while True:
+                frame = self.get(input_queue)
+                if frame is self.kEndOfStream:
+                    break
+                if not self.put_all(output_queue, stage_function(frame)):
+                    return
+            if flush_function is not None and not self.stop_event.is_set():
+                self.put_all(output_queue, flush_function())
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            self.put(output_queue, self.kEndOfStream)
+
+    #################################################
+    ## Queue helpers that give up once the pipeline is stopped
+    #################################################
+    def put(self, output_queue, item):
+        while True:
+            try:
+                output_queue.put(item, timeout=self.kPollInterval)
+                return True
+            except queue.Full:
+                if self.stop_event.is_set():
+                    return False
+
+    def put_all(self, output_queue, items):
+        for item in items:
+            if not self.put(output_queue, item):
+                return False
+        return True
+
+    def get(self, input_queue):
+        while True:
+            try:
+                return input_queue.get(timeout=self.kPollInterval)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return self.kEndOfStream
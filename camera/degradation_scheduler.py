@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+class DegradationScheduler(object):
+    '''
+    Keeps a live stream real-time by shedding load in steps when frames exceed their latency budget:
+        level 0 : full processing
+        level 1 : no overlay drawing
+        level 2 : + SSD occlusion handling only on every occlusion_interval-th frame
+        level 3 : + frames are dropped while the stream is more than one budget behind
+                  (at most kMaxConsecutiveDrops in a row, so that the latency keeps being measured)
+    The level moves up when the smoothed frame latency is over budget and back down when it is
+    well under it, holding each level for at least kHoldFrames frames.
+    '''
+    kLevelNames = ["full", "no overlay", "deferred occlusion", "frame dropping"]
+    kSmoothing = 0.2
+    kRecoverRatio = 0.7
+    kHoldFrames = 10
+    kMaxConsecutiveDrops = 4
+
+    def __init__(self, frame_budget, occlusion_interval=4, max_level=3):
+        self.frame_budget = frame_budget        # seconds per frame
+        self.occlusion_interval = max(1, occlusion_interval)
+        self.max_level = min(max_level, len(self.kLevelNames) - 1)
+
+        self.lock = threading.Lock()
+        self.level = 0
+        self.smoothed_latency_ = 0.0
+        self.frames_at_level_ = 0
+        self.stream_start_ = None
+        self.level_counts_ = [0] * len(self.kLevelNames)
+        self.dropped_frames_ = 0
+        self.consecutive_drops_ = 0
+        self.deferred_occlusions_ = 0
+
+    #################################################
+    ## Decisions
+    #################################################
+    def drop_frame(self, frame_index):
+        ## Called for every decoded frame, True if it should be skipped entirely
+        now = time.time()
+        with self.lock:
+            if self.stream_start_ is None:
+                self.stream_start_ = now - frame_index * self.frame_budget
+            lag = now - (self.stream_start_ + frame_index * self.frame_budget)
+            if self.level >= 3 and lag > self.frame_budget and self.consecutive_drops_ < self.kMaxConsecutiveDrops:
+                self.dropped_frames_ += 1
+                self.consecutive_drops_ += 1
+                return True
+            self.consecutive_drops_ = 0
+            return False
+
+    def draw_overlay(self):
+        return self.level < 1
+
+    def handle_occlusion(self, frame_index):
+        if self.level < 2 or frame_index % self.occlusion_interval == 0:
+            return True
+        with self.lock:
+            self.deferred_occlusions_ += 1
+        return False
+
+    #################################################
+    ## Feedback
+    #################################################
+    def frame_done(self, frame_latency):
+        with self.lock:
+            self.level_counts_[self.level] += 1
+            self.smoothed_latency_ += self.kSmoothing * (frame_latency - self.smoothed_latency_)
+            self.frames_at_level_ += 1
+            if self.frames_at_level_ < self.kHoldFrames:
+                return
+
+            if self.smoothed_latency_ > self.frame_budget and self.level < self.max_level:
+                self.level += 1
+                self.frames_at_level_ = 0
+            elif self.smoothed_latency_ < self.kRecoverRatio * self.frame_budget and self.level > 0:
+                self.level -= 1
+                self.frames_at_level_ = 0
+
+    def report(self):
+        lines = list()
+        for level, level_name in enumerate(self.kLevelNames[:self.max_level + 1]):
+            lines.append("level {} ({:<18}): {} frames".format(level, level_name, self.level_counts_[level]))
+        lines.append("dropped frames: {}, deferred occlusion handlings: {}".format(self.dropped_frames_,
+                                                                                  self.deferred_occlusions_))
+        return lines
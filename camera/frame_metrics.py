@@ -0,0 +1,147 @@
+import json
+import os
+import time
+import numpy as np
+
+
+class MetricsSink(object):
+    ## Receives one record per processed frame
+    enabled = True
+
+    def write(self, record):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullMetricsSink(MetricsSink):
+    ## Disables the instrumentation: stages are not even timed
+    enabled = False
+
+
+class JsonlMetricsSink(MetricsSink):
+    ## One JSON line per frame, @append continues the file of a resumed session
+    def __init__(self, path, append=False):
+        self.output_file = open(path, "a" if append else "w", buffering=1)
+
+    def write(self, record):
+        self.output_file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.output_file.close()
+
+
+class PrometheusMetricsSink(MetricsSink):
+    '''
+    Latency histograms of every stage plus frame and object counters, in the Prometheus
+    text exposition format. The file is rewritten (atomically) every @interval seconds,
+    e.g. for the textfile collector of node_exporter.
+    '''
+    kBuckets = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+    def __init__(self, path, interval=10.0, buckets=None):
+        self.path = path
+        self.interval = interval
+        self.buckets = np.array(buckets if buckets is not None else self.kBuckets)
+        self.bucket_counts_ = dict()    # stage -> cumulative counts, one per bucket + "+Inf"
+        self.latency_sums_ = dict()
+        self.object_totals_ = dict()
+        self.last_objects_ = dict()
+        self.frame_count_ = 0
+        self.last_flush_ = time.time()
+
+    def write(self, record):
+        self.frame_count_ += 1
+        for stage, stage_ms in record['stages_ms'].items():
+            if stage not in self.bucket_counts_:
+                self.bucket_counts_[stage] = np.zeros(len(self.buckets) + 1, dtype=np.int64)
+                self.latency_sums_[stage] = 0.0
+            latency = stage_ms / 1000.0
+            ## the histogram is cumulative: every bucket with le >= latency is incremented
+            self.bucket_counts_[stage][np.searchsorted(self.buckets, latency):] += 1
+            self.latency_sums_[stage] += latency
+        for kind in ['candidates', 'blobs', 'tracks']:
+            self.object_totals_[kind] = self.object_totals_.get(kind, 0) + record[kind]
+            self.last_objects_[kind] = record[kind]
+
+        if time.time() - self.last_flush_ >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush_ = time.time()
+        lines = ["# HELP vehicle_stage_latency_seconds Processing time of a frame in each stage",
+                 "# TYPE vehicle_stage_latency_seconds histogram"]
+        for stage, counts in self.bucket_counts_.items():
+            for le, count in zip(self.buckets, counts):
+                lines.append('vehicle_stage_latency_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, le, count))
+            lines.append('vehicle_stage_latency_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(stage, counts[-1]))
+            lines.append('vehicle_stage_latency_seconds_sum{{stage="{}"}} {}'.format(stage, self.latency_sums_[stage]))
+            lines.append('vehicle_stage_latency_seconds_count{{stage="{}"}} {}'.format(stage, counts[-1]))
+
+        lines += ["# HELP vehicle_frames_total Processed frames",
+                  "# TYPE vehicle_frames_total counter",
+                  "vehicle_frames_total {}".format(self.frame_count_),
+                  "# HELP vehicle_objects_total Candidates, occlusion blobs and tracks summed over the frames",
+                  "# TYPE vehicle_objects_total counter"]
+        for kind, total in self.object_totals_.items():
+            lines.append('vehicle_objects_total{{kind="{}"}} {}'.format(kind, total))
+        lines += ["# HELP vehicle_frame_objects Candidates, occlusion blobs and tracks of the last frame",
+                  "# TYPE vehicle_frame_objects gauge"]
+        for kind, count in self.last_objects_.items():
+            lines.append('vehicle_frame_objects{{kind="{}"}} {}'.format(kind, count))
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        self.flush()
+
+
+class FrameInstrumentation(object):
+    '''
+    Times the stages of each frame into FramePacket.stage_times and hands one record per frame
+    to the sinks. Without an enabled sink, start()/stop() return at once and nothing is recorded.
+        stage_start = instrumentation.start()
+        ...
+        stage_start = instrumentation.stop(frame, "detection", stage_start)   # chains to the next stage
+    '''
+    def __init__(self, sinks=None):
+        self.sinks = [sink for sink in (sinks or []) if sink.enabled]
+        self.enabled = len(self.sinks) != 0
+
+    def start(self):
+        if not self.enabled:
+            return 0.0
+        return time.perf_counter()
+
+    def stop(self, frame, stage, stage_start):
+        ## Adds the time since @stage_start to the stage (stages may be timed in several parts)
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        frame.stage_times[stage] = frame.stage_times.get(stage, 0.0) + (now - stage_start)
+        return now
+
+    def emit(self, frame):
+        if not self.enabled:
+            return
+        stages_ms = dict((stage, 1000.0 * stage_time) for stage, stage_time in frame.stage_times.items())
+        record = {
+            'frame_index' : frame.frame_index,
+            'frame_name' : frame.frame_name,
+            'stages_ms' : stages_ms,
+            'total_ms' : sum(stages_ms.values()),
+            'candidates' : len(frame.detected_vehicle_candidate),
+            'blobs' : frame.occlusion_blob_count,
+            'tracks' : len(frame.result_vehicles),
+            'pinned_crop_bytes' : frame.pinned_crop_bytes
+        }
+        for sink in self.sinks:
+            sink.write(record)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
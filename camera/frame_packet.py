@@ -0,0 +1,22 @@
+import time
+
+
+class FramePacket(object):
+    ## Everything produced for one frame while it moves through the processing stages
+    def __init__(self, frame_index, frame_name, input_image, background, foreground):
+        self.frame_index = frame_index
+        self.frame_name = frame_name
+        self.input_image = input_image
+        self.background = background
+        self.foreground = foreground
+        self.arrival_time = time.time()
+
+        self.detected_vehicle_candidate = list()    # after detection & OZ filtering
+        self.detected_vehicles = list()             # after classification & occlusion handling
+        self.result_vehicles = list()               # drawn on input_image
+        self.occlusion_blob_count = 0
+        self.pinned_crop_bytes = 0                  # frame buffers held by the crops of the tracks
+        self.checkpoint_snapshot = None             # session snapshot taken after tracking this frame
+
+        ## Seconds spent in each stage, filled only when the camera is instrumented
+        self.stage_times = dict()
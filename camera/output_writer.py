@@ -0,0 +1,149 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2 as cv
+
+
+class OutputWriter(object):
+    '''
+    Writes annotated frames off the processing thread:
+    frames go through a bounded queue to a writer thread which appends them to the MJPG video
+    (VideoWriter needs them in order) and hands the per-frame image export to a pool of
+    encoders (cv.imwrite releases the GIL), named after the input frames so the files stay in order.
+    When the queue is full, the "block" policy makes write() wait (backpressure) while the
+    "drop" policy skips the frame and counts it.
+    The output size follows the first frame unless @output_size is given.
+    drain() waits until every frame written so far has reached the video and image files.
+    '''
+    kStop = None
+
+    def __init__(self, video_path=None, image_dir=None, image_format="jpg", fps=30, output_size=None,
+                 queue_depth=16, num_workers=2, policy="block"):
+        if policy not in ["block", "drop"]:
+            raise ValueError("Unknown output policy {}".format(policy))
+        self.video_path = video_path
+        self.image_dir = image_dir
+        self.image_format = image_format
+        self.fps = fps
+        self.output_size = tuple(output_size) if output_size is not None else None
+        self.num_workers = max(1, num_workers)
+        self.policy = policy
+
+        self.video_writer_ = None
+        self.frames = queue.Queue(maxsize=max(1, queue_depth))
+        self.written_frames_ = 0
+        self.dropped_frames_ = 0
+        self.error_ = None
+
+        if self.image_dir is not None and not os.path.isdir(self.image_dir):
+            os.makedirs(self.image_dir)
+        self.image_encoders_ = ThreadPoolExecutor(max_workers=self.num_workers) if self.image_dir is not None else None
+        self.pending_images_ = deque()
+        self.thread = threading.Thread(target=self.run, name="output writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    @staticmethod
+    def segment_path(video_path, first_frame_index):
+        ## output.avi -> output_0001000.avi, the video of the frames from @first_frame_index on
+        root, extension = os.path.splitext(video_path)
+        return "{}_{:07d}{}".format(root, first_frame_index, extension)
+
+    def write(self, frame_name, output_frame):
+        ''':return: False if the frame was dropped'''
+        if self.error_ is not None:
+            raise self.error_
+        if self.policy == "block":
+            self.frames.put((frame_name, output_frame))
+            return True
+        try:
+            self.frames.put_nowait((frame_name, output_frame))
+            return True
+        except queue.Full:
+            self.dropped_frames_ += 1
+            return False
+
+    def drain(self):
+        ## Blocks until the queued frames are written, e.g. before a session checkpoint
+        drained = threading.Event()
+        self.frames.put(drained)
+        drained.wait()
+        if self.error_ is not None:
+            raise self.error_
+
+    def close(self):
+        ## Writes the queued frames, then releases the video
+        self.frames.put(self.kStop)
+        self.thread.join()
+        if self.image_encoders_ is not None:
+            self.image_encoders_.shutdown(wait=True)
+        if self.error_ is not None:
+            raise self.error_
+
+    #################################################
+    ## Writer thread
+    #################################################
+    def run(self):
+        try:
+            while True:
+                item = self.frames.get()
+                if item is self.kStop:
+                    break
+                if isinstance(item, threading.Event):
+                    self.wait_for_images()
+                    item.set()
+                    continue
+                frame_name, output_frame = item
+                self.write_frame(frame_name, output_frame)
+            self.wait_for_images()
+        except Exception as e:
+            self.error_ = e
+            ## keep consuming so that a blocked write() or drain() returns
+            item = self.frames.get()
+            while item is not self.kStop:
+                if isinstance(item, threading.Event):
+                    item.set()
+                item = self.frames.get()
+        finally:
+            if self.video_writer_ is not None:
+                self.video_writer_.release()
+                self.video_writer_ = None
+
+    def write_frame(self, frame_name, output_frame):
+        frame_size = (output_frame.shape[1], output_frame.shape[0])
+        if self.output_size is None:
+            self.output_size = frame_size
+        ## VideoWriter silently drops frames of another size
+        if frame_size != self.output_size:
+            output_frame = cv.resize(output_frame, self.output_size)
+
+        if self.video_path is not None:
+            if self.video_writer_ is None:
+                self.video_writer_ = cv.VideoWriter(self.video_path,
+                                                    cv.VideoWriter_fourcc('M','J','P','G'),
+                                                    self.fps,
+                                                    self.output_size)
+            self.video_writer_.write(output_frame)
+
+        if self.image_encoders_ is not None:
+            ## bounded number of frames waiting for their encoder
+            while len(self.pending_images_) >= 2 * self.num_workers:
+                self.pending_images_.popleft().result()
+            image_path = os.path.join(self.image_dir,
+                                      os.path.splitext(str(frame_name))[0] + "." + self.image_format)
+            self.pending_images_.append(self.image_encoders_.submit(self.write_image, image_path, output_frame))
+        self.written_frames_ += 1
+
+    def wait_for_images(self):
+        while len(self.pending_images_) != 0:
+            self.pending_images_.popleft().result()
+
+    @staticmethod
+    def write_image(image_path, output_frame):
+        if not cv.imwrite(image_path, output_frame):
+            raise IOError("Cannot write {}".format(image_path))
+
+    def statistics_message(self):
+        return "{} frames written, {} dropped".format(self.written_frames_, self.dropped_frames_)
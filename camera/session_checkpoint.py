@@ -0,0 +1,72 @@
+import os
+import pickle
+
+
+class SessionCheckpoint(object):
+    '''
+    Periodic snapshot of a long-running Camera session, from which it can be resumed after a crash:
+        dataset_name, frame_index           last tracked frame, the session resumes at frame_index + 1
+        last_tracked_frame_index            frame gap of the tracker on the first resumed frame
+        vehicles                            live tracks, copied without their image crops
+        counter                             VehicleCounter totals and time-bucketed statistics
+    The statistics sinks are flushed before each snapshot, so the rows of the buckets it has emitted
+    are on disk; a resumed session skips them and the rows flushed after the snapshot.
+    The snapshot is pickled to a temporary file and renamed over @path, so that a crash while
+    saving leaves the previous snapshot intact. The state is serialized when its frame is tracked
+    (the tracks share their histories with the live ones) but written only once the frame is
+    rendered, so is_due() counts from the last serialized state.
+    '''
+    kVersion = 2
+
+    def __init__(self, path, interval=1000):
+        self.path = path
+        self.interval = max(1, interval)       # in frames
+        self.last_due_frame_index_ = None
+        self.last_saved_frame_index_ = None
+        self.saved_count_ = 0
+
+    def is_due(self, frame_index):
+        ## True once every @interval frames: the state of @frame_index is expected next
+        if self.last_due_frame_index_ is None:
+            due = frame_index + 1 >= self.interval
+        else:
+            due = frame_index - self.last_due_frame_index_ >= self.interval
+        if due:
+            self.last_due_frame_index_ = frame_index
+        return due
+
+    def serialize(self, state):
+        ## :return: (frame index, pickled state), a point-in-time copy to be written later
+        state = dict(state, version=self.kVersion)
+        return state["frame_index"], pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def write(self, snapshot):
+        frame_index, data = snapshot
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+        self.last_saved_frame_index_ = frame_index
+        self.saved_count_ += 1
+
+    def save(self, state):
+        self.write(self.serialize(state))
+
+    def load(self):
+        '''
+        :return: the saved state or None when there is no snapshot yet
+        '''
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != self.kVersion:
+            raise ValueError("Checkpoint {} has version {}, expected {}".format(self.path,
+                                                                              state.get("version"),
+                                                                              self.kVersion))
+        self.last_due_frame_index_ = state["frame_index"]
+        self.last_saved_frame_index_ = state["frame_index"]
+        return state
+
+    def statistics_message(self):
+        return "{} snapshots saved, last at frame {}".format(self.saved_count_, self.last_saved_frame_index_)
@@ -0,0 +1,76 @@
+import cv2 as cv
+import numpy as np
+
+
+class ZoneLabelMap(object):
+    '''
+    Observation zones rasterized once into an int label image of the frame size.
+    Pixel value is the oz_index of the first zone (in config order) containing the pixel,
+    or -1 outside every zone, the same as testing the zones in order with
+    cv.pointPolygonTest(oz_region, point, False) >= 0 and stopping at the first hit.
+    '''
+    def __init__(self, observation_zones, frame_shape):
+        self.frame_shape = tuple(frame_shape[:2])
+        height, width = self.frame_shape
+        self.label_image = np.full((height, width), -1, dtype=np.int16)
+
+        ys, xs = np.mgrid[0:height, 0:width]
+        ## Paint the zones backwards so that earlier zones overwrite later ones
+        for observation_zone in reversed(observation_zones):
+            inside = self.inside_polygon(xs, ys, observation_zone.oz_region)
+            self.label_image[inside] = observation_zone.oz_index
+
+    @staticmethod
+    def inside_polygon(xs, ys, polygon):
+        ## Even-odd rule plus an exact on-edge test, in integer arithmetic on the pixel grid
+        polygon = np.asarray(polygon, dtype=np.int64).reshape(-1, 2)
+        xs = xs.astype(np.int64)
+        ys = ys.astype(np.int64)
+        inside = np.zeros(xs.shape, dtype=bool)
+        on_edge = np.zeros(xs.shape, dtype=bool)
+
+        for vertex_idx in range(len(polygon)):
+            x1, y1 = polygon[vertex_idx]
+            x2, y2 = polygon[(vertex_idx + 1) % len(polygon)]
+            cross = (x2 - x1) * (ys - y1) - (y2 - y1) * (xs - x1)
+            on_edge |= (cross == 0) \
+                       & (np.minimum(x1, x2) <= xs) & (xs <= np.maximum(x1, x2)) \
+                       & (np.minimum(y1, y2) <= ys) & (ys <= np.maximum(y1, y2))
+
+            ## The edge crosses the horizontal ray going right from the pixel
+            if y1 != y2:
+                straddles = (y1 > ys) != (y2 > ys)
+                right_of_pixel = (cross > 0) if y2 > y1 else (cross < 0)
+                inside ^= straddles & right_of_pixel
+        return inside | on_edge
+
+    def bounding_region(self, margin=0):
+        ## (x,y,w,h) of the union of the zones grown by @margin pixels, clipped to the frame
+        ys, xs = np.nonzero(self.label_image >= 0)
+        if xs.shape[0] == 0:
+            return (0, 0, 0, 0)
+        height, width = self.frame_shape
+        x0 = max(0, int(xs.min()) - margin)
+        y0 = max(0, int(ys.min()) - margin)
+        x1 = min(width, int(xs.max()) + 1 + margin)
+        y1 = min(height, int(ys.max()) + 1 + margin)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def zone_mask(self, margin=0):
+        ## uint8 mask (255 inside) of the union of the zones grown by @margin pixels
+        mask = np.where(self.label_image >= 0, 255, 0).astype(np.uint8)
+        if margin > 0:
+            mask = cv.dilate(mask, cv.getStructuringElement(cv.MORPH_ELLIPSE, (2 * margin + 1, 2 * margin + 1)))
+        return mask
+
+    def lookup(self, points):
+        '''
+        :param points: (nPoints, 2) array of (x,y)
+        :return: (nPoints,) oz_index of each point, -1 when outside every zone or the frame
+        '''
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        height, width = self.frame_shape
+        in_frame = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        labels = np.full(points.shape[0], -1, dtype=np.int64)
+        labels[in_frame] = self.label_image[points[in_frame, 1], points[in_frame, 0]]
+        return labels
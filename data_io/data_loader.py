@@ -1,4 +1,7 @@
 import cv2 as cv
+from data_io.frame_sequence_reader import FrameSequenceReader
+from data_io.packed_dataset import PackedDataset, PackedDatasetReader
+from data_io.video_stream_reader import SynchronizedVideoReader
 
 
 class DataLoader(object):
@@ -29,4 +32,20 @@ class DataLoader(object):
 
         return cap_bg, cap_fg, cap_im
 
+    def init_frame_reader(self, num_workers=4, prefetch_depth=8, rebuild_manifest=False):
+        return FrameSequenceReader(dataset_dir=self.data_dir + "/" + self.dataset_name,
+                                   num_workers=num_workers,
+                                   prefetch_depth=prefetch_depth,
+                                   rebuild_manifest=rebuild_manifest)
+
+    def init_video_reader(self, prefetch_depth=8, loop=False):
+        ## im.mp4, bg.mp4 and fg.mp4 decoded in parallel and kept frame-aligned
+        return SynchronizedVideoReader(dataset_dir=self.data_dir + "/" + self.dataset_name,
+                                       prefetch_depth=prefetch_depth,
+                                       loop=loop)
+
+    def init_packed_reader(self):
+        ## Packed with: python -m data_io.packed_dataset --data <dataset_name>
+        return PackedDatasetReader(self.data_dir + "/" + self.dataset_name + "/" + PackedDataset.kFileName)
+
 
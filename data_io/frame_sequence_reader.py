@@ -0,0 +1,96 @@
+import os
+import collections
+import cv2 as cv
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FrameSequenceReader(object):
+    '''
+    Reads the im/bg/fg PNG sequences of a dataset in strict frame order.
+    The sorted frame list is kept in a manifest file next to the sequences, so the
+    (possibly huge) im/ directory is listed only once. Frames are decoded ahead of
+    the consumer by a thread pool (cv.imread releases the GIL).
+    '''
+    kManifestName = "manifest.txt"
+
+    def __init__(self, dataset_dir, num_workers=4, prefetch_depth=8, rebuild_manifest=False):
+        self.dataset_dir = dataset_dir
+        self.num_workers = num_workers
+        self.prefetch_depth = max(1, prefetch_depth)
+        self.manifest_path = os.path.join(self.dataset_dir, self.kManifestName)
+        self.frame_names = self.load_manifest() if not rebuild_manifest else None
+        if self.frame_names is None:
+            self.frame_names = self.build_manifest()
+
+    def __len__(self):
+        return len(self.frame_names)
+
+    #################################################
+    ## Manifest
+    #################################################
+    @staticmethod
+    def frame_sort_key(frame_name):
+        ## numeric names are sorted by value, so 10.png comes after 9.png
+        stem = os.path.splitext(frame_name)[0]
+        if stem.isdigit():
+            return (0, int(stem), frame_name)
+        return (1, 0, frame_name)
+
+    def load_manifest(self):
+        if not os.path.isfile(self.manifest_path):
+            return None
+        with open(self.manifest_path) as manifest_file:
+            return [line.strip() for line in manifest_file if line.strip()]
+
+    def build_manifest(self):
+        with os.scandir(os.path.join(self.dataset_dir, "im")) as entries:
+            frame_names = sorted((entry.name for entry in entries if entry.is_file()),
+                                 key=self.frame_sort_key)
+
+        ## Write to a temporary file first so that a killed process never leaves a partial manifest
+        try:
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w") as manifest_file:
+                manifest_file.write("\n".join(frame_names) + "\n")
+            os.replace(tmp_path, self.manifest_path)
+        except OSError:
+            pass    # read-only dataset: keep the manifest in memory only
+        return frame_names
+
+    #################################################
+    ## Decoding
+    #################################################
+    def decode_frame(self, frame_name, read_background):
+        input_image = cv.imread(os.path.join(self.dataset_dir, "im", frame_name))
+        background = cv.imread(os.path.join(self.dataset_dir, "bg", frame_name)) if read_background else None
+        foreground = cv.imread(os.path.join(self.dataset_dir, "fg", frame_name), cv.IMREAD_GRAYSCALE)
+        return input_image, background, foreground
+
+    def read_frames(self, start_index=0, read_background=True):
+        '''
+        yields (frame_index, frame_name, input_image, background, foreground) in manifest order,
+        stops at the first frame with a missing or unreadable image
+        '''
+        executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        pending = collections.deque()
+        next_index = start_index
+        try:
+            while True:
+                ## Keep prefetch_depth frames in flight
+                while len(pending) < self.prefetch_depth and next_index < len(self.frame_names):
+                    frame_name = self.frame_names[next_index]
+                    pending.append((next_index, frame_name,
+                                    executor.submit(self.decode_frame, frame_name, read_background)))
+                    next_index += 1
+                if len(pending) == 0:
+                    return
+
+                frame_index, frame_name, future = pending.popleft()
+                input_image, background, foreground = future.result()
+                if input_image is None or foreground is None or (read_background and background is None):
+                    return
+                yield frame_index, frame_name, input_image, background, foreground
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -0,0 +1,160 @@
+import json
+import os
+import struct
+import argparse
+import numpy as np
+from data_io.frame_sequence_reader import FrameSequenceReader
+
+
+class PackedDataset(object):
+    '''
+    Fixed-stride raw container of the im/bg/fg sequences of a dataset.
+
+    Layout:
+        magic (8 bytes) | header length (uint64, little endian) | JSON header | padding
+        frame 0: im | bg | fg
+        frame 1: im | bg | fg
+        ...
+    The JSON header holds the frame count, the offset of the frame data, the frame names
+    and the shape/dtype of each stream. Frame data starts at a page-aligned offset so that
+    it can be memory-mapped directly.
+    '''
+    kMagic = b"PVDPACK1"
+    kPageSize = 4096
+    kStreams = ("im", "bg", "fg")
+    kFileName = "frames.pack"
+
+    @staticmethod
+    def frame_dtype(streams):
+        ## one record per frame, one sub-array per stream
+        return np.dtype([(stream["name"], np.dtype(stream["dtype"]), tuple(stream["shape"]))
+                         for stream in streams])
+
+    @classmethod
+    def encode_header(cls, header, header_size=None):
+        header_bytes = json.dumps(header).encode("utf-8")
+        if header_size is None:
+            prefix_size = len(cls.kMagic) + 8 + len(header_bytes)
+            header_size = (prefix_size + cls.kPageSize - 1) // cls.kPageSize * cls.kPageSize
+        padding = header_size - len(cls.kMagic) - 8 - len(header_bytes)
+        if padding < 0:
+            raise ValueError("Packed header does not fit in {} bytes".format(header_size))
+        return cls.kMagic + struct.pack("<Q", len(header_bytes)) + header_bytes + b" " * padding
+
+    @classmethod
+    def decode_header(cls, packed_file):
+        if packed_file.read(len(cls.kMagic)) != cls.kMagic:
+            raise IOError("Not a packed dataset: {}".format(packed_file.name))
+        header_length = struct.unpack("<Q", packed_file.read(8))[0]
+        return json.loads(packed_file.read(header_length).decode("utf-8"))
+
+
+class PackedDatasetWriter(object):
+    ## Converts the PNG sequences of a dataset into a PackedDataset file
+    def __init__(self, dataset_dir, num_workers=4, prefetch_depth=16):
+        self.dataset_dir = dataset_dir
+        self.frame_reader = FrameSequenceReader(dataset_dir=dataset_dir,
+                                                num_workers=num_workers,
+                                                prefetch_depth=prefetch_depth)
+
+    def pack(self, output_path=None):
+        if output_path is None:
+            output_path = os.path.join(self.dataset_dir, PackedDataset.kFileName)
+
+        ## Room for the header of all frames of the manifest, the final count can only be lower
+        header = {"frame_count": len(self.frame_reader), "data_offset": 1 << 48,
+                  "frame_names": self.frame_reader.frame_names,
+                  "streams": [{"name": name, "shape": [1 << 16] * 3, "dtype": "|u1"}
+                              for name in PackedDataset.kStreams]}
+        header_size = len(PackedDataset.encode_header(header))
+
+        frame_names = list()
+        streams = None
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as packed_file:
+            packed_file.seek(header_size)
+            for _, frame_name, input_image, background, foreground in self.frame_reader.read_frames():
+                images = (input_image, background, foreground)
+                if streams is None:
+                    streams = [{"name": name, "shape": list(image.shape), "dtype": image.dtype.str}
+                               for name, image in zip(PackedDataset.kStreams, images)]
+                for stream, image in zip(streams, images):
+                    if list(image.shape) != stream["shape"] or image.dtype.str != stream["dtype"]:
+                        raise ValueError("Frame {} of stream {} has shape {} instead of {}".format(
+                            frame_name, stream["name"], image.shape, stream["shape"]))
+                    packed_file.write(np.ascontiguousarray(image).tobytes())
+                frame_names.append(frame_name)
+
+            if streams is None:
+                raise IOError("No frame to pack in {}".format(self.dataset_dir))
+            header = {"frame_count": len(frame_names), "data_offset": header_size,
+                      "frame_names": frame_names, "streams": streams}
+            packed_file.seek(0)
+            packed_file.write(PackedDataset.encode_header(header, header_size))
+
+        os.replace(tmp_path, output_path)
+        return output_path
+
+
+class PackedDatasetReader(object):
+    '''
+    Memory-maps a PackedDataset read-only. The input image of each frame is copied, as it
+    is drawn on; the background and foreground are zero-copy views of the map, so they are
+    read-only and must be copied before being modified.
+    A copy-on-write map would keep a private copy of every drawn page alive as long as the map.
+    '''
+    def __init__(self, packed_path):
+        self.packed_path = packed_path
+        with open(packed_path, "rb") as packed_file:
+            self.header = PackedDataset.decode_header(packed_file)
+
+        self.frame_names = self.header["frame_names"]
+        self.frames = np.memmap(packed_path,
+                                dtype=PackedDataset.frame_dtype(self.header["streams"]),
+                                mode="r",
+                                offset=self.header["data_offset"],
+                                shape=(self.header["frame_count"],))
+
+    def __len__(self):
+        return len(self.frame_names)
+
+    def read_frames(self, start_index=0, read_background=True):
+        '''
+        yields (frame_index, frame_name, input_image, background, foreground) like FrameSequenceReader
+        '''
+        for frame_index in range(start_index, len(self.frame_names)):
+            frame = self.frames[frame_index]
+            yield (frame_index,
+                   self.frame_names[frame_index],
+                   np.array(frame["im"]),
+                   frame["bg"] if read_background else None,
+                   frame["fg"])
+
+
+## Packs the PNG sequences of a dataset:
+##   python -m data_io.packed_dataset --data PVD01
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the im/bg/fg sequences of a dataset')
+    parser.add_argument(
+        '--data',
+        metavar='data',
+        nargs='+',
+        default=['PVD01'],
+        help='Input the dataset codenames')
+    parser.add_argument(
+        '--data-dir',
+        metavar='data_dir',
+        default='data_',
+        help='Directory of the datasets')
+    parser.add_argument(
+        '--workers',
+        metavar='workers',
+        type=int,
+        default=4,
+        help='Number of decoding threads')
+    args = parser.parse_args()
+
+    for dataset_name in args.data:
+        writer = PackedDatasetWriter(dataset_dir=args.data_dir + "/" + dataset_name,
+                                     num_workers=args.workers)
+        print("Packed {}".format(writer.pack()))
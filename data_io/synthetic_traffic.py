@@ -0,0 +1,394 @@
+import argparse
+import os
+import cv2 as cv
+import numpy as np
+from data_io.io_util import IOUtil
+from vehicle.vehicle_properties import VehicleType
+
+
+class SyntheticVehicle(object):
+    def __init__(self, track_id, lane, vehicle_type, size, position, color):
+        self.track_id = track_id
+        self.lane = lane
+        self.vehicle_type = vehicle_type
+        self.size = size                # (w,h)
+        self.position = position        # center (x,y), floats
+        self.color = color
+
+    def box(self):
+        ## (x,y,w,h) of the vehicle
+        w, h = self.size
+        return (int(round(self.position[0] - w / 2.0)), int(round(self.position[1] - h / 2.0)), w, h)
+
+
+class SyntheticTraffic(object):
+    '''
+    Renders traffic of moving ellipse or rectangle vehicles on vertical lanes, as the
+    im/bg/fg sequences of a dataset plus ground truth, for load and scaling tests.
+    Lanes of the left half drive down and lanes of the right half drive up, each
+    half is one observation zone. The scene keeps about @n_vehicles vehicles on screen:
+    a vehicle leaving the frame is counted and a new one enters on a lane whose entry is free.
+    The vehicles of the first frame are placed on free stretches of their lane as well, so
+    only glued vehicles overlap. A lane holds a limited number of vehicles: when the lanes
+    cannot keep @n_vehicles on screen, the density actually achieved is reported.
+    With probability @occlusion_rate a new vehicle is glued to the side of another one
+    (same lane and speed), so their blobs merge into an occlusion blob.
+    Everything is drawn from @seed, so a configuration always renders the same frames.
+    '''
+    ## (w,h) of the vehicle types, jittered by +-15 %
+    kTypeSizes = {
+        VehicleType.Class1 : (14, 24),
+        VehicleType.Class2 : (20, 38),
+        VehicleType.Class3 : (26, 60)
+    }
+    ## minimum gap in pixels between two vehicles of a lane
+    kLaneGap = 4
+    ## random positions tried per vehicle of the first frame
+    kPlacementAttempts = 20
+
+    def __init__(self, n_vehicles=20, n_frames=300, n_lanes=8, speed_range=(2, 6), shape="ellipse",
+                 occlusion_rate=0.0, noise=0.0, image_noise=0.0, size_scale=1.0,
+                 type_weights=(0.6, 0.3, 0.1), frame_size=(640, 360), seed=0):
+        self.n_vehicles = n_vehicles
+        self.n_frames = n_frames
+        self.n_lanes = max(1, n_lanes)
+        self.shape = shape
+        self.occlusion_rate = occlusion_rate
+        self.noise = noise                  # probability of a foreground noise pixel
+        self.image_noise = image_noise      # std of the gaussian noise of the input image
+        self.size_scale = size_scale
+        self.frame_size = frame_size
+        self.rng = np.random.RandomState(seed)
+
+        width, height = frame_size
+        self.lane_width = width / float(self.n_lanes)
+        self.lane_centers = [(lane + 0.5) * self.lane_width for lane in range(self.n_lanes)]
+        ## lanes of the left half drive down (+), the others up (-)
+        self.lane_speeds = [(1 if lane < self.n_lanes // 2 or self.n_lanes == 1 else -1)
+                            * int(self.rng.randint(speed_range[0], speed_range[1] + 1))
+                            for lane in range(self.n_lanes)]
+        self.vehicle_types = [VehicleType.Class1, VehicleType.Class2, VehicleType.Class3]
+        self.type_weights = np.array(type_weights, dtype=np.float64) / np.sum(type_weights)
+
+        self.vehicles_ = list()
+        self.next_track_id_ = 0
+        self.counts_ = dict()               # (zone index, vehicle type) -> vehicles which drove through
+        self.vehicles_per_frame_ = list()   # vehicles on screen of every rendered frame
+        self.background_ = self.render_background()
+
+    #################################################
+    ## Scene
+    #################################################
+    def zone_of_lane(self, lane):
+        return 0 if self.lane_speeds[lane] > 0 else 1
+
+    def observation_zones(self):
+        ## [(direction, [(x,y) x 4])] of the down and up halves, in config.txt order
+        width, height = self.frame_size
+        n_down = sum(1 for speed in self.lane_speeds if speed > 0)
+        split = int(n_down * self.lane_width)
+        zones = list()
+        if n_down > 0:
+            zones.append(("down", [(0, 0), (split - 1, 0), (split - 1, height - 1), (0, height - 1)]))
+        if n_down < self.n_lanes:
+            zones.append(("up", [(split, 0), (width - 1, 0), (width - 1, height - 1), (split, height - 1)]))
+        return zones
+
+    def render_background(self):
+        width, height = self.frame_size
+        background = np.full((height, width, 3), 90, dtype=np.uint8)
+        for lane in range(1, self.n_lanes):
+            x = int(lane * self.lane_width)
+            for y in range(0, height, 30):
+                cv.line(background, (x, y), (x, y + 15), (200, 200, 200), 1)
+        return background
+
+    def new_vehicle(self, lane, y):
+        vehicle_type = self.vehicle_types[self.rng.choice(len(self.vehicle_types), p=self.type_weights)]
+        base_w, base_h = self.kTypeSizes[vehicle_type]
+        jitter = self.rng.uniform(0.85, 1.15)
+        size = (max(4, int(base_w * jitter * self.size_scale)), max(4, int(base_h * jitter * self.size_scale)))
+        color = tuple(int(c) for c in self.rng.randint(30, 255, 3))
+        vehicle = SyntheticVehicle(self.next_track_id_, lane, vehicle_type, size,
+                                   [self.lane_centers[lane], float(y)], color)
+        self.next_track_id_ += 1
+        return vehicle
+
+    def lane_is_free(self, lane, vehicle, y):
+        ## True if @vehicle centered at @y keeps the gap to every vehicle of @lane
+        for other in self.vehicles_:
+            if other.lane == lane and \
+                    abs(other.position[1] - y) < (other.size[1] + vehicle.size[1]) / 2.0 + self.kLaneGap:
+                return False
+        return True
+
+    def lane_entry_is_free(self, lane, vehicle):
+        width, height = self.frame_size
+        entry_y = -vehicle.size[1] / 2.0 if self.lane_speeds[lane] > 0 else height + vehicle.size[1] / 2.0
+        return self.lane_is_free(lane, vehicle, entry_y)
+
+    def spawn(self, initial=False):
+        width, height = self.frame_size
+        lane = int(self.rng.randint(self.n_lanes))
+        speed = self.lane_speeds[lane]
+
+        if len(self.vehicles_) != 0 and self.rng.rand() < self.occlusion_rate:
+            ## glued to the side of a random vehicle: both blobs merge
+            anchor = self.vehicles_[self.rng.randint(len(self.vehicles_))]
+            vehicle = self.new_vehicle(anchor.lane, anchor.position[1] + self.rng.uniform(-0.3, 0.3) * anchor.size[1])
+            side = 1 if self.rng.rand() < 0.5 else -1
+            vehicle.position[0] = anchor.position[0] + side * 0.6 * (anchor.size[0] + vehicle.size[0]) / 2.0
+            self.vehicles_.append(vehicle)
+            return True
+
+        if initial:
+            vehicle = self.new_vehicle(lane, self.rng.uniform(0, height))
+            if not self.lane_is_free(lane, vehicle, vehicle.position[1]):
+                self.next_track_id_ -= 1
+                return False
+        else:
+            vehicle = self.new_vehicle(lane, 0)
+            if not self.lane_entry_is_free(lane, vehicle):
+                self.next_track_id_ -= 1
+                return False
+            vehicle.position[1] = -vehicle.size[1] / 2.0 if speed > 0 else height + vehicle.size[1] / 2.0
+        self.vehicles_.append(vehicle)
+        return True
+
+    def step(self):
+        ## Moves every vehicle, counts those which left the frame and spawns new ones
+        width, height = self.frame_size
+        remaining_vehicles = list()
+        for vehicle in self.vehicles_:
+            vehicle.position[1] += self.lane_speeds[vehicle.lane]
+            if vehicle.position[1] - vehicle.size[1] / 2.0 > height or vehicle.position[1] + vehicle.size[1] / 2.0 < 0:
+                key = (self.zone_of_lane(vehicle.lane), vehicle.vehicle_type)
+                self.counts_[key] = self.counts_.get(key, 0) + 1
+            else:
+                remaining_vehicles.append(vehicle)
+        self.vehicles_ = remaining_vehicles
+
+        for attempt in range(self.n_lanes):
+            if len(self.vehicles_) >= self.n_vehicles:
+                break
+            self.spawn()
+
+    #################################################
+    ## Rendering
+    #################################################
+    def draw_vehicle(self, image, vehicle, color):
+        x, y, w, h = vehicle.box()
+        if self.shape == "rectangle":
+            cv.rectangle(image, (x, y), (x + w - 1, y + h - 1), color, -1)
+        else:
+            center = (int(round(vehicle.position[0])), int(round(vehicle.position[1])))
+            cv.ellipse(image, center, (w // 2, h // 2), 0, 0, 360, color, -1)
+
+    def occluded_track_ids(self):
+        boxes = np.array([vehicle.box() for vehicle in self.vehicles_]).reshape(-1, 4)
+        x0, y0 = boxes[:, 0], boxes[:, 1]
+        x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+        overlap = (np.minimum(x1[:, None], x1[None, :]) > np.maximum(x0[:, None], x0[None, :])) & \
+                  (np.minimum(y1[:, None], y1[None, :]) > np.maximum(y0[:, None], y0[None, :]))
+        np.fill_diagonal(overlap, False)
+        return set(vehicle.track_id for vehicle, occluded in zip(self.vehicles_, overlap.any(axis=1)) if occluded)
+
+    def frames(self):
+        '''
+        yields (input_image, background, foreground, truth) for every frame,
+        truth is a list of (track_id, lane, vehicle type, (x,y,w,h), occluded)
+        '''
+        width, height = self.frame_size
+        for attempt in range(self.n_vehicles * self.kPlacementAttempts):
+            if len(self.vehicles_) >= self.n_vehicles:
+                break
+            self.spawn(initial=True)
+        n_initial_vehicles = len(self.vehicles_)
+
+        for frame_index in range(self.n_frames):
+            input_image = self.background_.copy()
+            foreground = np.zeros((height, width), dtype=np.uint8)
+            for vehicle in self.vehicles_:
+                self.draw_vehicle(input_image, vehicle, vehicle.color)
+                self.draw_vehicle(foreground, vehicle, 255)
+
+            if self.noise > 0:
+                foreground[self.rng.rand(height, width) < self.noise] = 255
+            if self.image_noise > 0:
+                input_image = np.clip(input_image + self.rng.normal(0, self.image_noise, input_image.shape),
+                                      0, 255).astype(np.uint8)
+
+            occluded = self.occluded_track_ids()
+            truth = [(vehicle.track_id, vehicle.lane, vehicle.vehicle_type, vehicle.box(), vehicle.track_id in occluded)
+                     for vehicle in self.vehicles_]
+            self.vehicles_per_frame_.append(len(self.vehicles_))
+            yield input_image, self.background_, foreground, truth
+            self.step()
+
+        achieved_density = self.achieved_density()
+        if achieved_density < self.n_vehicles:
+            IOUtil.print_warning_messages("Synthetic traffic: the {} lanes hold {} of the {} requested vehicles on the "
+                                          "first frame and {:.1f} per frame on average"
+                                          .format(self.n_lanes, n_initial_vehicles, self.n_vehicles, achieved_density))
+
+    def achieved_density(self):
+        ## mean number of vehicles on screen of the rendered frames
+        if len(self.vehicles_per_frame_) == 0:
+            return 0.0
+        return float(np.mean(self.vehicles_per_frame_))
+
+    #################################################
+    ## Dataset
+    #################################################
+    def write_dataset(self, dataset_dir):
+        '''
+        writes im/ bg/ fg/ PNG sequences, config.txt and ground_truth/{tracks.csv, counts.txt}
+        :return: number of written frames
+        '''
+        for stream in ["im", "bg", "fg", "ground_truth"]:
+            stream_dir = os.path.join(dataset_dir, stream)
+            if not os.path.isdir(stream_dir):
+                os.makedirs(stream_dir)
+
+        nFrame = 0
+        with open(os.path.join(dataset_dir, "ground_truth", "tracks.csv"), "w") as tracks_file:
+            tracks_file.write("frame,track_id,lane,zone,type,x,y,w,h,occluded\n")
+            for frame_index, (input_image, background, foreground, truth) in enumerate(self.frames()):
+                frame_name = "{:07d}.png".format(frame_index)
+                cv.imwrite(os.path.join(dataset_dir, "im", frame_name), input_image)
+                cv.imwrite(os.path.join(dataset_dir, "bg", frame_name), background)
+                cv.imwrite(os.path.join(dataset_dir, "fg", frame_name), foreground)
+                for track_id, lane, vehicle_type, (x, y, w, h), occluded in truth:
+                    tracks_file.write("{},{},{},{},{},{},{},{},{},{}\n".format(frame_index, track_id, lane,
+                                                                               self.zone_of_lane(lane),
+                                                                               vehicle_type.name,
+                                                                               x, y, w, h, int(occluded)))
+                nFrame += 1
+
+        self.write_config(os.path.join(dataset_dir, "config.txt"))
+        self.write_counts(os.path.join(dataset_dir, "ground_truth", "counts.txt"))
+        return nFrame
+
+    def write_config(self, path):
+        ## Same layout as parsed by IOUtil.load_observation_zone_config
+        zones = self.observation_zones()
+        with open(path, "w") as f:
+            f.write("run_mode 1\n")
+            f.write("nZones {}\n".format(len(zones)))
+            for zone_index, (direction, points) in enumerate(zones):
+                f.write("zone {}\n".format(zone_index))
+                f.write("direction {}\n".format(direction))
+                f.write("nPoints {}\n".format(len(points)))
+                for x, y in points:
+                    f.write("p {} {}\n".format(x, y))
+                for vehicle_type in range(3):
+                    f.write("\ntype {}\nsize 0 0\ndim 0 0\ndens 0 0\n".format(vehicle_type))
+                f.write("\n")
+
+    def write_counts(self, path):
+        ## "<zone index> <vehicle type> <count>" of the vehicles which drove through the frame
+        with open(path, "w") as f:
+            for zone_index in range(len(self.observation_zones())):
+                for vehicle_type in self.vehicle_types:
+                    f.write("{} {} {}\n".format(zone_index, vehicle_type.name,
+                                                self.counts_.get((zone_index, vehicle_type), 0)))
+
+
+## Writes a synthetic dataset, e.g. 200 vehicles per frame with 10 % glued pairs:
+##   python -m data_io.synthetic_traffic --data SYN200 --vehicles 200 --occlusion-rate 0.1
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic traffic dataset')
+    parser.add_argument(
+        '--data',
+        metavar='data',
+        default='SYN01',
+        help='Codename of the generated dataset')
+    parser.add_argument(
+        '--data-dir',
+        metavar='data_dir',
+        default='data_',
+        help='Directory of the datasets')
+    parser.add_argument(
+        '--vehicles',
+        metavar='vehicles',
+        type=int,
+        default=20,
+        help='Vehicles per frame, capped by the capacity of the lanes')
+    parser.add_argument(
+        '--frames',
+        metavar='frames',
+        type=int,
+        default=300,
+        help='Number of frames')
+    parser.add_argument(
+        '--lanes',
+        metavar='lanes',
+        type=int,
+        default=8,
+        help='Number of lanes, the left half drives down and the right half up')
+    parser.add_argument(
+        '--speed',
+        metavar='speed',
+        type=int,
+        nargs=2,
+        default=[2, 6],
+        help='Range of the lane speeds in pixels per frame')
+    parser.add_argument(
+        '--shape',
+        metavar='shape',
+        default='ellipse',
+        choices=['ellipse', 'rectangle'],
+        help='Shape of the vehicles')
+    parser.add_argument(
+        '--size-scale',
+        metavar='size_scale',
+        type=float,
+        default=1.0,
+        help='Scale of the vehicle sizes')
+    parser.add_argument(
+        '--occlusion-rate',
+        metavar='occlusion_rate',
+        type=float,
+        default=0.0,
+        help='Probability that a new vehicle is glued to another one')
+    parser.add_argument(
+        '--noise',
+        metavar='noise',
+        type=float,
+        default=0.0,
+        help='Probability of a foreground noise pixel')
+    parser.add_argument(
+        '--image-noise',
+        metavar='image_noise',
+        type=float,
+        default=0.0,
+        help='Standard deviation of the gaussian noise of the input images')
+    parser.add_argument(
+        '--size',
+        metavar='size',
+        type=int,
+        nargs=2,
+        default=[640, 360],
+        help='Frame width and height')
+    parser.add_argument(
+        '--seed',
+        metavar='seed',
+        type=int,
+        default=0,
+        help='Random seed')
+    args = parser.parse_args()
+
+    traffic = SyntheticTraffic(n_vehicles=args.vehicles,
+                               n_frames=args.frames,
+                               n_lanes=args.lanes,
+                               speed_range=tuple(args.speed),
+                               shape=args.shape,
+                               occlusion_rate=args.occlusion_rate,
+                               noise=args.noise,
+                               image_noise=args.image_noise,
+                               size_scale=args.size_scale,
+                               frame_size=tuple(args.size),
+                               seed=args.seed)
+    nFrame = traffic.write_dataset(args.data_dir + "/" + args.data)
+    print("Generated {} frames in {}, {:.1f} vehicles per frame".format(nFrame, args.data_dir + "/" + args.data,
+                                                                      traffic.achieved_density()))
@@ -0,0 +1,139 @@
+import queue
+import threading
+import cv2 as cv
+
+
+class VideoStreamDecoder(object):
+    ## Decodes one video file on its own thread into a bounded queue of (position, image)
+    kEndOfStream = None
+    kPollInterval = 0.1
+
+    def __init__(self, video_path, prefetch_depth, start_index=0, to_gray=False):
+        self.video_path = video_path
+        self.to_gray = to_gray
+        self.frames = queue.Queue(maxsize=prefetch_depth)
+        self.stop_event = threading.Event()
+        self.capture = cv.VideoCapture(video_path)
+        if not self.capture.isOpened():
+            raise IOError("Cannot open video {}".format(video_path))
+        self.seek(start_index)
+        self.thread = threading.Thread(target=self.run, name="decode " + video_path)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def seek(self, frame_index):
+        self.position = frame_index
+        if frame_index == 0:
+            self.capture.set(cv.CAP_PROP_POS_FRAMES, 0)
+            return
+        ## Seeking is not frame-accurate with every codec, then frames are skipped from the start
+        if not self.capture.set(cv.CAP_PROP_POS_FRAMES, frame_index) or \
+                int(self.capture.get(cv.CAP_PROP_POS_FRAMES)) != frame_index:
+            self.capture.set(cv.CAP_PROP_POS_FRAMES, 0)
+            for skipped in range(frame_index):
+                if not self.capture.grab():
+                    break
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                ret, image = self.capture.read()     # releases the GIL while decoding
+                if not ret:
+                    break
+                if self.to_gray and image.ndim == 3:
+                    image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+                if not self.put((self.position, image)):
+                    return
+                self.position += 1
+        finally:
+            self.put(self.kEndOfStream)
+
+    def put(self, item):
+        while True:
+            try:
+                self.frames.put(item, timeout=self.kPollInterval)
+                return True
+            except queue.Full:
+                if self.stop_event.is_set():
+                    return False
+
+    def get(self):
+        return self.frames.get()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.capture.release()
+
+
+class SynchronizedVideoReader(object):
+    '''
+    Reads the im.mp4 / bg.mp4 / fg.mp4 streams of a dataset, each decoded on its own thread
+    into a bounded queue, and yields them frame-aligned.
+    The foreground is converted to a single channel by its decoder thread.
+    Every stream is positioned at the same frame on (re)start, so seek and rewind keep them aligned,
+    and in loop mode all streams are rewound together once the shortest one ends.
+    '''
+    kStreamNames = ["im", "bg", "fg"]
+
+    def __init__(self, dataset_dir, prefetch_depth=8, loop=False, extension=".mp4"):
+        self.dataset_dir = dataset_dir
+        self.prefetch_depth = max(1, prefetch_depth)
+        self.loop = loop
+        self.extension = extension
+
+    def stream_path(self, stream_name):
+        return self.dataset_dir + "/" + stream_name + self.extension
+
+    def __len__(self):
+        ## Frames of the shortest stream, as reported by the containers
+        lengths = list()
+        for stream_name in self.kStreamNames:
+            capture = cv.VideoCapture(self.stream_path(stream_name))
+            lengths.append(int(capture.get(cv.CAP_PROP_FRAME_COUNT)))
+            capture.release()
+        return max(0, min(lengths))
+
+    def read_frames(self, start_index=0, read_background=True):
+        '''
+        yields (frame_index, frame_name, input_image, background, foreground) like FrameSequenceReader,
+        @frame_index keeps increasing across rewinds while @frame_name is the position in the videos
+        '''
+        frame_index = start_index
+        ## Frames past the end of looped videos (e.g. when resuming a session) wrap around
+        if self.loop and start_index > 0:
+            start_index = start_index % max(1, len(self))
+        while True:
+            nFrame = 0
+            for position, input_image, background, foreground in self.read_aligned(start_index, read_background):
+                yield frame_index, "{:07d}".format(position), input_image, background, foreground
+                frame_index += 1
+                nFrame += 1
+            ## [LOOP REWIND]: if out of frame then reset all the streams to the beginning
+            if not self.loop or nFrame == 0:
+                return
+            start_index = 0
+
+    def read_aligned(self, start_index, read_background):
+        decoders = dict()
+        try:
+            decoders["im"] = VideoStreamDecoder(self.stream_path("im"), self.prefetch_depth, start_index)
+            decoders["fg"] = VideoStreamDecoder(self.stream_path("fg"), self.prefetch_depth, start_index,
+                                                to_gray=True)
+            if read_background:
+                decoders["bg"] = VideoStreamDecoder(self.stream_path("bg"), self.prefetch_depth, start_index)
+
+            while True:
+                packets = dict()
+                for stream_name, decoder in decoders.items():
+                    packets[stream_name] = decoder.get()
+                ## Stop at the end of the shortest stream
+                if any(packet is VideoStreamDecoder.kEndOfStream for packet in packets.values()):
+                    return
+
+                position = packets["im"][0]
+                background = packets["bg"][1] if read_background else None
+                yield position, packets["im"][1], background, packets["fg"][1]
+        finally:
+            for decoder in decoders.values():
+                decoder.close()
@@ -1,4 +1,5 @@
 from camera.camera import Camera
+from camera.camera_options import add_camera_arguments, camera_options_from_args
 import argparse
 
 if __name__ == '__main__':
@@ -8,11 +9,39 @@ if __name__ == '__main__':
         metavar='data',
         default='PVD01',
         help='Input the dataset codename')
+    parser.add_argument(
+        '--engine',
+        metavar='engine',
+        default='tensorflow',
+        choices=['tensorflow', 'numpy'],
+        help='Inference engine of the vehicle classifier')
+    parser.add_argument(
+        '--beam-width',
+        metavar='beam_width',
+        type=int,
+        default=None,
+        help='Hard-route the classifier along the k most probable paths (numpy engine)')
+    parser.add_argument(
+        '--sequential-startup',
+        action='store_true',
+        help='Load the models one after another before reading the first frame')
+    parser.add_argument(
+        '--pipeline',
+        metavar='queue_depth',
+        type=int,
+        nargs='+',
+        default=None,
+        help='Run the stages on separate threads with these queue depths (one value, or one per queue: 4)')
+    add_camera_arguments(parser)
     args = parser.parse_args()
     
     # print(type(args.data))
     # print(args.data)
 
-    process_camera = Camera(args.data)
-    
-
+    process_camera = Camera(args.data,
+                            classifier_engine=args.engine,
+                            classifier_beam_width=args.beam_width,
+                            concurrent_startup=not args.sequential_startup,
+                            pipeline_queue_depths=args.pipeline[0] if args.pipeline and len(args.pipeline) == 1
+                                                  else args.pipeline,
+                            **camera_options_from_args(args))
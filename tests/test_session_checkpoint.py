@@ -0,0 +1,137 @@
+import csv
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import pytest
+from camera.frame_metrics import JsonlMetricsSink
+from camera.output_writer import OutputWriter
+from camera.session_checkpoint import SessionCheckpoint
+from vehicle.traffic_statistics import CsvStatisticsSink, SqliteStatisticsSink, TrafficStatistics
+from vehicle.vehicle_counter import VehicleCounter
+from vehicle.vehicle_properties import VehicleType
+
+kFps = 10.0
+kFrames = 200
+kCheckpointInterval = 50
+kCrashFrame = 137       # after the snapshot of frame 99 and a few flushes of later buckets
+
+
+def make_counter(sink_kind, path):
+    ## Small batches, so that rows are flushed between the snapshot and the crash
+    if sink_kind == "csv":
+        sink = CsvStatisticsSink(path, batch_size=25)
+    else:
+        sink = SqliteStatisticsSink(path, batch_size=25)
+    return VehicleCounter(TrafficStatistics(n_zones=2, bucket_seconds=1.0, windows=(1, 5), sinks=[sink]))
+
+
+def run_frames(counter, checkpoint, first_frame, last_frame):
+    ## Same steps as Camera.process_tracking and Camera.save_checkpoint
+    vehicle_types = [VehicleType.Class1, VehicleType.Class2, VehicleType.Class3]
+    for frame_index in range(first_frame, last_frame):
+        timestamp = frame_index / kFps
+        counter.advance_time(timestamp)
+        if frame_index % 3 == 0:
+            counter.count_vehicle(vehicle_types[frame_index % 3], frame_index % 7, frame_index % 2, timestamp)
+        if checkpoint is not None and checkpoint.is_due(frame_index):
+            counter.flush()
+            checkpoint.save({"frame_index" : frame_index, "counter" : counter.state()})
+
+
+def read_rows(sink_kind, path):
+    if sink_kind == "csv":
+        with open(path, newline="") as f:
+            return [tuple(row) for row in csv.reader(f)][1:]
+    connection = sqlite3.connect(path)
+    rows = connection.execute("SELECT * FROM traffic_intervals ORDER BY rowid").fetchall()
+    connection.close()
+    return [tuple(str(value) for value in row) for row in rows]
+
+
+@pytest.mark.parametrize("sink_kind", ["csv", "sqlite"])
+def test_resumed_session_writes_every_row_once(tmp_path, sink_kind):
+    reference_path = str(tmp_path / ("reference." + sink_kind))
+    reference_counter = make_counter(sink_kind, reference_path)
+    run_frames(reference_counter, None, 0, kFrames)
+    reference_counter.close()
+
+    path = str(tmp_path / ("resumed." + sink_kind))
+    checkpoint = SessionCheckpoint(str(tmp_path / "session.ckpt"), interval=kCheckpointInterval)
+    run_frames(make_counter(sink_kind, path), checkpoint, 0, kCrashFrame)
+    ## Crash: the counter is dropped without closing its sinks, the buffered rows are lost
+
+    state = SessionCheckpoint(checkpoint.path, interval=kCheckpointInterval).load()
+    assert state["frame_index"] == 99
+    counter = make_counter(sink_kind, path)
+    counter.restore_state(state["counter"])
+    run_frames(counter, checkpoint, state["frame_index"] + 1, kFrames)
+    counter.close()
+
+    reference_rows = read_rows(sink_kind, reference_path)
+    assert len(read_rows(sink_kind, path)) == len(reference_rows)
+    assert read_rows(sink_kind, path) == reference_rows
+    assert counter.vehicle_counts_ == reference_counter.vehicle_counts_
+
+
+def test_checkpoint_flushes_the_buffered_rows(tmp_path):
+    path = str(tmp_path / "statistics.csv")
+    counter = make_counter("csv", path)
+    checkpoint = SessionCheckpoint(str(tmp_path / "session.ckpt"), interval=kCheckpointInterval)
+    run_frames(counter, checkpoint, 0, kCheckpointInterval)
+
+    statistics = counter.statistics_
+    assert len(statistics.sinks[0].pending_rows_) == 0
+    last_end = (statistics.last_emitted_bucket_ + 1) * statistics.bucket_seconds
+    assert statistics.sinks[0].last_interval_end() == last_end
+
+
+def test_resumed_metrics_are_appended(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for first_frame, append in [(0, False), (40, True)]:
+        sink = JsonlMetricsSink(path, append=append)
+        for frame_index in range(first_frame, first_frame + 50):
+            sink.write({"frame_index" : frame_index})
+        sink.close()
+    with open(path) as f:
+        frame_indices = [json.loads(line)["frame_index"] for line in f]
+    assert frame_indices == list(range(0, 50)) + list(range(40, 90))
+
+
+def test_resumed_video_goes_to_a_segment():
+    assert OutputWriter.segment_path("out/output.avi", 1000) == "out/output_0001000.avi"
+    assert OutputWriter.segment_path("output", 40) == "output_0000040"
+
+
+def test_checkpoint_is_due_once_per_interval_until_saved():
+    ## In pipeline mode the snapshot of a frame is saved after later frames are tracked
+    checkpoint = SessionCheckpoint("unused.ckpt", interval=10)
+    assert [frame_index for frame_index in range(35) if checkpoint.is_due(frame_index)] == [9, 19, 29]
+
+
+def test_snapshot_is_a_copy_of_the_tracked_state(tmp_path):
+    ## The tracks keep changing between the tracking of a frame and the write of its snapshot
+    checkpoint = SessionCheckpoint(str(tmp_path / "session.ckpt"))
+    trajectory = [(0, 0), (0, 4)]
+    snapshot = checkpoint.serialize({"frame_index" : 9, "trajectory" : trajectory})
+    trajectory.append((0, 8))
+    checkpoint.write(snapshot)
+    assert checkpoint.load()["trajectory"] == [(0, 0), (0, 4)]
+
+
+def test_drained_frames_survive_a_crash(tmp_path, monkeypatch):
+    ## Slow encoders keep frames queued in the writer when the snapshot is due
+    def slow_write_image(image_path, output_frame):
+        time.sleep(0.02)
+        with open(image_path, "wb") as f:
+            f.write(output_frame.tobytes())
+    monkeypatch.setattr(OutputWriter, "write_image", staticmethod(slow_write_image))
+
+    image_dir = str(tmp_path / "frames")
+    output_writer = OutputWriter(image_dir=image_dir, image_format="raw", queue_depth=16, num_workers=1)
+    for frame_index in range(20):
+        output_writer.write("{:07d}.png".format(frame_index), np.zeros((4, 4, 3), dtype=np.uint8))
+    output_writer.drain()
+    ## Crash: the writer is never closed
+    assert len(os.listdir(image_dir)) == 20
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class OcclusionRequest(object):
+    ## Occlusion blobs of one frame waiting for SSD
+    def __init__(self, frame_key, occlusion_blobs, rbg_image, foreground_img):
+        self.frame_key = frame_key
+        self.occlusion_blobs = occlusion_blobs
+        self.rbg_image = rbg_image
+        self.foreground_img = foreground_img
+        self.submit_time = time.time()
+
+
+class OcclusionBatchScheduler(object):
+    '''
+    Collects the occlusion blobs of consecutive frames of one camera and runs a single
+    blobFromImages + forward() over them once max_batch_size blobs are pending or the oldest
+    frame has waited max_latency seconds. Without the worker the deadline is only checked by
+    poll(), i.e. once per submitted frame, so a batch may wait up to one frame longer.
+    The detections are routed back to their frames, and results are handed out by frame key.
+    @frame_key must be unique among the pending frames, e.g. (camera name, frame index).
+    Each Camera owns its scheduler; cameras sharing a VehicleOcclusionHandler take turns on its
+    network, forward() is serialized by the handler.
+
+    After start(), batches run on a dedicated inference worker instead of the submitting thread:
+    the worker takes whatever has been submitted while the previous forward() was running
+    (up to max_batch_size blobs) and result() blocks until the frame is done.
+    '''
+    def __init__(self, occlusion_handler, max_batch_size=32, max_latency=0.05):
+        self.occlusion_handler = occlusion_handler
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        self.condition = threading.Condition()
+        self.pending_requests_ = list()
+        self.pending_blob_count_ = 0
+        self.completed_ = OrderedDict()     # frame_key -> extracted vehicles
+        self.batch_sizes_ = list()
+        self.worker_ = None
+        self.stop_requested_ = False
+        self.worker_error_ = None
+
+    #################################################
+    ## Submit / Result
+    #################################################
+    def submit(self, frame_key, occlusion_blobs, rbg_image, foreground_img):
+        with self.condition:
+            if len(occlusion_blobs) == 0 and len(self.pending_requests_) == 0:
+                self.completed_[frame_key] = list()
+                self.condition.notify_all()
+                return
+
+            self.pending_requests_.append(OcclusionRequest(frame_key, occlusion_blobs, rbg_image, foreground_img))
+            self.pending_blob_count_ += len(occlusion_blobs)
+            if self.worker_ is not None:
+                self.condition.notify_all()
+            elif self.pending_blob_count_ >= self.max_batch_size:
+                self.flush_locked()
+
+    def poll(self):
+        ## Runs the pending batch if its deadline has passed (the worker does not need it)
+        with self.condition:
+            if self.worker_ is None and len(self.pending_requests_) != 0 and \
+                    time.time() - self.pending_requests_[0].submit_time >= self.max_latency:
+                self.flush_locked()
+
+    def flush(self):
+        with self.condition:
+            if self.worker_ is None:
+                self.flush_locked()
+
+    def is_completed(self, frame_key):
+        with self.condition:
+            return frame_key in self.completed_
+
+    def result(self, frame_key, timeout=None):
+        '''
+        :return: the vehicles extracted from the occlusion blobs of the frame
+        blocks until the worker has processed the frame, re-raises its error if it failed
+        '''
+        with self.condition:
+            if self.worker_ is None and frame_key not in self.completed_:
+                self.flush_locked()
+            while frame_key not in self.completed_:
+                if self.worker_error_ is not None:
+                    raise self.worker_error_
+                if not self.condition.wait(timeout):
+                    raise RuntimeError("Timed out waiting for the occlusion result of {}".format(frame_key))
+            return self.completed_.pop(frame_key)
+
+    #################################################
+    ## Inference worker
+    #################################################
+    def start(self):
+        self.stop_requested_ = False
+        self.worker_ = threading.Thread(target=self.run_worker, name="occlusion inference")
+        self.worker_.daemon = True
+        self.worker_.start()
+
+    def stop(self):
+        ## Pending frames are processed before the worker exits
+        if self.worker_ is None:
+            return
+        with self.condition:
+            self.stop_requested_ = True
+            self.condition.notify_all()
+        self.worker_.join()
+        self.worker_ = None
+
+    def run_worker(self):
+        with self.condition:
+            while True:
+                while len(self.pending_requests_) == 0 and not self.stop_requested_:
+                    self.condition.wait()
+                if len(self.pending_requests_) == 0:
+                    return
+
+                requests = self.take_batch_locked()
+                ## forward() releases the GIL, frames keep being submitted meanwhile
+                self.condition.release()
+                try:
+                    results = self.run_batch(requests)
+                except Exception as e:
+                    results = None
+                    self.worker_error_ = e
+                finally:
+                    self.condition.acquire()
+
+                if results is None:
+                    self.condition.notify_all()
+                    return
+                self.completed_.update(results)
+                self.condition.notify_all()
+
+    #################################################
+    ## Batches
+    #################################################
+    def flush_locked(self):
+        while len(self.pending_requests_) != 0:
+            self.completed_.update(self.run_batch(self.take_batch_locked()))
+        self.condition.notify_all()
+
+    def take_batch_locked(self):
+        ## Oldest requests up to max_batch_size blobs (at least one request)
+        n_requests = 0
+        n_blobs = 0
+        while n_requests < len(self.pending_requests_) and (n_requests == 0 or n_blobs < self.max_batch_size):
+            n_blobs += len(self.pending_requests_[n_requests].occlusion_blobs)
+            n_requests += 1
+
+        requests = self.pending_requests_[:n_requests]
+        self.pending_requests_ = self.pending_requests_[n_requests:]
+        self.pending_blob_count_ -= n_blobs
+        return requests
+
+    def run_batch(self, requests):
+        image_blobs = list()
+        for request in requests:
+            image_blobs += self.occlusion_handler.prepare_blob_images(request.occlusion_blobs)
+
+        detection = []
+        if len(image_blobs) != 0:
+            detection = self.occlusion_handler.detect_blob_images(image_blobs)
+            self.batch_sizes_.append(len(image_blobs))
+
+        results = list()
+        image_offset = 0
+        for request in requests:
+            results.append((request.frame_key,
+                            self.occlusion_handler.extract_vehicles(detection,
+                                                                    request.occlusion_blobs,
+                                                                    request.rbg_image,
+                                                                    request.foreground_img,
+                                                                    image_offset)))
+            image_offset += len(request.occlusion_blobs)
+        return results
+
+    def statistics_message(self):
+        if len(self.batch_sizes_) == 0:
+            return "no batch"
+        return "{} batches, {:.1f} blobs per batch".format(len(self.batch_sizes_),
+                                                           sum(self.batch_sizes_) / float(len(self.batch_sizes_)))
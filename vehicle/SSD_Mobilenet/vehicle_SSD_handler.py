@@ -1,8 +1,10 @@
+import threading
 import cv2 as cv
 import numpy as np
 from vehicle.vehicle import Vehicle
 from vehicle.vehicle_properties import VehicleType
 from vehicle.vehicle_detector import VehicleDetector
+from vehicle.contour_geometry import ContourGeometry
 
 class VehicleOcclusionHandler(object):
     def __init__(self):
@@ -20,6 +22,9 @@ class VehicleOcclusionHandler(object):
                                   VehicleType.Class2,
                                   VehicleType.Class3]
 
+        ## setInput() + forward() of the shared network must not interleave between threads
+        self.network_lock = threading.Lock()
+
         self.__initialize_SSD_MobileNet__()
         self.vehicle_detector = VehicleDetector()
 
@@ -27,25 +32,49 @@ class VehicleOcclusionHandler(object):
         self.tf_network = cv.dnn.readNetFromTensorflow(self.ssd_graph_pb,
                                                        self.ssd_graph_pbtxt)
 
-    def handle_occlusion_blob(self, occlusion_blobs, rbg_image, foreground_img):
-        extracted_vehicles = list()
+    def warm_up(self):
+        # The first forward() allocates and initializes all layers of the network
+        dummy_image = np.zeros((self.g_height, self.g_width, 3), dtype=np.uint8)
+        self.detect_blob_images([dummy_image])
 
+    def handle_occlusion_blob(self, occlusion_blobs, rbg_image, foreground_img):
         # Prepare a list of blobs to pass once into SSD model
+        detection = self.detect_blob_images(self.prepare_blob_images(occlusion_blobs))
+        return self.extract_vehicles(detection, occlusion_blobs, rbg_image, foreground_img)
+
+    def prepare_blob_images(self, occlusion_blobs):
         image_blobs = []
         for blob in occlusion_blobs:
             image_blobs.append(blob.vehicle_images_[-1])
+        return image_blobs
 
+    def detect_blob_images(self, image_blobs):
+        '''
+        runs SSD once over @image_blobs, which may come from several frames
+        :return: detection rows (nDetections, 7) as [img_idx, class, score, left, top, right, bottom]
+        '''
         input_blob = cv.dnn.blobFromImages(image_blobs,
                                            self.g_scale_factor,
                                            (self.g_width, self.g_height),
                                            (self.g_mean_val, self.g_mean_val, self.g_mean_val),
                                            swapRB=True,
                                            crop=False)
-        self.tf_network.setInput(input_blob)
-        detection = self.tf_network.forward()
+        with self.network_lock:
+            self.tf_network.setInput(input_blob)
+            detection = self.tf_network.forward()
+        return detection[0, 0, :, :]
+
+    def extract_vehicles(self, detection, occlusion_blobs, rbg_image, foreground_img, image_offset=0):
+        '''
+        builds the vehicles of one frame from the detection rows of its blobs
+        :param image_offset: index of the first blob of the frame in the detected batch
+        '''
+        extracted_vehicles = list()
 
-        for weight in detection[0, 0, :, :]:
-            img_idx = int(weight[0])
+        for weight in detection:
+            img_idx = int(weight[0]) - image_offset
+            if img_idx < 0 or img_idx >= len(occlusion_blobs):
+                continue    # detection of a blob of another frame
             blob = occlusion_blobs[img_idx]
             object_class = weight[1]
             score = float(weight[2])
@@ -70,7 +99,8 @@ class VehicleOcclusionHandler(object):
                 contour_ = contours[0]
                 contour_ = contour_ + np.array([[origin_anchor[0],origin_anchor[1]]])
 
-                if (self.vehicle_detector.is_valid_contour(contour_) == False):
+                geometry = ContourGeometry(contour_)
+                if (self.vehicle_detector.is_valid_contour(contour_, geometry) == False):
                     continue
 
                 ## Construct new vehicle features
@@ -84,7 +114,8 @@ class VehicleOcclusionHandler(object):
                                              boxes=box,
                                              vehicle_image=vehicle_image,
                                              binary_image=binary_image,
-                                             init_three_feature=True)
+                                             init_three_feature=True,
+                                             geometry=geometry)
 
                 # [Option 2]: Short version
                 # extracted_vehicle = Vehicle(boxes=box,
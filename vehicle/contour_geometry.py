@@ -0,0 +1,106 @@
+import threading
+import cv2 as cv
+
+
+class ContourGeometry(object):
+    '''
+    Measurements of one detected contour, each computed at most once and only when first needed.
+    The record is attached to the Vehicle built from the contour and shared by the detector,
+    the occlusion detection and the classifier features.
+    Hits (reused values) and misses (computed values) are counted per measurement, in counters
+    owned by each thread (detection, classification and the SSD worker may run concurrently)
+    and summed when reported.
+    '''
+    __slots__ = ('contour', '_area', '_hull', '_hull_area', '_perimeter', '_min_area_rect', '_moments')
+
+    kMeasurements = ['area', 'hull', 'hull_area', 'perimeter', 'min_area_rect', 'moments']
+
+    thread_local_ = threading.local()
+    thread_statistics_ = list()         # {measurement: [hits, misses]} of every thread
+    statistics_lock_ = threading.Lock()
+
+    def __init__(self, contour):
+        self.contour = contour
+        self._area = None
+        self._hull = None
+        self._hull_area = None
+        self._perimeter = None
+        self._min_area_rect = None
+        self._moments = None
+
+    @classmethod
+    def thread_statistics(cls):
+        ## Counters of the calling thread, registered on its first measurement
+        statistics = getattr(cls.thread_local_, 'statistics', None)
+        if statistics is None:
+            statistics = dict((name, [0, 0]) for name in cls.kMeasurements)
+            cls.thread_local_.statistics = statistics
+            with cls.statistics_lock_:
+                cls.thread_statistics_.append(statistics)
+        return statistics
+
+    @classmethod
+    def count(cls, name, hit):
+        cls.thread_statistics()[name][0 if hit else 1] += 1
+
+    @classmethod
+    def reset_statistics(cls):
+        with cls.statistics_lock_:
+            for statistics in cls.thread_statistics_:
+                for counts in statistics.values():
+                    counts[0] = counts[1] = 0
+
+    @classmethod
+    def statistics(cls):
+        ## {measurement: [hits, misses]} summed over the threads
+        with cls.statistics_lock_:
+            return dict((name, [sum(statistics[name][0] for statistics in cls.thread_statistics_),
+                                sum(statistics[name][1] for statistics in cls.thread_statistics_)])
+                        for name in cls.kMeasurements)
+
+    @classmethod
+    def statistics_message(cls):
+        return ", ".join("{} {}/{}".format(name, counts[0], counts[0] + counts[1])
+                         for name, counts in cls.statistics().items())
+
+    @property
+    def area(self):
+        self.count('area', self._area is not None)
+        if self._area is None:
+            self._area = cv.contourArea(self.contour)
+        return self._area
+
+    @property
+    def hull(self):
+        self.count('hull', self._hull is not None)
+        if self._hull is None:
+            self._hull = cv.convexHull(self.contour)
+        return self._hull
+
+    @property
+    def hull_area(self):
+        self.count('hull_area', self._hull_area is not None)
+        if self._hull_area is None:
+            self._hull_area = cv.contourArea(self.hull)
+        return self._hull_area
+
+    @property
+    def perimeter(self):
+        self.count('perimeter', self._perimeter is not None)
+        if self._perimeter is None:
+            self._perimeter = cv.arcLength(self.contour, True)
+        return self._perimeter
+
+    @property
+    def min_area_rect(self):
+        self.count('min_area_rect', self._min_area_rect is not None)
+        if self._min_area_rect is None:
+            self._min_area_rect = cv.minAreaRect(self.contour)
+        return self._min_area_rect
+
+    @property
+    def moments(self):
+        self.count('moments', self._moments is not None)
+        if self._moments is None:
+            self._moments = cv.moments(self.contour)
+        return self._moments
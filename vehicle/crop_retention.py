@@ -0,0 +1,79 @@
+import cv2 as cv
+import numpy as np
+
+
+class CropRetention(object):
+    '''
+    Decides how long the image crops of a vehicle (vehicle_images_ / binary_image_) are kept.
+    Crops are sliced out of the decoded frames, so as long as a crop is a view, it keeps its
+    whole frame alive.
+        "release" : crops stay views while the frame is detected, classified and its occlusion
+                    blobs handled, then they are dropped before tracking (nothing is pinned)
+        "copy"    : crops are replaced by compact copies, downscaled by @scale, and kept with the track
+        "view"    : crops stay views of the frames for the whole life of the track
+    The policy is applied by settle() once the frame has been classified and its occlusion blobs
+    handled, by then the features that need the crops (density ratio, SSD input) are computed.
+    '''
+    kPolicies = ["release", "copy", "view"]
+
+    def __init__(self, policy="release", scale=1.0):
+        if policy not in self.kPolicies:
+            raise ValueError("Unknown crop retention policy {}".format(policy))
+        self.policy = policy
+        self.scale = scale
+        self.peak_pinned_bytes_ = 0
+        self.peak_report_ = list()
+
+    def settle(self, vehicles):
+        ## Releases or compacts the crops of the vehicles detected in one frame
+        if self.policy == "release":
+            for vehicle in vehicles:
+                vehicle.vehicle_images_.clear()
+                vehicle.binary_image_.clear()
+        elif self.policy == "copy":
+            for vehicle in vehicles:
+                if len(vehicle.vehicle_images_) != 0:
+                    vehicle.vehicle_images_[-1] = self.compact(vehicle.vehicle_images_[-1], cv.INTER_AREA)
+                if len(vehicle.binary_image_) != 0:
+                    vehicle.binary_image_[-1] = self.compact(vehicle.binary_image_[-1], cv.INTER_NEAREST)
+
+    def compact(self, crop, interpolation):
+        if self.scale != 1.0 and crop.size != 0:
+            width = max(1, int(round(crop.shape[1] * self.scale)))
+            height = max(1, int(round(crop.shape[0] * self.scale)))
+            return cv.resize(crop, (width, height), interpolation=interpolation)
+        return np.array(crop, copy=True)
+
+    #################################################
+    ## Memory report
+    #################################################
+    @staticmethod
+    def pinned_buffers(vehicle):
+        ## id -> bytes of the buffers held by the crops of @vehicle (a view holds its whole base frame)
+        buffers = dict()
+        for crop in list(vehicle.vehicle_images_) + list(vehicle.binary_image_):
+            buffer = crop
+            while isinstance(buffer.base, np.ndarray):
+                buffer = buffer.base
+            buffers[id(buffer)] = buffer.nbytes
+        return buffers
+
+    def observe(self, vehicles):
+        ## Keeps the per-track report of the frame where the tracks pinned the most memory
+        pinned = dict()
+        track_lines = list()
+        for vehicle_idx, vehicle in enumerate(vehicles):
+            buffers = self.pinned_buffers(vehicle)
+            pinned.update(buffers)
+            track_lines.append("track {}: {} crops, {} bytes pinned".format(
+                vehicle_idx, len(vehicle.vehicle_images_) + len(vehicle.binary_image_), sum(buffers.values())))
+        pinned_bytes = sum(pinned.values())
+        if pinned_bytes > self.peak_pinned_bytes_:
+            self.peak_pinned_bytes_ = pinned_bytes
+            self.peak_report_ = track_lines
+        return pinned_bytes
+
+    def report(self):
+        ## Frames shared by several tracks are counted once in the peak
+        lines = ["policy {}, peak of {} bytes pinned by the tracks".format(self.policy, self.peak_pinned_bytes_)]
+        return lines + self.peak_report_
@@ -0,0 +1,247 @@
+import os
+import numpy as np
+
+
+class NumpySoftDecisionTree(object):
+    '''
+    NumPy inference engine for a trained SoftDecisionTree.
+
+    The weight_*/bias_* variables of the tree are packed once into four arrays:
+        internal_weights : (n_features, n_internal)           internal nodes in heap order
+        internal_biases  : (n_internal,)
+        leaf_weights     : (n_features, n_leafs * n_classes)   leaves from left to right
+        leaf_biases      : (n_leafs * n_classes,)
+    so that a whole batch is evaluated with two matrix multiplies.
+    Node ids of SoftDecisionTree are '0' followed by the left(0)/right(1) path bits,
+    hence node '0'+bits sits at heap index 2**len(bits) - 1 + int(bits, 2).
+    '''
+    def __init__(self, internal_weights, internal_biases, leaf_weights, leaf_biases, n_classes,
+                 source_checkpoint=""):
+        self.internal_weights = np.ascontiguousarray(internal_weights, dtype=np.float32)
+        self.internal_biases = np.ascontiguousarray(internal_biases, dtype=np.float32)
+        self.leaf_weights = np.ascontiguousarray(leaf_weights, dtype=np.float32)
+        self.leaf_biases = np.ascontiguousarray(leaf_biases, dtype=np.float32)
+        self.source_checkpoint = source_checkpoint
+
+        self.n_features = self.internal_weights.shape[0]
+        self.n_internal = self.internal_weights.shape[1]
+        self.n_classes = int(n_classes)
+        self.n_leafs = self.n_internal + 1
+        self.max_depth = int(np.log2(self.n_leafs))
+        self.internal_weights_by_node = np.ascontiguousarray(self.internal_weights.T)
+        self.leaf_weights_by_leaf = np.ascontiguousarray(
+            self.leaf_weights.reshape(self.n_features, self.n_leafs, self.n_classes).transpose(1, 0, 2))
+        self.leaf_biases_by_leaf = self.leaf_biases.reshape(self.n_leafs, self.n_classes)
+
+    #################################################
+    ## Export / Import
+    #################################################
+    @staticmethod
+    def node_id(depth, position):
+        ## id of the node at @position (left to right) of level @depth
+        if depth == 0:
+            return '0'
+        return '0' + format(position, '0{}b'.format(depth))
+
+    @staticmethod
+    def latest_checkpoint_name(checkpoint_dir):
+        '''
+        reads the 'checkpoint' state file written by tf.train.Saver without importing TensorFlow
+        :return: the checkpoint prefix (e.g. '-129453') or None
+        '''
+        state_file = os.path.join(checkpoint_dir, "checkpoint")
+        if not os.path.isfile(state_file):
+            return None
+        with open(state_file) as f:
+            for line in f:
+                token = line.split(":", 1)
+                if token[0].strip() == "model_checkpoint_path":
+                    return token[1].strip().strip('"')
+        return None
+
+    @classmethod
+    def from_variables(cls, get_variable, max_depth, n_features, n_classes, source_checkpoint=""):
+        '''
+        packs the tree variables
+        :param get_variable: callable returning the value of a variable from its name
+        '''
+        n_internal = 2**max_depth - 1
+        n_leafs = 2**max_depth
+
+        internal_weights = np.zeros((n_features, n_internal), dtype=np.float32)
+        internal_biases = np.zeros((n_internal,), dtype=np.float32)
+        for depth in range(max_depth):
+            for position in range(2**depth):
+                heap_idx = 2**depth - 1 + position
+                id = cls.node_id(depth, position)
+                internal_weights[:, heap_idx] = np.reshape(get_variable('weight_' + id), (n_features,))
+                internal_biases[heap_idx] = np.reshape(get_variable('bias_' + id), ())
+
+        leaf_weights = np.zeros((n_features, n_leafs, n_classes), dtype=np.float32)
+        leaf_biases = np.zeros((n_leafs, n_classes), dtype=np.float32)
+        for position in range(n_leafs):
+            id = cls.node_id(max_depth, position)
+            leaf_weights[:, position, :] = get_variable('weight_' + id)
+            leaf_biases[position, :] = get_variable('bias_' + id)
+
+        return cls(internal_weights=internal_weights,
+                   internal_biases=internal_biases,
+                   leaf_weights=leaf_weights.reshape(n_features, n_leafs * n_classes),
+                   leaf_biases=leaf_biases.reshape(n_leafs * n_classes),
+                   n_classes=n_classes,
+                   source_checkpoint=source_checkpoint)
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint_dir, max_depth, n_features, n_classes):
+        ## TensorFlow is only needed for this one-off export
+        import tensorflow as tf
+
+        latest_checkpoint = tf.train.latest_checkpoint(checkpoint_dir)
+        if not latest_checkpoint:
+            raise IOError("No checkpoint found in {}".format(checkpoint_dir))
+
+        reader = tf.train.NewCheckpointReader(latest_checkpoint)
+        return cls.from_variables(get_variable=reader.get_tensor,
+                                  max_depth=max_depth,
+                                  n_features=n_features,
+                                  n_classes=n_classes,
+                                  source_checkpoint=os.path.basename(latest_checkpoint))
+
+    def save(self, path):
+        np.savez(path,
+                 internal_weights=self.internal_weights,
+                 internal_biases=self.internal_biases,
+                 leaf_weights=self.leaf_weights,
+                 leaf_biases=self.leaf_biases,
+                 n_classes=np.array(self.n_classes),
+                 source_checkpoint=np.array(self.source_checkpoint))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as packed:
+            return cls(internal_weights=packed['internal_weights'],
+                       internal_biases=packed['internal_biases'],
+                       leaf_weights=packed['leaf_weights'],
+                       leaf_biases=packed['leaf_biases'],
+                       n_classes=int(packed['n_classes']),
+                       source_checkpoint=str(packed['source_checkpoint']))
+
+    #################################################
+    ## Inference
+    #################################################
+    def node_probabilities(self, X):
+        ## sigmoid output of every internal node: (nBatches, n_internal)
+        logits = np.dot(X, self.internal_weights) + self.internal_biases
+        ## tanh form of the sigmoid does not overflow for large |logits|
+        return 0.5 * (np.tanh(0.5 * logits) + 1.)
+
+    def leafs_distribution(self, X):
+        ## path probability of every leaf: (nBatches, n_leafs), same as SoftDecisionTree.leafs_distribution
+        node_prob = self.node_probabilities(X)
+        path_prob = np.ones((X.shape[0], 1), dtype=np.float32)
+        for depth in range(self.max_depth):
+            level_prob = node_prob[:, 2**depth - 1: 2**(depth + 1) - 1]
+            ## children of the k-th node of a level are the (2k)-th and (2k+1)-th nodes of the next one
+            path_prob = np.stack([path_prob * level_prob,
+                                  path_prob * (1. - level_prob)], axis=2).reshape(X.shape[0], -1)
+        return path_prob
+
+    def leafs_output(self, X):
+        ## softmax of every leaf: (nBatches, n_leafs, n_classes), same as SoftDecisionTree.output
+        logits = (np.dot(X, self.leaf_weights) + self.leaf_biases).reshape(X.shape[0], self.n_leafs, self.n_classes)
+        logits = logits - logits.max(axis=2, keepdims=True)
+        exp_logits = np.exp(logits)
+        return exp_logits / exp_logits.sum(axis=2, keepdims=True)
+
+    def predict(self, X):
+        '''
+        equivalent of SoftDecisionTree.final_output
+        :param X: (nBatches, n_features)
+        :return: (nBatches, 2) as [probability, class]
+        '''
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        leaf_idx_of_batch = np.argmax(self.leafs_distribution(X), axis=1)
+        leaf_batch = self.leafs_output(X)[np.arange(X.shape[0]), leaf_idx_of_batch]
+        return self.final_output(leaf_batch)
+
+    #################################################
+    ## Hard routing
+    #################################################
+    def route_leaf_idx(self, X, beam_width=1):
+        '''
+        routes each sample down the tree keeping only the @beam_width most probable paths,
+        so that at most beam_width nodes are evaluated per level (greedy path when beam_width=1)
+        :return: the selected leaf of each sample, (nBatches,)
+        '''
+        n_batches = X.shape[0]
+        batch_idx = np.arange(n_batches)[:, None]
+        node_position = np.zeros((n_batches, 1), dtype=np.int64)
+        log_path_prob = np.zeros((n_batches, 1), dtype=np.float32)
+
+        for depth in range(self.max_depth):
+            heap_idx = 2**depth - 1 + node_position
+            logits = np.einsum('nkf,nf->nk', self.internal_weights_by_node[heap_idx], X) \
+                     + self.internal_biases[heap_idx]
+            ## log(sigmoid(z)) and log(1 - sigmoid(z))
+            log_left = -np.logaddexp(0., -logits)
+            log_right = -np.logaddexp(0., logits)
+
+            ## children are kept sorted by position, ties resolve to the left-most one like np.argmax
+            node_position = np.stack([2 * node_position, 2 * node_position + 1], axis=2).reshape(n_batches, -1)
+            log_path_prob = np.stack([log_path_prob + log_left,
+                                      log_path_prob + log_right], axis=2).reshape(n_batches, -1)
+
+            if node_position.shape[1] > beam_width:
+                keep = np.sort(np.argsort(-log_path_prob, axis=1, kind='stable')[:, :beam_width], axis=1)
+                node_position = node_position[batch_idx, keep]
+                log_path_prob = log_path_prob[batch_idx, keep]
+
+        return node_position[np.arange(n_batches), np.argmax(log_path_prob, axis=1)]
+
+    def leafs_output_of(self, X, leaf_idx):
+        ## softmax of one leaf per sample: (nBatches, n_classes)
+        logits = np.einsum('nfc,nf->nc', self.leaf_weights_by_leaf[leaf_idx], X) + self.leaf_biases_by_leaf[leaf_idx]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp_logits = np.exp(logits)
+        return exp_logits / exp_logits.sum(axis=1, keepdims=True)
+
+    def predict_routed(self, X, beam_width=1):
+        '''
+        hard-routing equivalent of predict, evaluating O(depth * beam_width) nodes per sample
+        :return: (nBatches, 2) as [probability, class]
+        '''
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        leaf_idx = self.route_leaf_idx(X, beam_width)
+        return self.final_output(self.leafs_output_of(X, leaf_idx))
+
+    def nodes_evaluated_per_sample(self, beam_width=None):
+        if beam_width is None:
+            return self.n_internal + self.n_leafs
+        return sum(min(2**depth, beam_width) for depth in range(self.max_depth)) + 1
+
+    def routing_disagreement(self, X, beam_width=1):
+        '''
+        compares hard routing against the full soft argmax on a (validation) set
+        :return: dictionary of disagreement rates and evaluated nodes per sample
+        '''
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        n_samples = X.shape[0]
+
+        soft_leaf_idx = np.argmax(self.leafs_distribution(X), axis=1)
+        soft_output = self.final_output(self.leafs_output(X)[np.arange(n_samples), soft_leaf_idx])
+        routed_leaf_idx = self.route_leaf_idx(X, beam_width)
+        routed_output = self.final_output(self.leafs_output_of(X, routed_leaf_idx))
+
+        return {
+            'n_samples' : n_samples,
+            'beam_width' : beam_width,
+            'leaf_disagreement' : float(np.mean(soft_leaf_idx != routed_leaf_idx)) if n_samples else 0.0,
+            'class_disagreement' : float(np.mean(soft_output[:, 1] != routed_output[:, 1])) if n_samples else 0.0,
+            'soft_nodes_per_sample' : self.nodes_evaluated_per_sample(),
+            'routed_nodes_per_sample' : self.nodes_evaluated_per_sample(beam_width)
+        }
+
+    def final_output(self, leaf_batch):
+        output_class = np.argmax(leaf_batch, axis=1)
+        cls_prob = leaf_batch[np.arange(leaf_batch.shape[0]), output_class]
+        return np.stack([cls_prob, output_class.astype(np.float32)], axis=1).astype(np.float32)
@@ -0,0 +1,40 @@
+from vehicle.neural_decision_tree.numpy_model import NumpySoftDecisionTree
+import numpy as np
+import argparse
+
+## Reports how often hard routing disagrees with the full soft argmax of the tree
+##   python -m vehicle.neural_decision_tree.validate_routing --features validation.csv --beam 1 2 4
+## @features is a .npy or comma separated file of (nSamples, 10) vehicle features
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validate hard-routing inference of the Neural Decision Tree')
+    parser.add_argument(
+        '--features',
+        metavar='features',
+        required=True,
+        help='Validation features (.npy or .csv)')
+    parser.add_argument(
+        '--model',
+        metavar='model',
+        default='vehicle/neural_decision_tree/log/ndt_packed.npz',
+        help='Packed NumPy model')
+    parser.add_argument(
+        '--beam',
+        metavar='beam',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4],
+        help='Beam widths to evaluate')
+    args = parser.parse_args()
+
+    if args.features.endswith('.npy'):
+        features = np.load(args.features)
+    else:
+        features = np.loadtxt(args.features, delimiter=',', ndmin=2)
+
+    tree = NumpySoftDecisionTree.load(args.model)
+    for beam_width in args.beam:
+        report = tree.routing_disagreement(features, beam_width)
+        print("beam={beam_width}: leaf disagreement {leaf_disagreement:.4%}, "
+              "class disagreement {class_disagreement:.4%}, "
+              "{routed_nodes_per_sample} instead of {soft_nodes_per_sample} nodes per sample "
+              "({n_samples} samples)".format(**report))
@@ -0,0 +1,104 @@
+import collections
+import numpy as np
+
+
+class TrackHistory(object):
+    '''
+    Bounded history of one kind of fixed-size record of a track, stored in a preallocated NumPy ring.
+
+    Only the first record and the last @capacity records are kept, which is all the Vehicle
+    and the VehicleTracker lookback need:
+        len(history)        total number of appended records (frame count of the track)
+        history[0]          first record, always kept
+        history[-k]         k-th last record, for k <= capacity
+        iter(history)       retained records, oldest first
+    Records are returned in the same Python form they were appended in.
+    '''
+    __slots__ = ('kind', 'capacity', 'count', 'first', 'ring')
+
+    ## kind: (record width, storage dtype)
+    kKinds = {
+        'point'   : (2, np.int32),       # (x,y)
+        'box'     : (4, np.int32),       # (x,y,w,h)
+        'ellipse' : (5, np.float64),     # ((x,y),(w,h),angle)
+        'scalar'  : (1, np.float64)
+    }
+    kInitialCapacity = 8
+
+    def __init__(self, kind, capacity):
+        self.kind = kind
+        self.capacity = max(1, capacity)
+        self.count = 0
+        self.first = None
+        self.ring = None        # allocated on the first append, grown by doubling up to capacity
+
+    #################################################
+    ## Conversion between records and ring rows
+    #################################################
+    def encode(self, record):
+        if self.kind == 'ellipse':
+            return (record[0][0], record[0][1], record[1][0], record[1][1], record[2])
+        if self.kind == 'scalar':
+            return (record,)
+        return record
+
+    def decode(self, row):
+        if self.kind == 'point':
+            return (int(row[0]), int(row[1]))
+        if self.kind == 'box':
+            return (int(row[0]), int(row[1]), int(row[2]), int(row[3]))
+        if self.kind == 'ellipse':
+            return ((float(row[0]), float(row[1])), (float(row[2]), float(row[3])), float(row[4]))
+        return float(row[0])
+
+    #################################################
+    ## Ring buffer
+    #################################################
+    def append(self, record):
+        width, dtype = self.kKinds[self.kind]
+        if self.ring is None:
+            self.ring = np.empty((min(self.capacity, self.kInitialCapacity), width), dtype=dtype)
+        elif self.count == self.ring.shape[0] and self.count < self.capacity:
+            grown_ring = np.empty((min(self.capacity, 2 * self.count), width), dtype=dtype)
+            grown_ring[:self.count] = self.ring
+            self.ring = grown_ring
+
+        ## Before wrapping around, the record of frame i is at row i
+        row = self.ring[self.count % self.capacity]
+        row[:] = self.encode(record)
+        if self.count == 0:
+            self.first = row.copy()
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def retained_count(self):
+        return min(self.count, self.capacity)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.count
+        if idx == 0 and self.count > 0:
+            return self.decode(self.first)
+        if not (self.count - self.retained_count() <= idx < self.count):
+            raise IndexError("track history index {} is not retained".format(idx))
+        return self.decode(self.ring[idx % self.capacity])
+
+    def __iter__(self):
+        for idx in range(self.count - self.retained_count(), self.count):
+            yield self.decode(self.ring[idx % self.capacity])
+
+    def latest(self, n):
+        ## last min(n, retained) rows as an array, newest first: row k is history[-1-k]
+        n = min(n, self.retained_count())
+        idx = (self.count - 1 - np.arange(n)) % self.capacity
+        return self.ring[idx] if self.ring is not None else np.empty((0, self.kKinds[self.kind][0]))
+
+
+def object_history(capacity, initial=None):
+    ## Ring buffer for contours, geometries and image crops of a track
+    history = collections.deque(maxlen=max(1, capacity))
+    if initial is not None:
+        history.append(initial)
+    return history
@@ -0,0 +1,233 @@
+import csv
+import os
+import sqlite3
+import numpy as np
+from vehicle.vehicle_properties import VehicleType
+
+
+class CsvStatisticsSink(object):
+    ## Appends the interval rows to a CSV file, @batch_size rows at a time
+    kHeader = ["interval_start", "interval_end", "window_seconds", "zone", "vehicle_type", "count", "avg_speed"]
+
+    def __init__(self, path, batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending_rows_ = list()
+        if not os.path.isfile(self.path):
+            with open(self.path, "w", newline="") as f:
+                csv.writer(f).writerow(self.kHeader)
+
+    def write(self, rows):
+        self.pending_rows_ += rows
+        if len(self.pending_rows_) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.pending_rows_) == 0:
+            return
+        with open(self.path, "a", newline="") as f:
+            csv.writer(f).writerows(self.pending_rows_)
+        self.pending_rows_ = list()
+
+    def last_interval_end(self):
+        ## Latest interval_end written to the file, None when it has no rows
+        with open(self.path, newline="") as f:
+            interval_ends = [float(row["interval_end"]) for row in csv.DictReader(f)]
+        return max(interval_ends) if len(interval_ends) != 0 else None
+
+    def close(self):
+        self.flush()
+
+
+class SqliteStatisticsSink(object):
+    ## Inserts the interval rows into the traffic_intervals table, one transaction per batch
+    def __init__(self, path, batch_size=256):
+        self.batch_size = batch_size
+        self.pending_rows_ = list()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS traffic_intervals ("
+                                "interval_start REAL, interval_end REAL, window_seconds REAL, "
+                                "zone INTEGER, vehicle_type TEXT, count INTEGER, avg_speed REAL)")
+        self.connection.commit()
+
+    def write(self, rows):
+        self.pending_rows_ += rows
+        if len(self.pending_rows_) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.pending_rows_) == 0:
+            return
+        with self.connection:
+            self.connection.executemany("INSERT INTO traffic_intervals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        self.pending_rows_)
+        self.pending_rows_ = list()
+
+    def last_interval_end(self):
+        return self.connection.execute("SELECT MAX(interval_end) FROM traffic_intervals").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+class TrafficStatistics(object):
+    '''
+    Per-zone, per-vehicle-type counts and speed aggregates in fixed-size time buckets.
+    The buckets live in ring arrays (n_buckets, n_zones, n_types) covering the longest window,
+    so recording a vehicle is O(1) and a rolling window is the sum of its last buckets.
+    Each time a bucket closes, the intervals of the windows ending with it (e.g. every minute,
+    every 15 minutes, every hour) are handed as rows to the sinks:
+        (interval_start, interval_end, window_seconds, zone, vehicle_type, count, avg_speed)
+    Timestamps are stream time in seconds (frame index / fps + start time), not wall-clock time.
+    A bucket is emitted once: after a restore, the buckets already held by the sinks are skipped.
+    '''
+    def __init__(self, n_zones, bucket_seconds=60.0, windows=(1, 15, 60), sinks=None):
+        self.n_zones = max(1, n_zones)
+        self.bucket_seconds = float(bucket_seconds)
+        self.windows = sorted(windows)          # in buckets
+        self.sinks = sinks if sinks is not None else list()
+        self.vehicle_types = list(VehicleType)
+        self.n_types = len(self.vehicle_types)
+
+        self.n_buckets = self.windows[-1]
+        shape = (self.n_buckets, self.n_zones, self.n_types)
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.speed_sums = np.zeros(shape, dtype=np.float64)
+        self.speed_counts = np.zeros(shape, dtype=np.int64)
+        self.bucket_ids = np.full(self.n_buckets, -1, dtype=np.int64)
+        self.current_bucket_ = None
+        self.last_emitted_bucket_ = None
+
+    def advance_time(self, timestamp):
+        ## Moves the stream to @timestamp, intervals without any vehicle are written as 0 counts
+        self.advance(int(timestamp // self.bucket_seconds))
+
+    def record(self, timestamp, zone_index, vehicle_type, speed=None):
+        bucket = int(timestamp // self.bucket_seconds)
+        self.advance(bucket)
+        if bucket < self.current_bucket_:
+            bucket = self.current_bucket_       # late event, kept in the open bucket
+        slot = bucket % self.n_buckets
+        type_index = vehicle_type.value
+        self.counts[slot, zone_index, type_index] += 1
+        if speed is not None:
+            self.speed_sums[slot, zone_index, type_index] += speed
+            self.speed_counts[slot, zone_index, type_index] += 1
+
+    def advance(self, bucket):
+        ## Closes the buckets before @bucket and opens it
+        if self.current_bucket_ is None:
+            self.open_bucket(bucket)
+            return
+        while self.current_bucket_ < bucket:
+            self.close_bucket(self.current_bucket_)
+            self.open_bucket(self.current_bucket_ + 1)
+
+    def open_bucket(self, bucket):
+        slot = bucket % self.n_buckets
+        self.counts[slot] = 0
+        self.speed_sums[slot] = 0.0
+        self.speed_counts[slot] = 0
+        self.bucket_ids[slot] = bucket
+        self.current_bucket_ = bucket
+
+    def close_bucket(self, bucket):
+        if self.is_emitted(bucket):
+            return
+        rows = list()
+        for window in self.windows:
+            if (bucket + 1) % window == 0:
+                rows += self.interval_rows(bucket + 1 - window, bucket)
+        if len(rows) != 0:
+            for sink in self.sinks:
+                sink.write(rows)
+        self.last_emitted_bucket_ = bucket
+
+    def is_emitted(self, bucket):
+        return self.last_emitted_bucket_ is not None and bucket <= self.last_emitted_bucket_
+
+    def flush(self):
+        ## Writes the buffered rows of every sink, e.g. before a checkpoint
+        for sink in self.sinks:
+            sink.flush()
+
+    def state(self):
+        return {
+            'bucket_seconds' : self.bucket_seconds,
+            'counts' : self.counts.copy(),
+            'speed_sums' : self.speed_sums.copy(),
+            'speed_counts' : self.speed_counts.copy(),
+            'bucket_ids' : self.bucket_ids.copy(),
+            'current_bucket' : self.current_bucket_,
+            'last_emitted_bucket' : self.last_emitted_bucket_
+        }
+
+    def restore_state(self, state):
+        if state['counts'].shape != self.counts.shape or state['bucket_seconds'] != self.bucket_seconds:
+            raise ValueError("Traffic statistics of shape {} and {}s buckets cannot be restored into {} and {}s"
+                             .format(state['counts'].shape, state['bucket_seconds'],
+                                     self.counts.shape, self.bucket_seconds))
+        self.counts[:] = state['counts']
+        self.speed_sums[:] = state['speed_sums']
+        self.speed_counts[:] = state['speed_counts']
+        self.bucket_ids[:] = state['bucket_ids']
+        self.current_bucket_ = state['current_bucket']
+        ## Rows flushed after the snapshot was taken are in the sinks already
+        self.last_emitted_bucket_ = state['last_emitted_bucket']
+        for sink in self.sinks:
+            last_end = sink.last_interval_end() if hasattr(sink, "last_interval_end") else None
+            if last_end is None:
+                continue
+            last_bucket = int(round(last_end / self.bucket_seconds)) - 1
+            if not self.is_emitted(last_bucket):
+                self.last_emitted_bucket_ = last_bucket
+
+    #################################################
+    ## Rolling windows
+    #################################################
+    def window_totals(self, window, last_bucket=None):
+        '''
+        :return: counts, speed sums and speed counts of the @window buckets ending at @last_bucket,
+                 each (n_zones, n_types)
+        '''
+        if last_bucket is None:
+            last_bucket = self.current_bucket_
+        if last_bucket is None:
+            empty = np.zeros((self.n_zones, self.n_types))
+            return empty.astype(np.int64), empty, empty.astype(np.int64)
+        in_window = (self.bucket_ids > last_bucket - window) & (self.bucket_ids <= last_bucket)
+        return self.counts[in_window].sum(axis=0), \
+               self.speed_sums[in_window].sum(axis=0), \
+               self.speed_counts[in_window].sum(axis=0)
+
+    def rolling_counts(self, window):
+        ## (n_zones, n_types) counts of the last @window buckets including the open one
+        return self.window_totals(window)[0]
+
+    def interval_rows(self, first_bucket, last_bucket):
+        ## Windows are aligned on multiples of their length, [first_bucket, last_bucket] is one of them
+        window = last_bucket + 1 - first_bucket
+        counts, speed_sums, speed_counts = self.window_totals(window, last_bucket)
+        interval_start = first_bucket * self.bucket_seconds
+        interval_end = (last_bucket + 1) * self.bucket_seconds
+        avg_speeds = speed_sums / np.maximum(speed_counts, 1)
+        rows = list()
+        for zone_index in range(self.n_zones):
+            for vehicle_type in self.vehicle_types:
+                rows.append((interval_start, interval_end, interval_end - interval_start, zone_index,
+                             vehicle_type.name, int(counts[zone_index, vehicle_type.value]),
+                             float(avg_speeds[zone_index, vehicle_type.value])))
+        return rows
+
+    def close(self):
+        ## End of stream: the open bucket closes the partial intervals as well
+        if self.current_bucket_ is not None and not self.is_emitted(self.current_bucket_):
+            rows = list()
+            for window in self.windows:
+                rows += self.interval_rows(self.current_bucket_ - self.current_bucket_ % window,
+                                           self.current_bucket_)
+            for sink in self.sinks:
+                sink.write(rows)
+        for sink in self.sinks:
+            sink.close()
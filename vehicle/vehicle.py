@@ -1,17 +1,39 @@
 import cv2 as cv
 import numpy as np
 from vehicle.vehicle_properties import Status, VehicleType, TravelingStatus, Direction
+from vehicle.contour_geometry import ContourGeometry
+from vehicle.track_history import TrackHistory, object_history
 
 class Vehicle(object):
+    __slots__ = ('zone_index', 'trajectory_', 'contours_', 'geometries_', 'ellipses_', 'boxes_',
+                 'vehicle_images_', 'binary_image_', 'vehicle_index', 'status', 'status_',
+                 'classify_probability', 'vehicle_type_intcode', 'vehicle_type', 'traveling_status',
+                 'direction', 'frame_rate', 'meter_per_pixel', 'speed',
+                 'vehicle_sizes_', 'dimension_ratios_', 'density_ratios_')
+
+    ## Bounded track history: numeric records keep the first and the last kHistoryCapacity values,
+    ## contours and image crops keep the last kObjectHistoryCapacity ones
+    kHistoryCapacity = 32
+    kObjectHistoryCapacity = 2
+
+    @staticmethod
+    def configure_track_history(history_capacity, object_history_capacity):
+        Vehicle.kHistoryCapacity = history_capacity
+        Vehicle.kObjectHistoryCapacity = object_history_capacity
+
     def __init__(self, boxes, vehicle_image, binary_image,
-                 trajectory=None, contours=None, ellipse=None, init_three_feature=True):
+                 trajectory=None, contours=None, ellipse=None, init_three_feature=True, geometry=None):
         self.zone_index = -1
-        self.trajectory_ = [trajectory]
-        self.contours_ = [contours]
-        self.ellipses_ = [ellipse]
-        self.boxes_ = [boxes]
-        self.vehicle_images_ = [vehicle_image]
-        self.binary_image_ = [binary_image]
+        self.trajectory_ = self.new_history('point', trajectory)
+        self.contours_ = object_history(self.kObjectHistoryCapacity, contours)
+        # Cached measurements of each contour (area, convex hull, perimeter, ...)
+        if geometry is None and contours is not None:
+            geometry = ContourGeometry(contours)
+        self.geometries_ = object_history(self.kObjectHistoryCapacity, geometry)
+        self.ellipses_ = self.new_history('ellipse', ellipse)
+        self.boxes_ = self.new_history('box', boxes)
+        self.vehicle_images_ = object_history(self.kObjectHistoryCapacity, vehicle_image)
+        self.binary_image_ = object_history(self.kObjectHistoryCapacity, binary_image)
 
         self.vehicle_index = -1
         self.status = Status.Enter
@@ -24,15 +46,21 @@ class Vehicle(object):
         self.frame_rate = 30.0
         self.meter_per_pixel = 0.14444
         self.speed = 0.0
-        self.vehicle_sizes_ = list()
-        self.dimension_ratios_ = list()
-        self.density_ratios_ = list()
+        self.vehicle_sizes_ = self.new_history('scalar')
+        self.dimension_ratios_ = self.new_history('scalar')
+        self.density_ratios_ = self.new_history('scalar')
 
         if init_three_feature:
             self.calculate_density_ratio()
             self.calculate_dimension_ratio()
             self.calculate_vehicle_size()
 
+    def new_history(self, kind, initial=None):
+        history = TrackHistory(kind, self.kHistoryCapacity)
+        if initial is not None:
+            history.append(initial)
+        return history
+
     def calculate_vehicle_10_features(self):
 
         # Calculate 10 vehicles' features in following order:
@@ -47,8 +75,8 @@ class Vehicle(object):
         width_ellipse       = self.ellipses_[-1][1][0]
         ellipse_size        = height_ellipse * width_ellipse * np.pi/4.0
         vehicle_area        = self.vehicle_sizes_[-1]
-        cvxhull_size        = cv.contourArea(cv.convexHull(self.contours_[-1]))
-        perimeter_vehicle   = cv.arcLength(self.contours_[-1],True)
+        cvxhull_size        = self.geometries_[-1].hull_area
+        perimeter_vehicle   = self.geometries_[-1].perimeter
         dimension_ratio     = self.dimension_ratios_[-1]
         density_ratio       = self.density_ratios_[-1]
 
@@ -61,7 +89,7 @@ class Vehicle(object):
         self.vehicle_sizes_.append(ellipse[1][0]*ellipse[1][1])
 
     def calculate_dimension_ratio(self):
-        rotated_box = cv.minAreaRect(self.contours_[-1])
+        rotated_box = self.geometries_[-1].min_area_rect
         width = rotated_box[1][0]
         height = rotated_box[1][1]
         minor_edge = min(width, height)
@@ -85,10 +113,13 @@ class Vehicle(object):
         # Update new threes classifying features:
         # 	vehicle_size , vehicle_density_ratio , vehicle_dimension_ratio
         # Update moving information of vehicles: status, direction, speed
-        self.update_statuses()
+        # (the density ratio of the candidate is reused, its crops may be released already)
+        self.update_statuses(vehicle_candidate.density_ratios_[-1])
 
-        # Update vehicle type
-        self.vehicle_type = vehicle_candidate.vehicle_type
+        # Update vehicle type, an unsplit occlusion blob keeps the type of the track
+        if vehicle_candidate.vehicle_type != VehicleType.Vehicle_Block or \
+                self.vehicle_type == VehicleType.Unidentified:
+            self.vehicle_type = vehicle_candidate.vehicle_type
 
     # This function update current vehicle base on vehicle_candidate
     # Function will add the (6) new detected properties:
@@ -97,16 +128,22 @@ class Vehicle(object):
     def update_features(self, vehicle_candidate):
         self.trajectory_.append(vehicle_candidate.trajectory_[-1])
         self.contours_.append(vehicle_candidate.contours_[-1])
+        self.geometries_.append(vehicle_candidate.geometries_[-1])
         self.ellipses_.append(vehicle_candidate.ellipses_[-1])
         self.boxes_.append(vehicle_candidate.boxes_[-1])
-        self.vehicle_images_.append(vehicle_candidate.vehicle_images_[-1])
-        self.binary_image_.append(vehicle_candidate.binary_image_[-1])
+        if len(vehicle_candidate.vehicle_images_) != 0:
+            self.vehicle_images_.append(vehicle_candidate.vehicle_images_[-1])
+        if len(vehicle_candidate.binary_image_) != 0:
+            self.binary_image_.append(vehicle_candidate.binary_image_[-1])
 
-    def update_statuses(self):
+    def update_statuses(self, density_ratio=None):
         # Calculate classification features
         self.calculate_vehicle_size()
         self.calculate_dimension_ratio()
-        self.calculate_density_ratio()
+        if density_ratio is None:
+            self.calculate_density_ratio()
+        else:
+            self.density_ratios_.append(density_ratio)
 
         # Update status, direction, speed, and vehicle type
         self.update_moving_status()
@@ -148,11 +185,26 @@ class Vehicle(object):
         pixel_displacement = np.sqrt(1.0*x_displacement*x_displacement + 1.0*y_displacement*y_displacement)
         return (pixel_displacement * self.frame_rate * 3.6) / (1.0*len(self.trajectory_))
 
+    def compact_copy(self):
+        ## Shallow copy of the track without its image crops, as saved in session checkpoints
+        vehicle = Vehicle.__new__(Vehicle)
+        for name in self.__slots__:
+            if hasattr(self, name):
+                setattr(vehicle, name, getattr(self, name))
+        vehicle.vehicle_images_ = object_history(self.kObjectHistoryCapacity)
+        vehicle.binary_image_ = object_history(self.kObjectHistoryCapacity)
+        return vehicle
+
     def add_trajectory(self, trajectory):
         self.trajectory_.append(trajectory)
 
     def add_add_contour(self, contour):
         self.contours_.append(contour)
+        self.geometries_.append(ContourGeometry(contour))
+
+    @property
+    def geometry(self):
+        return self.geometries_[-1]
 
     def add_ellipse(self, ellipse):
         self.ellipses_.append(ellipse)
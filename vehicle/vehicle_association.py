@@ -0,0 +1,201 @@
+import collections
+import numpy as np
+
+
+def solve_assignment(cost):
+    '''
+    Minimum-cost one-to-one assignment of a rectangular cost matrix (Hungarian method with potentials)
+    :param cost: (nRows, nCols) finite costs
+    :return: (row_idx, col_idx) of the min(nRows, nCols) assigned pairs
+    '''
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n_rows, n_cols = cost.shape
+
+    ## 1-based as in the classical formulation, column 0 is a virtual column
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    col_owner = np.zeros(n_cols + 1, dtype=np.int64)     # row assigned to each column, 0 = free
+    way = np.zeros(n_cols + 1, dtype=np.int64)
+    for row in range(1, n_rows + 1):
+        col_owner[0] = row
+        col0 = 0
+        min_slack = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        while True:
+            used[col0] = True
+            row0 = col_owner[col0]
+            free = ~used[1:]
+            slack = cost[row0 - 1] - u[row0] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = col0
+
+            free_slack = np.where(free, min_slack[1:], np.inf)
+            col1 = int(np.argmin(free_slack)) + 1
+            delta = free_slack[col1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[col_owner[used_cols]] += delta
+            v[used_cols] -= delta
+            min_slack[1:][free] -= delta
+
+            col0 = col1
+            if col_owner[col0] == 0:
+                break
+        ## Augment along the alternating path
+        while col0 != 0:
+            col1 = way[col0]
+            col_owner[col0] = col_owner[col1]
+            col0 = col1
+
+    assigned_cols = np.flatnonzero(col_owner[1:])
+    assigned_rows = col_owner[1:][assigned_cols] - 1
+    if transposed:
+        return assigned_cols, assigned_rows
+    return assigned_rows, assigned_cols
+
+
+class VehicleAssociation(object):
+    '''
+    Global association of tracked vehicles with new candidates.
+    A (track, candidate) pair is feasible when, for some lookback t = 1..kLookbackLimit,
+    the candidate is within kMaxHorizontalDistance*t / kMaxVerticalDistance*t of the track
+    position t frames back and the size ratio is at least kMaxSizeRatio (same gates as the greedy
+    matching of VehicleTracker). Feasible pairs are found through a uniform-grid spatial hash,
+    their costs are computed with NumPy broadcasting, and the one-to-one assignment of minimum
+    total cost is solved on each connected group of tracks/candidates.
+    '''
+    kInfeasibleCost = 1e6
+
+    def __init__(self, lookback_limit, max_horizontal_distance, max_vertical_distance, max_size_ratio,
+                 use_spatial_hash=True):
+        self.kLookbackLimit = lookback_limit
+        self.kMaxHorizontalDistance = max_horizontal_distance
+        self.kMaxVerticalDistance = max_vertical_distance
+        self.kMaxSizeRatio = max_size_ratio
+        self.use_spatial_hash = use_spatial_hash
+
+    def associate(self, vehicles, vehicle_candidates, frame_gap=1):
+        '''
+        :param frame_gap: frames elapsed since the newest point of the tracks, widens the gates
+        :return: list of (vehicle_idx, candidate_idx), each vehicle and candidate at most once
+        '''
+        if len(vehicles) == 0 or len(vehicle_candidates) == 0:
+            return list()
+
+        track_points, track_sizes, track_valid = self.track_arrays(vehicles)
+        candidate_points = np.array([vc.trajectory_[-1] for vc in vehicle_candidates], dtype=np.float64)
+        candidate_sizes = np.array([vc.vehicle_sizes_[-1] for vc in vehicle_candidates], dtype=np.float64)
+
+        if self.use_spatial_hash:
+            pair_track, pair_candidate = self.hash_pairs(track_points, track_valid, candidate_points, frame_gap)
+        else:
+            pair_track, pair_candidate = np.meshgrid(np.arange(len(vehicles)),
+                                                     np.arange(len(vehicle_candidates)),
+                                                     indexing='ij')
+            pair_track, pair_candidate = pair_track.ravel(), pair_candidate.ravel()
+
+        pair_cost = self.pair_costs(track_points[pair_track], track_sizes[pair_track], track_valid[pair_track],
+                                    candidate_points[pair_candidate], candidate_sizes[pair_candidate], frame_gap)
+        feasible = np.isfinite(pair_cost)
+        return self.assign(pair_track[feasible], pair_candidate[feasible], pair_cost[feasible])
+
+    def track_arrays(self, vehicles):
+        ## lookback positions and sizes of every track: (nTracks, kLookbackLimit, ...), newest first
+        n_tracks = len(vehicles)
+        track_points = np.zeros((n_tracks, self.kLookbackLimit, 2), dtype=np.float64)
+        track_sizes = np.ones((n_tracks, self.kLookbackLimit), dtype=np.float64)
+        track_valid = np.zeros((n_tracks, self.kLookbackLimit), dtype=bool)
+        for idx, v in enumerate(vehicles):
+            n_lookback = min(self.kLookbackLimit, len(v.trajectory_), len(v.vehicle_sizes_))
+            track_points[idx, :n_lookback] = v.trajectory_.latest(n_lookback)
+            track_sizes[idx, :n_lookback] = v.vehicle_sizes_.latest(n_lookback)[:, 0]
+            track_valid[idx, :n_lookback] = True
+        return track_points, track_sizes, track_valid
+
+    def gate_extent(self, frame_gap=1):
+        ## largest gate, at the farthest lookback
+        farthest = self.kLookbackLimit + frame_gap - 1
+        return np.array([self.kMaxHorizontalDistance * farthest,
+                         self.kMaxVerticalDistance * farthest], dtype=np.float64)
+
+    def hash_pairs(self, track_points, track_valid, candidate_points, frame_gap=1):
+        ## Cells as large as the largest gate: a feasible candidate lies in the cells covering
+        ## the lookback positions of the track grown by one cell
+        cell_size = np.maximum(self.gate_extent(frame_gap), 1.0)
+        grid = collections.defaultdict(list)
+        for candidate_idx, cell in enumerate(np.floor(candidate_points / cell_size).astype(np.int64)):
+            grid[(cell[0], cell[1])].append(candidate_idx)
+
+        pair_track = list()
+        pair_candidate = list()
+        for track_idx in range(track_points.shape[0]):
+            points = track_points[track_idx][track_valid[track_idx]]
+            if points.shape[0] == 0:
+                continue
+            low_cell = np.floor(points.min(axis=0) / cell_size).astype(np.int64) - 1
+            high_cell = np.floor(points.max(axis=0) / cell_size).astype(np.int64) + 1
+            for cell_x in range(low_cell[0], high_cell[0] + 1):
+                for cell_y in range(low_cell[1], high_cell[1] + 1):
+                    for candidate_idx in grid.get((cell_x, cell_y), ()):
+                        pair_track.append(track_idx)
+                        pair_candidate.append(candidate_idx)
+        return np.array(pair_track, dtype=np.int64), np.array(pair_candidate, dtype=np.int64)
+
+    def pair_costs(self, track_points, track_sizes, track_valid, candidate_points, candidate_sizes, frame_gap=1):
+        ## (nPairs, kLookbackLimit) broadcasting of the gates, cost = best normalized distance
+        lookback = np.arange(frame_gap, self.kLookbackLimit + frame_gap, dtype=np.float64)
+        horizontal_distance = np.abs(track_points[:, :, 0] - candidate_points[:, None, 0])
+        vertical_distance = np.abs(track_points[:, :, 1] - candidate_points[:, None, 1])
+        size_ratio = np.minimum(track_sizes, candidate_sizes[:, None]) \
+                     / np.maximum(np.maximum(track_sizes, candidate_sizes[:, None]), 1e-12)
+
+        max_horizontal = self.kMaxHorizontalDistance * lookback
+        max_vertical = self.kMaxVerticalDistance * lookback
+        gated = track_valid \
+                & (horizontal_distance <= max_horizontal) \
+                & (vertical_distance <= max_vertical) \
+                & (size_ratio >= self.kMaxSizeRatio)
+
+        cost = (horizontal_distance / max_horizontal) ** 2 \
+               + (vertical_distance / max_vertical) ** 2 \
+               + (1.0 - size_ratio)
+        return np.where(gated, cost, np.inf).min(axis=1) if cost.shape[0] else np.zeros(0)
+
+    def assign(self, pair_track, pair_candidate, pair_cost):
+        if pair_cost.shape[0] == 0:
+            return list()
+
+        ## Connected groups of the feasibility graph are independent assignment problems
+        tracks, track_group = np.unique(pair_track, return_inverse=True)
+        candidates, candidate_group = np.unique(pair_candidate, return_inverse=True)
+        parent = list(range(len(tracks) + len(candidates)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for t, c in zip(track_group, candidate_group):
+            parent[find(t)] = find(len(tracks) + c)
+
+        groups = collections.defaultdict(list)
+        for pair_idx, t in enumerate(track_group):
+            groups[find(t)].append(pair_idx)
+
+        matches = list()
+        for pair_idx in groups.values():
+            pair_idx = np.array(pair_idx)
+            group_tracks, rows = np.unique(track_group[pair_idx], return_inverse=True)
+            group_candidates, cols = np.unique(candidate_group[pair_idx], return_inverse=True)
+            cost = np.full((len(group_tracks), len(group_candidates)), self.kInfeasibleCost)
+            cost[rows, cols] = pair_cost[pair_idx]
+
+            assigned_rows, assigned_cols = solve_assignment(cost)
+            for row, col in zip(assigned_rows, assigned_cols):
+                if cost[row, col] < self.kInfeasibleCost:
+                    matches.append((int(tracks[group_tracks[row]]), int(candidates[group_candidates[col]])))
+        return sorted(matches)
@@ -1,33 +1,72 @@
-from vehicle.neural_decision_tree.model import SoftDecisionTree
+from vehicle.neural_decision_tree.numpy_model import NumpySoftDecisionTree
 from vehicle.vehicle_properties import VehicleType
-import tensorflow as tf
 import numpy as np
 import cv2 as cv
+import os
 
 class VehicleClassifier(object):
-    def __init__(self, max_tree_depth, n_features, n_classes, max_leafs = None):
+    def __init__(self, max_tree_depth, n_features, n_classes, max_leafs = None,
+                 inference_engine = "tensorflow", routing_beam_width = None):
         self.max_tree_depth = max_tree_depth
         self.n_features = n_features
         self.n_classes = n_classes
         self.max_leafs = max_leafs
+        self.inference_engine = inference_engine
+        # None: full soft tree, k: hard routing along the k most probable paths (numpy engine)
+        self.routing_beam_width = routing_beam_width
+        if self.routing_beam_width is not None and self.routing_beam_width < 1:
+            raise ValueError("Routing beam width must be at least 1, got {}".format(self.routing_beam_width))
+        self.checkpoint_dir = "vehicle/neural_decision_tree/log/"
+        self.packed_model_path = self.checkpoint_dir + "ndt_packed.npz"
+
+        self.sess = None
+        self.saver = None
+        self.numpy_tree = None
 
-        # Define sess
-        tf.reset_default_graph()
-        self.sess = tf.Session()
+        if self.inference_engine == "numpy":
+            # Packed NumPy arrays exported once from the checkpoint
+            self.load_numpy_tree()
+        elif self.inference_engine == "tensorflow":
+            # Define sess
+            import tensorflow as tf
+            tf.reset_default_graph()
+            self.sess = tf.Session()
 
-        # Declare the graph of default Neural Decision Tree
-        self.init_neural_decision_tree()
+            # Declare the graph of default Neural Decision Tree
+            self.init_neural_decision_tree()
 
-        # Initialize the variable tensor for Neural Decision Tree
-        self.init_tree_variables()
+            # Initialize the variable tensor for Neural Decision Tree
+            self.init_tree_variables()
 
-        # Load the trained model from checkpoints
-        self.saver = None
-        self.load_model_from_checkpoint()
+            # Load the trained model from checkpoints
+            self.load_model_from_checkpoint()
+        else:
+            raise ValueError("Unknown inference engine: {}".format(self.inference_engine))
+
+        if self.routing_beam_width is not None and self.numpy_tree is None:
+            raise ValueError("Hard routing requires the numpy inference engine")
 
         self.occlusion_thres = 120
 
+    def load_numpy_tree(self):
+        # Reuse the packed arrays unless the checkpoint has been updated since the export
+        latest_checkpoint = NumpySoftDecisionTree.latest_checkpoint_name(self.checkpoint_dir)
+        if os.path.isfile(self.packed_model_path):
+            self.numpy_tree = NumpySoftDecisionTree.load(self.packed_model_path)
+            if self.numpy_tree.source_checkpoint == latest_checkpoint:
+                print("Loading packed model {} ... Model loaded\n".format(self.packed_model_path))
+                return
+
+        print("Exporting model checkpoint {} ... ".format(latest_checkpoint),end="")
+        self.numpy_tree = NumpySoftDecisionTree.from_checkpoint(checkpoint_dir=self.checkpoint_dir,
+                                                                max_depth=self.max_tree_depth,
+                                                                n_features=self.n_features,
+                                                                n_classes=self.n_classes)
+        self.numpy_tree.save(self.packed_model_path)
+        print("Model exported to {}\n".format(self.packed_model_path))
+
     def init_neural_decision_tree(self):
+        from vehicle.neural_decision_tree.model import SoftDecisionTree
         self.neural_decision_tree = SoftDecisionTree(max_depth=self.max_tree_depth,
                                                      n_features=self.n_features,
                                                      n_classes=self.n_classes,
@@ -35,12 +74,14 @@ class VehicleClassifier(object):
         self.neural_decision_tree.build_tree()
 
     def init_tree_variables(self):
+        import tensorflow as tf
         # Initialize the variables (i.e. assign their default value)
         init = tf.global_variables_initializer()
         self.sess.run(init)
 
     def load_model_from_checkpoint(self):
-        checkpoint_dir = "vehicle/neural_decision_tree/log/"
+        import tensorflow as tf
+        checkpoint_dir = self.checkpoint_dir
         self.saver = tf.train.Saver(max_to_keep=5)
         latest_checkpoint = tf.train.latest_checkpoint(checkpoint_dir)
         if latest_checkpoint:
@@ -50,6 +91,11 @@ class VehicleClassifier(object):
         else:
             print("No checkpoint found !!")
 
+    # Run one dummy classification so that the first frame does not pay
+    # for the lazy initialization of the inference engine
+    def warm_up(self):
+        self.classifiy_by_neural_decision_tree(np.zeros((1, self.n_features), dtype=np.float32))
+
     # This is the primary function called in Camera
     # to classify a list of vehicles
     def classifiy_vehicles(self, vehicles):
@@ -63,8 +109,8 @@ class VehicleClassifier(object):
         vehicle_overlap = list()
 
         for vehicle in vehicles:
-            vehicle_area            = cv.contourArea(vehicle.contours_[-1])
-            vehicle_convexhull_area = cv.contourArea(cv.convexHull(vehicle.contours_[-1]))
+            vehicle_area            = vehicle.geometry.area
+            vehicle_convexhull_area = vehicle.geometry.hull_area
             diff = vehicle_convexhull_area - vehicle_area
 
             if diff >= self.occlusion_thres:
@@ -83,6 +129,11 @@ class VehicleClassifier(object):
         return np.array(vehicle_features)
 
     def classifiy_by_neural_decision_tree(self, vehicle_features):
+        if self.numpy_tree is not None:
+            if self.routing_beam_width is not None:
+                return self.numpy_tree.predict_routed(vehicle_features, self.routing_beam_width)
+            return self.numpy_tree.predict(vehicle_features)
+
         classification = self.sess.run(self.neural_decision_tree.final_output,
                                        feed_dict={self.neural_decision_tree.tf_X: vehicle_features})
         return classification
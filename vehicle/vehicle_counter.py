@@ -2,7 +2,7 @@ from enum import Enum
 from vehicle.vehicle_properties import VehicleType
 
 class VehicleCounter(object):
-    def __init__(self):
+    def __init__(self, statistics=None):
         self.vehicle_counts_ = {
             VehicleType.Class1 : 0,
             VehicleType.Class2 : 0,
@@ -12,16 +12,63 @@ class VehicleCounter(object):
         }
         self.total_vehicle = 0
         self.total_speed_ = 0.0
+        self.speed_count_ = 0
         self.avg_speed_ = 0.0
+        ## Optional TrafficStatistics of the counts per zone in time buckets
+        self.statistics_ = statistics
+
+    def save(self, path):
+        ## One "<vehicle type> <count>" line per type, then the average speed
+        with open(path, "w") as f:
+            for vehicle_type, count in self.vehicle_counts_.items():
+                f.write("{} {}\n".format(vehicle_type.name, count))
+            f.write("avg_speed {}\n".format(self.avg_speed_))
+
+    def state(self):
+        ## Totals and statistics buckets, as saved in session checkpoints
+        return {
+            'vehicle_counts' : dict(self.vehicle_counts_),
+            'total_speed' : self.total_speed_,
+            'speed_count' : self.speed_count_,
+            'avg_speed' : self.avg_speed_,
+            'statistics' : self.statistics_.state() if self.statistics_ is not None else None
+        }
+
+    def restore_state(self, state):
+        self.vehicle_counts_ = dict(state['vehicle_counts'])
+        self.total_speed_ = state['total_speed']
+        self.speed_count_ = state['speed_count']
+        self.avg_speed_ = state['avg_speed']
+        if self.statistics_ is not None and state['statistics'] is not None:
+            self.statistics_.restore_state(state['statistics'])
 
     def update_vehicle_count(self,vehicle_type):
         self.vehicle_counts_[vehicle_type]+=1
 
     def update_vehicle_speed(self, vehicle_speed):
+        ## Averaged over the speeds added so far: the Class1-3 counts are still 0 when the
+        ## first counted vehicle is Unidentified or a Vehicle_Block
         self.total_speed_ += vehicle_speed
-        total_vehicle_count = self.vehicle_counts_[VehicleType.Class1] \
-                              + self.vehicle_counts_[VehicleType.Class2] \
-                              + self.vehicle_counts_[VehicleType.Class3]
-        self.avg_speed_ = 1.0*self.total_speed_ /(1.0*total_vehicle_count)
+        self.speed_count_ += 1
+        self.avg_speed_ = 1.0*self.total_speed_ /(1.0*self.speed_count_)
+
+    def count_vehicle(self, vehicle_type, vehicle_speed, zone_index=0, timestamp=None):
+        ## Counts one vehicle, also in the time bucket of @timestamp (stream seconds) when kept
+        self.update_vehicle_count(vehicle_type)
+        self.update_vehicle_speed(vehicle_speed)
+        if self.statistics_ is not None and timestamp is not None:
+            self.statistics_.record(timestamp, zone_index, vehicle_type, vehicle_speed)
+
+    def advance_time(self, timestamp):
+        if self.statistics_ is not None:
+            self.statistics_.advance_time(timestamp)
+
+    def flush(self):
+        if self.statistics_ is not None:
+            self.statistics_.flush()
+
+    def close(self):
+        if self.statistics_ is not None:
+            self.statistics_.close()
 
 
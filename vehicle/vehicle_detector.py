@@ -1,55 +1,126 @@
 import cv2 as cv
 from vehicle.vehicle import Vehicle
+from vehicle.contour_geometry import ContourGeometry
 import numpy as np
 
 class VehicleDetector(object):
-    def __init__(self):
+    def __init__(self, detection_engine="contours"):
         self.kMinContourSize = 5
         self.kMinVehicleSize = 100.0
         self.kMaxVehicleSize = 50000.0
 
+        # "contours"   : findContours + per-contour area filtering
+        # "components" : one connectedComponentsWithStats pass + vectorized filtering,
+        #                contours are only extracted for the surviving blobs
+        self.detection_engine = detection_engine
+
+        # Region of interest (x,y,w,h) and optional mask of the frame size,
+        # blobs are only extracted inside them (None: whole frame)
+        self.roi_rect = None
+        self.roi_mask = None
+
+    def set_region_of_interest(self, roi_rect, roi_mask=None):
+        self.roi_rect = roi_rect
+        self.roi_mask = roi_mask
+
+    def crop_to_region_of_interest(self, foreground_img):
+        ## Returns the part of the foreground to search and its offset in the frame
+        if self.roi_rect is None:
+            return foreground_img, (0, 0)
+
+        x, y, w, h = self.roi_rect
+        roi_foreground = foreground_img[y:y+h, x:x+w]
+        if self.roi_mask is not None:
+            roi_foreground = cv.bitwise_and(roi_foreground, self.roi_mask[y:y+h, x:x+w])
+        return roi_foreground, (x, y)
+
     def detect_vehicle_candidate(self, foreground_img, background_img, rbg_image):
-        contours = self.extract_contours(foreground_img)
+        ## Contours are extracted inside the ROI and mapped back to frame coordinates
+        roi_foreground, roi_offset = self.crop_to_region_of_interest(foreground_img)
+        if self.detection_engine == "components":
+            contours = self.extract_blob_contours(roi_foreground, roi_offset)
+        else:
+            contours = self.extract_contours(roi_foreground, roi_offset)
 
         vehicles_ = list()
         for contour_ in contours:
+            ## Measurements of the contour are computed once and shared with the classifier
+            geometry = ContourGeometry(contour_)
+
             ## Skip the small pieces ~ consider as noises
-            if (self.is_valid_contour(contour_) == False):
+            if (self.is_valid_contour(contour_, geometry) == False):
                 continue
 
-            ## Construct new vehicle features
-            ellipse = cv.fitEllipse(contour_)                   # @ellipse      : ((x,y),(w,h),angle)
-            box = cv.boundingRect(contour_)                     # @box          : (x,y,w,h)
-            trajectory = tuple([int(ellipse[0][0]),int(ellipse[0][1])])
-
-            vehicle_image = rbg_image[box[1]:box[1]+box[3],     # x = box[0]    y = box[1]
-                                      box[0]:box[0]+box[2]]     # w = box[2]    h = box[3]
-            binary_image = foreground_img[box[1]:box[1]+box[3],
-                                          box[0]:box[0]+box[2]]
-
             ## Create a vehicle_candidate and add to returned list
-            vehicle_candidate_ = Vehicle(trajectory=trajectory,
-                                         contours=contour_,
-                                         ellipse=ellipse,
-                                         boxes=box,
-                                         vehicle_image=vehicle_image,
-                                         binary_image=binary_image,
-                                         init_three_feature=True)
-            vehicles_.append(vehicle_candidate_)
+            vehicles_.append(self.construct_vehicle_candidate(contour_, foreground_img, rbg_image, geometry))
 
         return vehicles_
 
-    def extract_contours(self, foreground_img):
+    def construct_vehicle_candidate(self, contour_, foreground_img, rbg_image, geometry=None):
+        ## Construct new vehicle features
+        ellipse = cv.fitEllipse(contour_)                   # @ellipse      : ((x,y),(w,h),angle)
+        box = cv.boundingRect(contour_)                     # @box          : (x,y,w,h)
+        trajectory = tuple([int(ellipse[0][0]),int(ellipse[0][1])])
+
+        vehicle_image = rbg_image[box[1]:box[1]+box[3],     # x = box[0]    y = box[1]
+                                  box[0]:box[0]+box[2]]     # w = box[2]    h = box[3]
+        binary_image = foreground_img[box[1]:box[1]+box[3],
+                                      box[0]:box[0]+box[2]]
+
+        return Vehicle(trajectory=trajectory,
+                       contours=contour_,
+                       ellipse=ellipse,
+                       boxes=box,
+                       vehicle_image=vehicle_image,
+                       binary_image=binary_image,
+                       init_three_feature=True,
+                       geometry=geometry)
+
+    def extract_contours(self, foreground_img, offset=(0, 0)):
         ## Output contains 3 parts:
         ## modified image, the contours and hierarchy
         im2, contours_, hierarchy = cv.findContours(foreground_img,
                                                      cv.RETR_EXTERNAL,
-                                                     cv.CHAIN_APPROX_SIMPLE)
+                                                     cv.CHAIN_APPROX_SIMPLE,
+                                                     offset=offset)
+        return contours_
+
+    def extract_blob_contours(self, foreground_img, offset=(0, 0)):
+        ## Area, bounding box and centroid of every blob in a single pass
+        n_labels, labels, stats, centroids = cv.connectedComponentsWithStats(foreground_img,
+                                                                              connectivity=8)
+        blob_label = np.flatnonzero(self.filter_blob_stats(stats[1:])) + 1     # label 0 is the background
+
+        contours_ = list()
+        for label in blob_label:
+            x, y, w, h = stats[label, :4]
+            ## 1-pixel zero border so that blobs touching the crop edge are traced like on the full mask
+            blob_mask = np.zeros((h + 2, w + 2), dtype=np.uint8)
+            blob_mask[1:-1, 1:-1][labels[y:y+h, x:x+w] == label] = 255
+            im2, blob_contours, hierarchy = cv.findContours(blob_mask,
+                                                            cv.RETR_EXTERNAL,
+                                                            cv.CHAIN_APPROX_SIMPLE,
+                                                            offset=(int(x) - 1 + offset[0],
+                                                                    int(y) - 1 + offset[1]))
+            contours_.append(blob_contours[0])      # an 8-connected blob has a single outer contour
+
+        ## Same order as findContours on the full mask: starting points in reverse raster order
+        contours_.sort(key=lambda contour: (int(contour[0, 0, 1]), int(contour[0, 0, 0])), reverse=True)
         return contours_
 
-    def is_valid_contour(self, contour):
+    def filter_blob_stats(self, stats):
+        ## Vectorized pre-filter, only rejects blobs that can not pass is_valid_contour:
+        ##  - the contour polygon runs through pixel centers, so its area is at most (w-1)*(h-1)
+        ##  - by Pick's theorem its area is at least about half of the blob pixels
+        width = stats[:, cv.CC_STAT_WIDTH].astype(np.float64)
+        height = stats[:, cv.CC_STAT_HEIGHT].astype(np.float64)
+        area = stats[:, cv.CC_STAT_AREA].astype(np.float64)
+        return ((width - 1.0) * (height - 1.0) >= self.kMinVehicleSize) \
+               & (area * 0.5 - 1.0 <= self.kMaxVehicleSize)
+
+    def is_valid_contour(self, contour, geometry=None):
         if(contour.shape[0] >= self.kMinContourSize):
-            contour_area_ = cv.contourArea(contour)
+            contour_area_ = geometry.area if geometry is not None else cv.contourArea(contour)
             if(self.kMinVehicleSize <= contour_area_ <= self.kMaxVehicleSize):
                 return True
             return False
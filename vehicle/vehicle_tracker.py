@@ -1,14 +1,27 @@
 from vehicle.vehicle_properties import Status
+from vehicle.vehicle_association import VehicleAssociation
 import numpy as np
 
 class VehicleTracker(object):
-    def __init__(self):
+    def __init__(self, association_engine="greedy"):
         self.kLookbackLimit = 6
         self.kMaxHorizontalDistance = 2
         self.kMaxVerticalDistance = 8.0
         self.kMaxSizeRatio = 0.6
 
-    def track_vehicles(self, vehicle_candidates, vehicles):
+        # "greedy" : first candidate passing the gates
+        # "global" : gated cost matrix + minimum-cost one-to-one assignment
+        self.association_engine = association_engine
+        self.vehicle_association = VehicleAssociation(lookback_limit=self.kLookbackLimit,
+                                                      max_horizontal_distance=self.kMaxHorizontalDistance,
+                                                      max_vertical_distance=self.kMaxVerticalDistance,
+                                                      max_size_ratio=self.kMaxSizeRatio)
+
+    def track_vehicles(self, vehicle_candidates, vehicles, frame_gap=1):
+        '''
+        :param frame_gap: frames elapsed since the previous call (> 1 when frames were skipped),
+                          the gates are widened accordingly so that tracks survive
+        '''
         # Case 1: no vehicle candidate is detected --> no vehicles
         if len(vehicle_candidates) == 0:
             vehicles.clear()
@@ -16,7 +29,7 @@ class VehicleTracker(object):
             # Case 2: vehicles is not empty
             # --> match vehicle candidates with previous vehicles
             if len(vehicles) != 0:
-                vehicle_candidates, vehicles = self.match_vehicles(vehicle_candidates, vehicles)
+                vehicle_candidates, vehicles = self.match_vehicles(vehicle_candidates, vehicles, frame_gap)
 
             # Both cases 2 and 3: add vehicle candidates that are not matched as new vehicle
             for vc in vehicle_candidates:
@@ -27,7 +40,10 @@ class VehicleTracker(object):
 
         return vehicle_candidates, vehicles
 
-    def match_vehicles(self, vehicle_candidates, vehicles):
+    def match_vehicles(self, vehicle_candidates, vehicles, frame_gap=1):
+        if self.association_engine == "global":
+            return self.match_vehicles_globally(vehicle_candidates, vehicles, frame_gap)
+
         for v in vehicles:
             vechicle_trajectory = v.trajectory_
             vehicle_sizes = v.vehicle_sizes_
@@ -41,8 +57,9 @@ class VehicleTracker(object):
                     continue
 
                 # We check back at most kLookbackLimit frames
+                # (the newest point is frame_gap frames old)
                 for cnt in range(0,min(self.kLookbackLimit,len(v.trajectory_)),1):
-                    t = cnt+1
+                    t = cnt+frame_gap
                     k = -1 - cnt
 
                     horizontal_distance = self.horizontalDistance(vechicle_trajectory[k],vc.trajectory_[-1])
@@ -62,6 +79,23 @@ class VehicleTracker(object):
                 v.status = Status.Exit
         return vehicle_candidates, vehicles
 
+    def match_vehicles_globally(self, vehicle_candidates, vehicles, frame_gap=1):
+        entering_candidates = [vc for vc in vehicle_candidates if vc.status == Status.Enter]
+        matches = self.vehicle_association.associate(vehicles, entering_candidates, frame_gap)
+
+        is_matched = [False] * len(vehicles)
+        for vehicle_idx, candidate_idx in matches:
+            vc = entering_candidates[candidate_idx]
+            vehicles[vehicle_idx].update_vehicle(vc)        # update vehicle_[i]
+            vc.status = Status.Exit                         # mark vehicle_candidate_[j] for deletion
+            is_matched[vehicle_idx] = True
+
+        # Can't find a match --> mark this vehicle for deletion later
+        for v, matched in zip(vehicles, is_matched):
+            if not matched:
+                v.status = Status.Exit
+        return vehicle_candidates, vehicles
+
     def deleteExitVehicles(self, vehicles):
         del_idx = list()
         for idx, vehicle in enumerate(vehicles):